@@ -4,6 +4,7 @@ import json
 from typing import List
 
 from llm_playground.inference import InferenceRunner
+from llm_playground.core.cache import ResponseCache
 from llm_playground.core.models import (
     QWEN25_14B_LLM_NAME,
     GPT_4_LLM_NAME,
@@ -54,7 +55,9 @@ def infer_and_eval(sft_param_key:str,
                    only_eval=False):
     if not only_eval:
         # agents
-        agents = [PatentSynthesisRouteAgent(llm_name)]
+        # 相同输入命中缓存时不再重新请求模型, 只修改后处理逻辑时可以快速重跑
+        cache = ResponseCache(db_path='.cache/llm_responses.sqlite')
+        agents = [PatentSynthesisRouteAgent(llm_name, cache=cache)]
 
         # data
         data = load_json_data('data/synthesis_route_desc/qa_reaction_desc_inout_total41.json')
@@ -70,7 +73,8 @@ def infer_and_eval(sft_param_key:str,
         ir = InferenceRunner(
             agents=agents, output_dirpath=infer_output_dirpath,
             records=records, is_appending=False)
-        ir.run_in_multithread(max_batch_size=20)
+        ir.run_in_event_loop(max_batch_size=20)
+        print(f"缓存统计: {cache.stats()}")
         time.sleep(15)
     
     # eval
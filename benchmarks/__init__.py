@@ -0,0 +1,3 @@
+"""
+推理性能基准测试
+"""
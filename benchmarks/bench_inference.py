@@ -0,0 +1,273 @@
+"""
+端到端推理基准测试
+
+启动本地 OpenAI 兼容模拟服务 (benchmarks/mock_openai_server.py), 以不同的并发数与数据量
+驱动 InferenceRunner 与两个 patent agent, 统计 records/sec、尾延迟与峰值 RSS 并保存为 JSON,
+用于发现调度器等推理流程的性能回退。每个用例在独立子进程中运行, 峰值 RSS 互不影响。
+--replicas 启动多个模拟服务副本并配置为同一模型的多个 endpoint, 配合 --max-concurrency
+(单副本并发上限) 可以验证负载均衡下吞吐随副本数的扩展情况。
+
+用法:
+    python -m benchmarks.bench_inference --agents route field --concurrency 8 32 64 \\
+        --sizes 41 410 --latency lognormal --latency-mean 1.0 --output bench_results.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+MOCK_LLM_NAME = "MOCK"
+
+# agent 名称 -> (agent 类路径, 数据文件)
+BENCH_AGENTS = {
+    "route": (
+        "PatentSynthesisRouteAgent",
+        "data/synthesis_route_desc/qa_reaction_desc_inout_total41.json",
+    ),
+    "field": (
+        "PatentReactionFieldAgent",
+        "data/synthesis_reaction_field/qa_reaction_field_inout_head10.json",
+    ),
+}
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(port: int, server_args: List[str], timeout: float = 30.0):
+    """
+    在子进程中启动模拟服务, 等待 /health 可访问后返回进程对象
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openai_server", "--port", str(port)]
+        + server_args
+    )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"模拟服务启动失败, 退出码 {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("等待模拟服务启动超时")
+
+
+def get_server_stats(port: int) -> Dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def load_bench_records(data_filepath: str, size: int):
+    """
+    读取数据文件并循环复制到 size 条, 复制出的 record 使用不同的 id
+    """
+    from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+
+    with open(data_filepath, "r", encoding="utf-8") as fp:
+        data = json.load(fp)
+    records = []
+    for i in range(size):
+        item = data[i % len(data)]
+        records.append(ReactionStepDescriptionRecord(
+            id=f"{item.get('id')}#{i // len(data)}",
+            input=item.get("input"),
+            output=item.get("output"),
+            predict_output={},
+            llm_response="",
+            model="",
+            status="",
+            name="",
+            header_name="",
+        ))
+    return records
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 下单位为 KB, macOS 下为 bytes
+    if sys.platform == "darwin":
+        return round(peak_rss / 1024 / 1024, 2)
+    return round(peak_rss / 1024, 2)
+
+
+def run_case(case: Dict) -> Dict:
+    """
+    在子进程中运行一个基准用例
+    """
+    from llm_playground.agents import synthesis_route_desc_agents
+    from llm_playground.core.baseagent import FAILURE_STATUSES
+    from llm_playground.core.concurrency import AIMDController
+    from llm_playground.core.hedging import HedgePolicy
+    from llm_playground.core.models import MODEL_CONFIGS, QWEN_STOP
+    from llm_playground.core.retry import RetryPolicy
+    from llm_playground.inference import InferenceRunner
+    from llm_playground.utils.helpers import iter_result_items_from_file
+
+    MODEL_CONFIGS[MOCK_LLM_NAME] = {
+        "endpoints": [{"url": f"http://127.0.0.1:{port}/v1"} for port in case["ports"]],
+        "name": "mock",
+        "stop": QWEN_STOP,
+    }
+    agent_class_name, data_filepath = BENCH_AGENTS[case["agent"]]
+    agent_class = getattr(synthesis_route_desc_agents, agent_class_name)
+    agent = agent_class(
+        MOCK_LLM_NAME,
+        streaming=case["streaming"],
+        retry_policy=RetryPolicy(max_attempts=5, base_delay=0.1, max_delay=2.0),
+        concurrency_controller=AIMDController() if case["adaptive"] else None,
+        hedge_policy=HedgePolicy() if case["hedge"] else None,
+        dispatch_order=case["dispatch_order"],
+    )
+    records = load_bench_records(data_filepath, case["size"])
+
+    with tempfile.TemporaryDirectory() as output_dirpath:
+        runner = InferenceRunner(
+            agents=[agent], output_dirpath=output_dirpath, records=records,
+            output_format=case["output_format"],
+        )
+        _start = time.perf_counter()
+        runner.run_in_event_loop(max_batch_size=case["concurrency"])
+        elapsed = time.perf_counter() - _start
+
+        output_filepath = os.path.join(output_dirpath, f"{agent.get_unique_label()}.json")
+        failed_records = sum(
+            1 for item in iter_result_items_from_file(output_filepath)
+            if item.get("status") in FAILURE_STATUSES
+        )
+
+    summary = agent.telemetry.summary()
+    return {
+        "agent": agent.get_unique_label(),
+        "size": case["size"],
+        "concurrency": case["concurrency"],
+        "replicas": len(case["ports"]),
+        "dispatch_order": case["dispatch_order"],
+        "streaming": case["streaming"],
+        "output_format": case["output_format"],
+        "elapsed_sec": round(elapsed, 4),
+        "records_per_sec": round(case["size"] / elapsed, 4),
+        "latency": summary["latency"],
+        "ttft": summary["ttft"],
+        "queue_wait": summary["queue_wait"],
+        "completion_tokens_per_sec": summary["completion_tokens_per_sec"],
+        "request_errors": summary["errors"],
+        "failed_records": failed_records,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "concurrency_controller": (
+            agent.concurrency_controller.summary() if case["adaptive"] else None
+        ),
+        "hedging": agent.hedge_policy.summary() if case["hedge"] else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="InferenceRunner 端到端基准测试")
+    parser.add_argument("--agents", nargs="+", choices=list(BENCH_AGENTS), default=list(BENCH_AGENTS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[41, 410])
+    parser.add_argument("--streaming", action="store_true", help="使用流式调用")
+    parser.add_argument("--output-format", choices=["json", "jsonl"], default="jsonl")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--replicas", type=int, default=1, help="模拟服务副本数")
+    parser.add_argument(
+        "--adaptive", action="store_true", help="使用 AIMD 自适应并发, --concurrency 作为上限"
+    )
+    parser.add_argument(
+        "--dispatch-order", choices=["file", "longest_first", "shortest_first"], default="file"
+    )
+    parser.add_argument("--hedge", action="store_true", help="启用对冲请求 (p95, 额外负载不超过 10%%)")
+    # 以下参数透传给模拟服务
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-mean", type=float, default=0.5)
+    parser.add_argument("--latency-std", type=float, default=0.5)
+    parser.add_argument("--tokens-per-sec", type=float, default=500.0)
+    parser.add_argument("--chunk-tokens", type=int, default=8)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-concurrency", type=int, default=None, help="单个副本的并发处理上限")
+    args = parser.parse_args()
+
+    # 本地服务不走代理
+    os.environ["NO_PROXY"] = "127.0.0.1,localhost"
+    os.environ["no_proxy"] = "127.0.0.1,localhost"
+
+    server_args = [
+        "--latency", args.latency,
+        "--latency-mean", str(args.latency_mean),
+        "--latency-std", str(args.latency_std),
+        "--tokens-per-sec", str(args.tokens_per_sec),
+        "--chunk-tokens", str(args.chunk_tokens),
+        "--error-rate", str(args.error_rate),
+        "--seed", str(args.seed),
+    ]
+    if args.max_concurrency is not None:
+        server_args += ["--max-concurrency", str(args.max_concurrency)]
+    ports = []
+    servers = []
+
+    results = []
+    try:
+        for _ in range(args.replicas):
+            port = get_free_port()
+            servers.append(start_mock_server(port, server_args))
+            ports.append(port)
+        mp_context = multiprocessing.get_context("spawn")
+        for agent_name in args.agents:
+            for size in args.sizes:
+                for concurrency in args.concurrency:
+                    case = {
+                        "ports": ports,
+                        "agent": agent_name,
+                        "size": size,
+                        "concurrency": concurrency,
+                        "streaming": args.streaming,
+                        "adaptive": args.adaptive,
+                        "hedge": args.hedge,
+                        "dispatch_order": args.dispatch_order,
+                        "output_format": args.output_format,
+                    }
+                    with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+                        result = executor.submit(run_case, case).result()
+                    print(json.dumps(result, ensure_ascii=False))
+                    results.append(result)
+        server_stats = [get_server_stats(port) for port in ports]
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "mock_server": dict(zip(server_args[0::2], server_args[1::2])),
+        "mock_server_stats": server_stats,
+        "results": results,
+    }
+    with open(args.output, mode="w", encoding="utf-8") as fp:
+        fp.write(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"基准测试结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
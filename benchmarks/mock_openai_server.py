@@ -0,0 +1,277 @@
+"""
+本地 OpenAI 兼容的 /v1/chat/completions 模拟服务, 用于在不消耗 GPU / Azure 配额的情况下压测推理流程
+
+- 延迟分布: fixed / uniform / lognormal, 模拟 prefill 耗时
+- 流式输出: 按 tokens_per_sec 的速度逐块返回, 每块 chunk_tokens 个 token
+- 错误注入: 按 error_rate 随机返回 429 / 503 等错误
+- 容量限制: max_concurrency 模拟单个副本同时处理的请求上限, 超出的请求排队
+- 响应内容: 从 infer_res_delivery/ 中的历史推理结果按 user 消息匹配, 匹配不到时轮流返回
+
+用法:
+    python -m benchmarks.mock_openai_server --port 18000 --latency lognormal --latency-mean 1.0
+"""
+
+import json
+import math
+import time
+import glob
+import random
+import asyncio
+import argparse
+import itertools
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from llm_playground.utils.helpers import (
+    md5_text,
+    estimate_token_count,
+    iter_result_items_from_file,
+)
+
+DEFAULT_CANNED_RESPONSE_GLOB = "infer_res_delivery/*/*.json"
+
+
+class MockServerConfig(object):
+    def __init__(
+        self,
+        latency: str = "fixed",
+        latency_mean: float = 0.5,
+        latency_std: float = 0.5,
+        tokens_per_sec: float = 200.0,
+        chunk_tokens: int = 4,
+        error_rate: float = 0.0,
+        error_statuses: Optional[List[int]] = None,
+        retry_after: Optional[float] = 1.0,
+        canned_response_glob: str = DEFAULT_CANNED_RESPONSE_GLOB,
+        seed: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_std = latency_std
+        self.tokens_per_sec = tokens_per_sec
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses or [429, 503]
+        self.retry_after = retry_after
+        self.canned_response_glob = canned_response_glob
+        self.seed = seed
+        self.max_concurrency = max_concurrency
+
+
+class MockOpenAIServer(object):
+    def __init__(self, config: MockServerConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.responses_by_user_md5: Dict[str, str] = {}
+        self.fallback_responses: List[str] = []
+        self.load_canned_responses()
+        self._fallback_iter = itertools.cycle(self.fallback_responses or ['{"results": []}'])
+        self.stats = {
+            "requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0, "disconnects": 0,
+        }
+        self._semaphore = None
+
+    def load_canned_responses(self):
+        """
+        历史推理结果中保存了渲染后的 user 消息与模型响应, 以 user 消息的 md5 建立索引
+        """
+        for filepath in sorted(glob.glob(self.config.canned_response_glob)):
+            for item in iter_result_items_from_file(filepath):
+                response = item.get("llm_response")
+                if not response:
+                    continue
+                user_messages = [
+                    m for m in item.get("input", []) if m.get("role") in ("user", "human")
+                ]
+                if user_messages:
+                    self.responses_by_user_md5[md5_text(user_messages[-1]["content"])] = response
+                self.fallback_responses.append(response)
+
+    def sample_latency(self) -> float:
+        config = self.config
+        if config.latency == "uniform":
+            return self.random.uniform(
+                max(0.0, config.latency_mean - config.latency_std),
+                config.latency_mean + config.latency_std,
+            )
+        if config.latency == "lognormal":
+            # 按均值与标准差换算 lognormal 参数, 模拟长尾延迟
+            mean, std = config.latency_mean, max(config.latency_std, 1e-6)
+            sigma2 = math.log(1 + (std / mean) ** 2)
+            mu = math.log(mean) - sigma2 / 2
+            return self.random.lognormvariate(mu, sigma2 ** 0.5)
+        return config.latency_mean
+
+    def pick_response(self, messages: List[Dict]) -> str:
+        user_messages = [m for m in messages if m.get("role") == "user"]
+        if user_messages:
+            content = user_messages[-1].get("content") or ""
+            response = self.responses_by_user_md5.get(md5_text(content))
+            if response is not None:
+                return response
+        return next(self._fallback_iter)
+
+    def make_error_response(self) -> Optional[web.Response]:
+        if self.config.error_rate <= 0 or self.random.random() >= self.config.error_rate:
+            return None
+        self.stats["errors"] += 1
+        status = self.random.choice(self.config.error_statuses)
+        headers = {}
+        if status == 429 and self.config.retry_after is not None:
+            headers["retry-after"] = str(self.config.retry_after)
+        body = {"error": {"message": f"injected error {status}", "type": "mock_error"}}
+        return web.json_response(body, status=status, headers=headers)
+
+    @staticmethod
+    def split_chunks(text: str, chunk_tokens: int) -> List[str]:
+        # 约 4 个字符一个 token
+        chunk_chars = max(1, chunk_tokens * 4)
+        return [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+    async def handle_chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            body = await request.json()
+            error_response = self.make_error_response()
+            if error_response is not None:
+                return error_response
+
+            messages = body.get("messages", [])
+            model = body.get("model", "mock")
+            content = self.pick_response(messages)
+            max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+            finish_reason = "stop"
+            if max_tokens and estimate_token_count(content) > max_tokens:
+                content = content[: max_tokens * 4]
+                finish_reason = "length"
+            usage = {
+                "prompt_tokens": sum(
+                    estimate_token_count(m.get("content") or "") for m in messages
+                ),
+                "completion_tokens": estimate_token_count(content),
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+            if self.config.max_concurrency is None:
+                return await self.make_completion_response(
+                    request, body, model, content, finish_reason, usage
+                )
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.config.max_concurrency)
+            async with self._semaphore:
+                return await self.make_completion_response(
+                    request, body, model, content, finish_reason, usage
+                )
+        finally:
+            self.stats["in_flight"] -= 1
+
+    async def make_completion_response(self, request, body, model, content, finish_reason, usage):
+        await asyncio.sleep(self.sample_latency())
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            return await self.stream_response(
+                request, model, content, finish_reason, usage if include_usage else None
+            )
+
+        # 非流式: 额外等待完整 decode 的耗时
+        await asyncio.sleep(usage["completion_tokens"] / self.config.tokens_per_sec)
+        return web.json_response({
+            "id": f"chatcmpl-mock-{self.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        })
+
+    async def stream_response(self, request, model, content, finish_reason, usage):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunk_id = f"chatcmpl-mock-{self.stats['requests']}"
+        chunk_delay = self.config.chunk_tokens / self.config.tokens_per_sec
+
+        async def send(choices, extra=None):
+            payload = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+            }
+            if extra:
+                payload.update(extra)
+            await response.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        try:
+            await send([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for piece in self.split_chunks(content, self.config.chunk_tokens):
+                await asyncio.sleep(chunk_delay)
+                await send([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            await send([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+            if usage is not None:
+                await send([], {"usage": usage})
+            await response.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            # 客户端提前断开 (如流式输出提前结束、对冲请求被取消), 直接结束
+            self.stats["disconnects"] += 1
+        return response
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", **self.stats})
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.handle_chat_completions)
+        # Azure 风格的路径
+        app.router.add_post(
+            "/openai/deployments/{deployment}/chat/completions", self.handle_chat_completions
+        )
+        app.router.add_get("/health", self.handle_health)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="fixed")
+    parser.add_argument("--latency-mean", type=float, default=0.5)
+    parser.add_argument("--latency-std", type=float, default=0.5)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--chunk-tokens", type=int, default=4)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-statuses", type=int, nargs="+", default=[429, 503])
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--canned-response-glob", default=DEFAULT_CANNED_RESPONSE_GLOB)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-concurrency", type=int, default=None, help="单个副本的并发处理上限")
+    args = parser.parse_args()
+
+    config = MockServerConfig(
+        latency=args.latency,
+        latency_mean=args.latency_mean,
+        latency_std=args.latency_std,
+        tokens_per_sec=args.tokens_per_sec,
+        chunk_tokens=args.chunk_tokens,
+        error_rate=args.error_rate,
+        error_statuses=args.error_statuses,
+        retry_after=args.retry_after,
+        canned_response_glob=args.canned_response_glob,
+        seed=args.seed,
+        max_concurrency=args.max_concurrency,
+    )
+    server = MockOpenAIServer(config)
+    print(f"已加载 {len(server.fallback_responses)} 条历史响应")
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,30 @@
 LLM Playground - 一个用于测试和实验大语言模型的Python包
 """
 
+import importlib
+
 __version__ = "0.1.0"
 __author__ = "Your Name"
 
-# 导入主要模块
-from .core import TaskAgent, models
-from .utils import helpers
+# 主要模块按需导入 (PEP 562), import llm_playground 不会加载 langchain 等重依赖
+_LAZY_ATTRIBUTES = {
+    "TaskAgent": (".core.baseagent", "TaskAgent"),
+    "models": (".core.models", None),
+    "helpers": (".utils.helpers", None),
+}
 
 __all__ = ["TaskAgent", "models", "helpers"]
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attr = _LAZY_ATTRIBUTES[name]
+    module = importlib.import_module(module_name, __name__)
+    value = module if attr is None else getattr(module, attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,24 +1,42 @@
 from typing import Any, Optional
 import json
+import asyncio
 from pydantic import ValidationError
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 
 from llm_playground.datamodel.synthesis_route import (
     ReactionStepDescription,
     ReactionStepDescriptionRecord,
     ReactionInfo
 )
-from llm_playground.core.baseagent import TaskAgent
+from llm_playground.core.baseagent import (
+    TaskAgent,
+    FAILURE_STATUSES,
+    STATUS_SUCCESS,
+    STATUS_PARSE_ERROR,
+    STATUS_TRUNCATED,
+    STATUS_VALIDATION_ERROR,
+)
+from llm_playground.core.guided_decoding import get_model_json_schema, get_results_json_schema
 from llm_playground.core.models import is_reasoning_llm
 from llm_playground.core.prompts import (
+    PATENT_SYNTHESIS_BASE_SYSTEM_PROMPT,
+    PATENT_SYNTHESIS_COMPACT_OUTPUT_INSTRUCTION,
+    PATENT_SYNTHESIS_PACK_INSTRUCTION,
     PATENT_SYNTHESIS_SYSTEM_PROMPT,
     PATENT_SYNTHESIS_USER_TEMPLATE,
     PATENT_SYNTHESIS_reaction_field_SYSTEM_PROMPT,
     PATENT_SYNTHESIS_reaction_field_USER_TEMPLATE
 )
+from llm_playground.utils.chunking import merge_window_results
+from llm_playground.utils.detail_rebuild import (
+    DETAIL_END_KEY,
+    DETAIL_START_KEY,
+    expand_compact_results,
+)
+from llm_playground.utils.tagged_document import get_tagged_document, get_user_content
+from llm_playground.utils.validation import validate_results
 from llm_playground.utils.helpers import (
-    get_json_text_from_response,
+    extract_json_text_from_response,
     split_llm_thinking_content_from_response,
 )
 
@@ -31,20 +49,98 @@ class PatentSynthesisRouteAgent(TaskAgent):
         llm_name: str,
         llm: Optional[Any] = None,
         max_tokens: int = 10*1024,
-        system_prompt: str = PATENT_SYNTHESIS_SYSTEM_PROMPT,
+        system_prompt: Optional[str] = None,
+        few_shot_selector=None,
+        chunker=None,
+        max_window_concurrency: int = 8,
+        compact_output: bool = False,
+        validate_output: bool = False,
+        **kwargs,
     ) -> None:
-        super().__init__(llm_name=llm_name, llm=llm, max_tokens=max_tokens)
+        """
+        few_shot_selector (如 core.fewshot.FewShotSelector) 按 record 选择 few-shot 拼接到 system_prompt 之后,
+        此时 system_prompt 默认为不含 few-shot 的 PATENT_SYNTHESIS_BASE_SYSTEM_PROMPT;
+        不传时使用包含全部 few-shot 的 PATENT_SYNTHESIS_SYSTEM_PROMPT
+
+        chunker (如 utils.chunking.TaggedTextChunker) 把过长的输入切分为多个窗口,
+        异步处理时各窗口并行抽取后合并; 经 async_process_multiple 等批量接口处理时, 每个窗口作为独立的请求调度,
+        受 max_batch_size / token_budget / 限流约束; 直接调用 async_process 时单个 record 最多
+        max_window_concurrency 个请求同时在途
+
+        compact_output 为 True 时, 模型不输出 detail, 只输出步骤原文的开头与结尾 (detail_start / detail_end),
+        收到响应后按 detail_ids 从输入原文还原 detail, 最终的 results 格式不变
+
+        validate_output 为 True 时, 每个响应解析后按输入的标签块校验引用的 id 与 detail,
+        有问题的 record 状态为 "validation_error", 可以用 resume_statuses 只重新请求这些 record
+
+        guided_decoding 为 True 时, 按 ReactionStepDescription 生成的 JSON schema 约束模型输出 (见 get_output_schema)
+        """
+        super().__init__(llm_name=llm_name, llm=llm, max_tokens=max_tokens, **kwargs)
+        if system_prompt is None:
+            if few_shot_selector is None:
+                system_prompt = PATENT_SYNTHESIS_SYSTEM_PROMPT
+            else:
+                system_prompt = PATENT_SYNTHESIS_BASE_SYSTEM_PROMPT
         self.system_prompt = system_prompt
-        self._chain = None
+        self.few_shot_selector = few_shot_selector
+        self.chunker = chunker
+        self.max_window_concurrency = max_window_concurrency
+        self.compact_output = compact_output
+        self.validate_output = validate_output
+        self._prompt = None
+        # 不同 few-shot 组合对应的 prompt 模板
+        self._prompts = {}
+
+    def get_output_schema(self):
+        # 打包请求的输出按 record id 分组, 格式不同, 不使用约束解码
+        if self.pack_size > 1:
+            return None
+        schema = get_results_json_schema(ReactionStepDescription)
+        if self.compact_output:
+            item = schema["properties"]["results"]["items"]
+            properties = {}
+            for key, value in item["properties"].items():
+                if key == "detail":
+                    properties[DETAIL_START_KEY] = {
+                        "type": "string",
+                        "description": "The first 5-8 words of this step's procedure text, copied verbatim.",
+                    }
+                    properties[DETAIL_END_KEY] = {
+                        "type": "string",
+                        "description": "The last 5-8 words of this step's procedure text, copied verbatim.",
+                    }
+                else:
+                    properties[key] = value
+            item["properties"] = properties
+            item["required"] = list(properties)
+        return schema
+
+    def make_prompt(self, system_prompt: str):
+        # langchain_core 导入较慢, 在第一次处理 record 时才导入
+        from langchain_core.prompts import ChatPromptTemplate
+
+        if self.compact_output:
+            system_prompt = system_prompt + PATENT_SYNTHESIS_COMPACT_OUTPUT_INSTRUCTION
+        return ChatPromptTemplate.from_messages([
+            ("system", system_prompt),
+            ("user", PATENT_SYNTHESIS_USER_TEMPLATE),
+        ])
 
     def init_process_chain(self):
-        if self._chain is None:
-            self._prompt = ChatPromptTemplate.from_messages([
-                ("system", self.system_prompt),
-                ("user", PATENT_SYNTHESIS_USER_TEMPLATE),
-            ])
-            self._chain = self._prompt | self.llm | StrOutputParser()
-        return self._chain
+        # 只构建 prompt 模板, 请求统一经过 invoke_llm / ainvoke_llm, 渲染 prompt 时不创建 LLM 客户端
+        if self._prompt is None:
+            self._prompt = self.make_prompt(self.system_prompt)
+        return self._prompt
+
+    def get_prompt(self, input_text: str):
+        if self.few_shot_selector is None:
+            return self._prompt
+        shots = self.few_shot_selector.select(input_text)
+        names = tuple(shot.name for shot in shots)
+        if names not in self._prompts:
+            system_prompt = self.system_prompt + "".join(shot.text for shot in shots)
+            self._prompts[names] = self.make_prompt(system_prompt)
+        return self._prompts[names]
     
     def post_process_response(self, record: ReactionStepDescriptionRecord, response: str):
         record.llm_response = response
@@ -54,80 +150,264 @@ class PatentSynthesisRouteAgent(TaskAgent):
 
         record.model = self.get_unique_label()
 
-        json_text = get_json_text_from_response(response)
+        json_text, repaired = extract_json_text_from_response(response)
         try:
             jobj = json.loads(json_text)
             # 关键：统一为 dict
             results = jobj.get('results', [])
             if not isinstance(results, list):
                 results = []
-            record.predict_output = {"results": results}
+            record.predict_output = {"results": self.expand_results(record, results)}
         except Exception:
             print("解析Json结构失败，模型response如下\n", response)
             record.predict_output = {}
+            record.status = STATUS_PARSE_ERROR
+            return record
+        # 截断修复后保留已经完整输出的 results, 单独标记状态, 需要时可以按 resume_statuses 调大 max_tokens 重新请求
+        record.status = STATUS_TRUNCATED if repaired else STATUS_SUCCESS
+        return self.validate_record(record, get_user_content(record.input))
+
+    def validate_record(self, record: ReactionStepDescriptionRecord, input_text: str):
+        if not self.validate_output or record.status != STATUS_SUCCESS:
+            return record
+        issues = validate_results(
+            record.predict_output.get("results", []), get_tagged_document(input_text)
+        )
+        record.validation_issues = issues or None
+        if issues:
+            record.status = STATUS_VALIDATION_ERROR
         return record
 
-    def process(self, record: ReactionStepDescriptionRecord):
-        chain = self.init_process_chain()
+    def expand_results(self, record: ReactionStepDescriptionRecord, results):
+        if not self.compact_output:
+            return results
+        return expand_compact_results(results, get_user_content(record.input))
+
+    def render_messages(self, record: ReactionStepDescriptionRecord):
+        self.init_process_chain()
         user_messages = [m for m in record.input if m.get("role") == "user"]
         user_content = user_messages[0]["content"] if user_messages else ""
+        return self.get_prompt(user_content).format_messages(input_text=user_content)
 
+    def process(self, record: ReactionStepDescriptionRecord):
         try:
             # 渲染完整 prompt 保存到record.input
-            msgs = self._prompt.format_messages(input_text=user_content)
+            msgs = self.render_messages(record)
             record.input = [{"role": m.type, "content": m.content} for m in msgs]
 
             # 真正调用
-            response = chain.invoke({"input_text": user_content})
+            response = self.invoke_llm(msgs, record=record)
         except Exception as exc:
-            print(exc)
-            record.llm_response = None
-            record.predict_output = {}
-            return record
-        return self.post_process_response(record, response)
+            return self.handle_process_error(record, exc)
+        record = self.post_process_response(record, response)
+        self.evict_failed_responses([record])
+        return record
 
     async def async_process(self, record: ReactionStepDescriptionRecord):
-        chain = self.init_process_chain()
-        user_messages = [m for m in record.input if m.get("role") == "user"]
-        user_content = user_messages[0]["content"] if user_messages else ""
+        windows = self.split_windows(record)
+        if len(windows) > 1:
+            return await self.async_process_windows(record, windows)
+        return await self.async_process_single(record)
 
+    async def async_process_single(self, record: ReactionStepDescriptionRecord):
         try:
             # 渲染完整 prompt 保存到record.input
-            msgs = self._prompt.format_messages(input_text=user_content)
+            msgs = self.render_messages(record)
             record.input = [{"role": m.type, "content": m.content} for m in msgs]
 
             # 真正调用
-            response = await chain.ainvoke({"input_text": user_content})
+            response = await self.ainvoke_llm(msgs, record=record)
         except Exception as exc:
-            print(exc)
-            record.llm_response = None
-            record.predict_output = {}
-            return record
+            return self.handle_process_error(record, exc)
         return self.post_process_response(record, response)
 
+    def split_windows(self, record: ReactionStepDescriptionRecord):
+        if self.chunker is None:
+            return []
+        return self.chunker.split(get_user_content(record.input))
+
+    @staticmethod
+    def make_window_records(record: ReactionStepDescriptionRecord, windows):
+        return [
+            record.model_copy(
+                update={"input": [{"role": "user", "content": window.text}], "metrics": None}
+            )
+            for window in windows
+        ]
+
+    def split_record(self, record: ReactionStepDescriptionRecord):
+        # 调度时每个窗口作为一个独立的请求, 各自占用并发窗口与限流配额
+        windows = self.split_windows(record)
+        if len(windows) <= 1:
+            return None
+        return self.make_window_records(record, windows)
+
+    def merge_split_records(self, record: ReactionStepDescriptionRecord, parts):
+        return self.merge_window_records(record, self.split_windows(record), parts)
+
+    async def async_process_part(self, record: ReactionStepDescriptionRecord):
+        # 窗口不再切分
+        return await self.async_process_single(record)
+
+    async def async_process_windows(self, record: ReactionStepDescriptionRecord, windows):
+        """
+        直接调用 async_process 时, 各窗口作为独立的 record 并行抽取 (最多 max_window_concurrency 个同时在途),
+        合并后写回原 record; 经调度器处理时窗口由 split_record 拆分, 作为独立的请求调度
+        """
+        semaphore = asyncio.Semaphore(self.max_window_concurrency)
+
+        async def process_window(window_record):
+            async with semaphore:
+                return await self.async_process_single(window_record)
+
+        window_records = await asyncio.gather(
+            *[process_window(r) for r in self.make_window_records(record, windows)]
+        )
+        return self.merge_window_records(record, windows, window_records)
+
+    def merge_window_records(self, record: ReactionStepDescriptionRecord, windows, window_records):
+        """
+        按 make_detail_key 合并去重各窗口的结果, 写回原 record
+        record.input 保留原始输入, 不保存各窗口渲染后的 prompt (每个窗口都含完整的系统提示词)
+        任一窗口失败时 record.status 取第一个失败窗口的状态, 以便整体重新请求
+        """
+        input_text = get_user_content(record.input)
+        super().merge_split_records(record, window_records)
+        record.predict_output = {
+            "results": merge_window_results(
+                windows, [(r.predict_output or {}).get("results") for r in window_records]
+            )
+        }
+        # 校验问题按合并后的结果与完整输入重新检查
+        failed = [
+            r.status for r in window_records
+            if r.status not in (STATUS_SUCCESS, STATUS_VALIDATION_ERROR)
+        ]
+        record.status = failed[0] if failed else STATUS_SUCCESS
+        self.validate_record(record, input_text)
+        # 合并后的 metrics 不保留各窗口的缓存 key, 失败时在这里删除各窗口缓存的响应
+        if record.status in FAILURE_STATUSES:
+            self.evict_cached_responses(window_records)
+        return record
+
+
+    def make_pack_input(self, records) -> str:
+        parts = [PATENT_SYNTHESIS_PACK_INSTRUCTION.format(n=len(records))]
+        for record in records:
+            user_messages = [m for m in record.input if m.get("role") == "user"]
+            user_content = user_messages[0]["content"] if user_messages else ""
+            parts.append(f'<record id="{record.id}">\n{user_content}\n</record>')
+        return "\n".join(parts)
+
+    def make_pack_record(self, records) -> ReactionStepDescriptionRecord:
+        return records[0].model_copy(
+            update={"input": [{"role": "user", "content": self.make_pack_input(records)}], "metrics": None}
+        )
+
+    def render_pack_messages(self, records):
+        return self.render_messages(self.make_pack_record(records))
+
+    def split_pack_response(self, response: str):
+        """
+        解析打包请求的响应, 返回 record id -> results; 无法解析时返回空 dict
+        """
+        if is_reasoning_llm(self.llm_name):
+            thinking_content, response = split_llm_thinking_content_from_response(response)
+        json_text, repaired = extract_json_text_from_response(response)
+        try:
+            jobj = json.loads(json_text)
+        except Exception:
+            return {}
+        if not isinstance(jobj, dict):
+            return {}
+        outputs = jobj.get("records", jobj)
+        if not isinstance(outputs, dict):
+            return {}
+        pack_results = {}
+        for record_id, value in outputs.items():
+            results = value.get("results") if isinstance(value, dict) else value
+            if isinstance(results, list):
+                pack_results[str(record_id)] = results
+        # 输出被截断时最后一个 record 的 results 可能不完整, 丢弃后回退为单独请求
+        if repaired and pack_results:
+            pack_results.pop(next(reversed(pack_results)))
+        return pack_results
+
+    async def async_process_pack(self, records):
+        """
+        多个短 record 合并为一个请求, 按 record id 拆分结果, 各 record 的 llm_response 为打包请求的原始响应;
+        请求失败、响应无法解析或缺少某个 record 时, 这些 record 回退为单独请求, 经 async_process_limited 重新申请限流配额
+        """
+        pack_record = self.make_pack_record(records)
+        try:
+            msgs = self.render_messages(pack_record)
+            response = await self.ainvoke_llm(msgs, record=pack_record)
+        except Exception as exc:
+            # 打包请求失败 (包括流式输出退化) 时, 全部 record 回退为单独请求
+            print(f"打包请求失败, {len(records)} 个 record 回退为单独请求:", exc)
+            return list(await asyncio.gather(*[self.async_process_limited(record) for record in records]))
+
+        pack_results = self.split_pack_response(response)
+        pack_input = [{"role": m.type, "content": m.content} for m in msgs]
+        new_records = list(records)
+        missing = []
+        for i, record in enumerate(records):
+            results = pack_results.get(str(record.id))
+            if results is None:
+                missing.append(i)
+                continue
+            input_text = get_user_content(record.input)
+            results = self.expand_results(record, results)
+            record.input = pack_input
+            record.llm_response = response
+            record.model = self.get_unique_label()
+            record.metrics = pack_record.metrics
+            record.predict_output = {"results": results}
+            record.status = STATUS_SUCCESS
+            self.validate_record(record, input_text)
+            # 流式解析只跟踪顶层的 results, 打包请求的元素在拆分后逐个回调
+            if self.streaming and self.on_stream_item is not None:
+                for item in results:
+                    self.on_stream_item(record, item)
+        if missing:
+            print(f"打包请求缺少 {len(missing)}/{len(records)} 个 record 的结果, 回退为单独请求")
+            fallback_records = await asyncio.gather(*[self.async_process_limited(records[i]) for i in missing])
+            for i, new_record in zip(missing, fallback_records):
+                new_records[i] = new_record
+        return new_records
+
 
 class PatentReactionFieldAgent(TaskAgent):
     """LLM agent that extracts reaction field information from chemical synthesis descriptions."""
 
+    # 输出为单个反应字段对象, 没有需要逐个回调的数组
+    STREAM_ARRAY_KEY = None
+
     def __init__(
         self,
         llm_name: str,
         llm: Optional[Any] = None,
         max_tokens: int = 15*1024,
         system_prompt: str = PATENT_SYNTHESIS_reaction_field_SYSTEM_PROMPT,
+        **kwargs,
     ) -> None:
-        super().__init__(llm_name=llm_name, llm=llm, max_tokens=max_tokens)
+        super().__init__(llm_name=llm_name, llm=llm, max_tokens=max_tokens, **kwargs)
         self.system_prompt = system_prompt
-        self._chain = None
+        self._prompt = None
+
+    def get_output_schema(self):
+        return get_model_json_schema(ReactionInfo)
 
     def init_process_chain(self):
-        if self._chain is None:
+        if self._prompt is None:
+            # langchain_core 导入较慢, 在第一次处理 record 时才导入
+            from langchain_core.prompts import ChatPromptTemplate
+
             self._prompt = ChatPromptTemplate.from_messages([
                 ("system", self.system_prompt),
                 ("user", PATENT_SYNTHESIS_reaction_field_USER_TEMPLATE),
             ])
-            self._chain = self._prompt | self.llm | StrOutputParser()
-        return self._chain
+        return self._prompt
     
     def post_process_response(self, record: ReactionStepDescriptionRecord, response: str):
         record.llm_response = response
@@ -137,49 +417,46 @@ class PatentReactionFieldAgent(TaskAgent):
 
         record.model = self.get_unique_label()
 
-        json_text = get_json_text_from_response(response)
+        json_text, repaired = extract_json_text_from_response(response)
         try:
             jobj = json.loads(json_text)
             # 直接使用整个JSON对象作为预测输出
             record.predict_output = jobj
+            record.status = STATUS_TRUNCATED if repaired else STATUS_SUCCESS
         except Exception:
             print("解析Json结构失败，模型response如下\n", response)
             record.predict_output = {}
+            record.status = STATUS_PARSE_ERROR
         return record
 
-    def process(self, record: ReactionStepDescriptionRecord):
-        chain = self.init_process_chain()
+    def render_messages(self, record: ReactionStepDescriptionRecord):
+        self.init_process_chain()
         user_messages = [m for m in record.input if m.get("role") == "user"]
         user_content = user_messages[0]["content"] if user_messages else ""
+        return self._prompt.format_messages(input_text=user_content)
 
+    def process(self, record: ReactionStepDescriptionRecord):
         try:
             # 渲染完整 prompt 保存到record.input
-            msgs = self._prompt.format_messages(input_text=user_content)
+            msgs = self.render_messages(record)
             record.input = [{"role": m.type, "content": m.content} for m in msgs]
 
             # 真正调用
-            response = chain.invoke({"input_text": user_content})
+            response = self.invoke_llm(msgs, record=record)
         except Exception as exc:
-            print(exc)
-            record.llm_response = None
-            record.predict_output = {}
-            return record
-        return self.post_process_response(record, response)
+            return self.handle_process_error(record, exc)
+        record = self.post_process_response(record, response)
+        self.evict_failed_responses([record])
+        return record
 
     async def async_process(self, record: ReactionStepDescriptionRecord):
-        chain = self.init_process_chain()
-        user_messages = [m for m in record.input if m.get("role") == "user"]
-        user_content = user_messages[0]["content"] if user_messages else ""
         try:
             # 渲染完整 prompt 保存到record.input
-            msgs = self._prompt.format_messages(input_text=user_content)
+            msgs = self.render_messages(record)
             record.input = [{"role": m.type, "content": m.content} for m in msgs]
 
             # 真正调用
-            response = await chain.ainvoke({"input_text": user_content})
+            response = await self.ainvoke_llm(msgs, record=record)
         except Exception as exc:
-            print(exc)
-            record.llm_response = None
-            record.predict_output = {}
-            return record
+            return self.handle_process_error(record, exc)
         return self.post_process_response(record, response)
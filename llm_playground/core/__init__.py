@@ -3,7 +3,26 @@
 包含代理、模型和提示词管理
 """
 
-from .baseagent import TaskAgent
-from .models import get_chat_openai, get_openai, is_restricted_llm
+import importlib
+
+# 按需导入 (PEP 562), 避免 import llm_playground.core 时加载 langchain_openai
+_LAZY_ATTRIBUTES = {
+    "TaskAgent": ".baseagent",
+    "get_chat_openai": ".models",
+    "get_openai": ".models",
+    "is_restricted_llm": ".models",
+}
 
 __all__ = ["TaskAgent", "get_chat_openai", "get_openai", "is_restricted_llm"]
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
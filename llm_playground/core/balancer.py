@@ -0,0 +1,149 @@
+import time
+import random
+import threading
+from typing import Dict, List, Optional
+
+from .models import get_model_endpoints
+from .retry import classify_error, RETRYABLE
+
+
+class Endpoint(object):
+    """
+    一个模型副本 (vLLM 实例) 的状态: 在途请求数、延迟 EWMA、连续失败次数与摘除截止时间
+    """
+
+    def __init__(self, url: str, weight: float = 1.0):
+        if weight <= 0:
+            raise ValueError(f"endpoint 权重必须大于 0: {url}")
+        self.url = url
+        self.weight = weight
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.latency_ewma: Optional[float] = None
+
+    def is_ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def stats(self, now: float) -> Dict:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "ejected": self.is_ejected(now),
+            "latency_ewma": None if self.latency_ewma is None else round(self.latency_ewma, 6),
+        }
+
+
+class EndpointPool(object):
+    """
+    同一模型多个副本之间的负载均衡
+
+    - 路由: 加权最少在途请求 (outstanding + 1) / weight, 相同时选延迟 EWMA 更低的副本
+    - 被动健康检查: 连续 failure_threshold 次可重试错误(连接失败、超时、5xx 等)后摘除该副本,
+      摘除时长从 ejection_seconds 开始按次数翻倍, 最长 max_ejection_seconds;
+      到期后恢复接收流量, 一次成功即清零连续失败次数
+    - 所有副本都被摘除时, 仍然选择最早恢复的副本, 避免请求直接失败
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Dict],
+        failure_threshold: int = 3,
+        ejection_seconds: float = 10.0,
+        max_ejection_seconds: float = 300.0,
+        ewma_alpha: float = 0.2,
+    ):
+        if not endpoints:
+            raise ValueError("endpoints 不能为空")
+        self.endpoints = [Endpoint(e["url"], e.get("weight", 1.0)) for e in endpoints]
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self.max_ejection_seconds = max_ejection_seconds
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def _score(self, endpoint: Endpoint):
+        return (
+            (endpoint.outstanding + 1) / endpoint.weight,
+            endpoint.latency_ewma or 0.0,
+            self._random.random(),
+        )
+
+    def acquire(self, exclude: Optional[str] = None) -> Endpoint:
+        """
+        选择一个副本并计入在途请求, 请求结束后必须调用 release
+        exclude 为尽量避开的副本地址 (如对冲请求避开主请求所在的副本), 没有其他健康副本时仍可能选中
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if not e.is_ejected(now)]
+            if exclude is not None and len(candidates) > 1:
+                candidates = [e for e in candidates if e.url != exclude]
+            if candidates:
+                endpoint = min(candidates, key=self._score)
+            else:
+                endpoint = min(self.endpoints, key=lambda e: e.ejected_until)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(
+        self,
+        endpoint: Endpoint,
+        latency: Optional[float] = None,
+        error: Optional[BaseException] = None,
+    ):
+        """
+        请求结束: 成功时传入 latency, 失败时传入 error, 两者都不传表示请求被取消
+        鉴权、参数错误等不可重试错误与副本健康无关, 不计入失败
+        """
+        now = time.monotonic()
+        with self._lock:
+            endpoint.outstanding -= 1
+            if latency is not None:
+                endpoint.consecutive_failures = 0
+                if endpoint.latency_ewma is None:
+                    endpoint.latency_ewma = latency
+                else:
+                    endpoint.latency_ewma += self.ewma_alpha * (latency - endpoint.latency_ewma)
+            elif error is not None and classify_error(error) == RETRYABLE:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.failure_threshold:
+                    endpoint.ejections += 1
+                    endpoint.consecutive_failures = 0
+                    endpoint.ejected_until = now + min(
+                        self.ejection_seconds * 2 ** (endpoint.ejections - 1),
+                        self.max_ejection_seconds,
+                    )
+                    print(f"endpoint {endpoint.url} 连续失败, 摘除至 {endpoint.ejected_until:.1f}")
+
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [e.stats(now) for e in self.endpoints]
+
+
+_ENDPOINT_POOLS: Dict[str, EndpointPool] = {}
+_ENDPOINT_POOLS_LOCK = threading.Lock()
+
+
+def get_endpoint_pool(llm_name: str) -> Optional[EndpointPool]:
+    """
+    获取模型的进程级共享 EndpointPool, 只配置了一个 endpoint 的模型返回 None
+    """
+    endpoints = get_model_endpoints(llm_name)
+    if len(endpoints) <= 1:
+        return None
+    with _ENDPOINT_POOLS_LOCK:
+        if llm_name not in _ENDPOINT_POOLS:
+            _ENDPOINT_POOLS[llm_name] = EndpointPool(endpoints)
+        return _ENDPOINT_POOLS[llm_name]
@@ -1,26 +1,540 @@
+import time
 import asyncio
+import contextvars
 from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
 from .models import (
     is_restricted_llm,
+    is_reasoning_llm,
+    check_llm_config,
     get_chat_openai,
+    get_model_token_budget,
 )
+from .balancer import get_endpoint_pool
+from .degeneration import DegeneratedOutputError, dedupe_items
+from .ratelimit import get_rate_limiter
+from .retry import LLMCallError, RetryPolicy, classify_error, RETRYABLE
+from .scheduler import get_dispatch_order, iter_as_completed
+from .telemetry import AgentTelemetry, RequestMetrics, merge_request_metrics
+from ..utils.helpers import estimate_token_count
+from ..utils.json_stream import IncrementalJsonParser
+
+# record.status 取值
+STATUS_SUCCESS = "success"
+STATUS_PARSE_ERROR = "parse_error"  # LLM 有返回, 但无法解析出 JSON
+STATUS_RETRYABLE_ERROR = "retryable_error"  # 限流/超时/5xx 等重试耗尽后仍失败
+STATUS_FATAL_ERROR = "fatal_error"  # 鉴权、参数错误等不可重试的失败
+STATUS_DEGENERATED = "degenerated"  # 流式输出陷入复读被中止, 只保留了有效前缀
+STATUS_VALIDATION_ERROR = "validation_error"  # 解析成功, 但本地校验发现引用了不存在或类型不对的 id 等问题
+# 输出被截断 (如达到 max_tokens), 只保留了已经完整输出的部分; 视为已完成, 不删除缓存,
+# 需要补全时用 resume_statuses 指定, 并调大 max_tokens (相同参数重新请求通常仍会截断)
+STATUS_TRUNCATED = "truncated"
+
+# 处于这些状态的 record 需要重新请求
+FAILURE_STATUSES = {
+    STATUS_PARSE_ERROR,
+    STATUS_RETRYABLE_ERROR,
+    STATUS_FATAL_ERROR,
+    STATUS_DEGENERATED,
+    STATUS_VALIDATION_ERROR,
+}
+
+# 当前调度任务的上下文 (进入调度窗口的时间、限流预约的 tokens), 每个调度任务各自独立
+_dispatch_context = contextvars.ContextVar("dispatch_context", default=None)
+
+# 当前流式请求的上下文 (所属 record、已回调的元素数), 重试与对冲请求共享, 避免重复回调
+_stream_context = contextvars.ContextVar("stream_context", default=None)
+
+# 流式输出中顶层 JSON 对象已完整, 提前结束生成
+FINISH_REASON_EARLY_STOP = "early_stop"
 
 
 class TaskAgent(ABC):
-    def __init__(self, llm_name: str, llm=None, max_tokens: int = 8 * 1024):
+    def __init__(
+        self,
+        llm_name: str,
+        llm=None,
+        max_tokens: int = 8 * 1024,
+        rate_limiter=None,
+        cache=None,
+        retry_policy=None,
+        streaming: bool = False,
+        concurrency_controller=None,
+        hedge_policy=None,
+        dispatch_order=None,
+        token_budget=None,
+        on_stream_item=None,
+        stream_early_stop: bool = True,
+        degeneration_detector=None,
+        pack_size: int = 1,
+        pack_max_tokens: int = 2000,
+        guided_decoding: bool = False,
+    ):
         self.llm_name = llm_name
-        if llm is not None:
-            self.llm = llm
-        else:
-            self.llm = get_chat_openai(llm_name=llm_name, max_tokens=max_tokens)
+        self.max_tokens = max_tokens
+        # 流式调用才能统计 time to first token
+        self.streaming = streaming
+        # 流式调用时, STREAM_ARRAY_KEY 数组的每个元素闭合后立即回调 on_stream_item(record, item);
+        # 同一个 record 的每个元素只回调一次, 但重试或对冲请求时, 之后的元素可能来自另一次尝试,
+        # 因此回调收到的元素不保证与最终的 predict_output 一致, 结果以 predict_output 为准;
+        # stream_early_stop 为 True 时顶层 JSON 对象闭合后立即结束生成
+        self.on_stream_item = on_stream_item
+        self.stream_early_stop = stream_early_stop
+        # 流式调用时检测复读 (如 DegenerationDetector), 发现后立即中止请求
+        self.degeneration_detector = degeneration_detector
+        # 未传入 llm 时, 客户端在第一次请求时才创建 (见 llm 属性), 这里只检查模型配置
+        # 模型配置了多个副本时, 每个副本各有一个客户端, 请求由 endpoint_pool 负载均衡
+        self._llm = llm
+        self.endpoint_pool = None
+        self.endpoint_llms = {}
+        if llm is None:
+            check_llm_config(llm_name)
+            self.endpoint_pool = get_endpoint_pool(llm_name)
+        # 未显式指定时, 使用该模型在 MODEL_RATE_LIMITS 中配置的进程级共享限流器
+        if rate_limiter is None:
+            rate_limiter = get_rate_limiter(llm_name)
+        self.rate_limiter = rate_limiter
+        # 可选的 ResponseCache, 命中时直接返回之前的响应
+        self.cache = cache
+        # 可重试错误(限流、连接中断、超时、5xx)按指数退避 + jitter 重试
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy
+        # 每次请求的耗时与 token 统计, 按 agent 聚合
+        self.telemetry = AgentTelemetry(self.get_unique_label())
+        # 可选的自适应并发控制 (如 AIMDController), 此时 max_batch_size 只作为并发上限
+        self.concurrency_controller = concurrency_controller
+        if concurrency_controller is not None and not concurrency_controller.label:
+            concurrency_controller.label = self.get_unique_label()
+        # 可选的对冲请求策略 (HedgePolicy), 仅用于异步调用, 多副本时对冲请求发往另一个副本
+        self.hedge_policy = hedge_policy
+        # 派发顺序 (scheduler.DISPATCH_ORDERS 或自定义函数) 与在途 prompt tokens 上限,
+        # token_budget 未指定时使用 MODEL_CONFIGS 中配置的副本容量
+        self.dispatch_order = dispatch_order
+        if token_budget is None:
+            token_budget = get_model_token_budget(llm_name)
+        self.token_budget = token_budget
+        # 打包模式 (pack_size > 1): 多个短 record 合并为一个请求, 共用一份 system prompt,
+        # 每个请求最多 pack_size 个 record 且输入 tokens 之和不超过 pack_max_tokens, 见 async_process_pack
+        self.pack_size = pack_size
+        self.pack_max_tokens = pack_max_tokens
+        # 约束解码: 按 get_output_schema 返回的 JSON schema 约束模型输出, 见 get_json_schema
+        self.guided_decoding = guided_decoding
+        self._json_schema = None
+
+    # 流式增量解析时逐个回调的数组字段
+    STREAM_ARRAY_KEY = "results"
 
     def get_unique_label(self):
         return self.__class__.__name__ + "_" + self.llm_name
 
+    def get_output_schema(self) -> Optional[dict]:
+        """
+        输出的 JSON schema (如由 datamodel 中的 pydantic 模型生成), 不支持约束解码时返回 None
+        """
+        return None
+
+    def get_json_schema(self) -> Optional[dict]:
+        """
+        约束解码使用的 JSON schema, 未开启 guided_decoding 时返回 None
+        推理模型先输出 <think> 部分, 不使用约束解码
+        """
+        if not self.guided_decoding or is_reasoning_llm(self.llm_name):
+            return None
+        if self._json_schema is None:
+            self._json_schema = self.get_output_schema() or {}
+        return self._json_schema or None
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = get_chat_openai(
+                llm_name=self.llm_name, max_tokens=self.max_tokens, streaming=self.streaming,
+                json_schema=self.get_json_schema(),
+            )
+        return self._llm
+
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+
+    def get_endpoint_llm(self, url: str):
+        """
+        副本对应的客户端, 第一次选中该副本时创建
+        """
+        if url not in self.endpoint_llms:
+            self.endpoint_llms[url] = get_chat_openai(
+                llm_name=self.llm_name, max_tokens=self.max_tokens, streaming=self.streaming,
+                base_url=url, json_schema=self.get_json_schema(),
+            )
+        return self.endpoint_llms[url]
+
+    # 参与缓存 key 计算的生成参数
+    GENERATION_PARAM_NAMES = (
+        "model_name",
+        "deployment_name",
+        "temperature",
+        "max_tokens",
+        "n",
+        "presence_penalty",
+        "top_p",
+        "stop",
+    )
+
+    def get_generation_params(self):
+        params = {
+            name: getattr(self.llm, name)
+            for name in self.GENERATION_PARAM_NAMES
+            if getattr(self.llm, name, None) is not None
+        }
+        json_schema = self.get_json_schema()
+        if json_schema:
+            params["json_schema"] = json_schema
+        return params
+
+    def get_cache_key(self, messages):
+        """
+        由模型、生成参数与渲染后的 prompt 消息计算缓存 key
+        """
+        return self.cache.make_key(
+            self.llm_name,
+            self.get_generation_params(),
+            [{"role": m.type, "content": m.content} for m in messages],
+        )
+
+    @staticmethod
+    def get_response_text(response) -> str:
+        """
+        等价于 StrOutputParser: 取出 AIMessage 的文本内容
+        """
+        content = getattr(response, "content", response)
+        if isinstance(content, str):
+            return content
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+
+    @staticmethod
+    def fill_usage_metrics(metrics: RequestMetrics, message):
+        """
+        从 AIMessage 的 usage_metadata / response_metadata 中读取 token 数与 finish_reason
+        """
+        usage = getattr(message, "usage_metadata", None) or {}
+        response_metadata = getattr(message, "response_metadata", None) or {}
+        token_usage = response_metadata.get("token_usage") or {}
+        metrics.prompt_tokens = usage.get("input_tokens", token_usage.get("prompt_tokens"))
+        metrics.completion_tokens = usage.get(
+            "output_tokens", token_usage.get("completion_tokens")
+        )
+        metrics.finish_reason = response_metadata.get("finish_reason") or metrics.finish_reason
+
+    def record_metrics(self, record, metrics: RequestMetrics):
+        self.telemetry.record(metrics)
+        if record is not None and hasattr(record, "metrics"):
+            record.metrics = metrics.model_dump()
+
+    def invoke_llm(self, messages, record=None) -> str:
+        """
+        同步调用 LLM, 返回响应文本, 配置了缓存时先查缓存
+        传入 record 时, 本次请求的耗时与 token 统计会记录到 record.metrics
+        """
+        started = time.monotonic()
+        metrics = RequestMetrics(started_at=started)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.get_cache_key(messages)
+            metrics.cache_key = cache_key
+            response = self.cache.get(cache_key)
+            if response is not None:
+                metrics.cached = True
+                metrics.latency = time.monotonic() - started
+                self.record_metrics(record, metrics)
+                return response
+        try:
+            message = self.retry_policy.run(lambda: self.call_llm(messages, metrics))
+        except Exception:
+            self.telemetry.record_error()
+            raise
+        metrics.latency = time.monotonic() - started
+        self.fill_usage_metrics(metrics, message)
+        self.record_metrics(record, metrics)
+        response = self.get_response_text(message)
+        if cache_key is not None:
+            self.cache.set(cache_key, response, model=self.llm_name)
+        return response
+
+    def acquire_endpoint_llm(self, metrics: RequestMetrics, exclude=None):
+        """
+        多副本时按负载均衡选择副本, 返回 (endpoint, llm), 单副本时 endpoint 为 None
+        exclude 为尽量避开的副本地址
+        """
+        if self.endpoint_pool is None:
+            return None, self.llm
+        endpoint = self.endpoint_pool.acquire(exclude=exclude)
+        metrics.endpoint = endpoint.url
+        return endpoint, self.get_endpoint_llm(endpoint.url)
+
+    def call_llm(self, messages, metrics: RequestMetrics):
+        """
+        同步发出一次 LLM 请求 (单次尝试), 多副本时记录所选副本的耗时与健康状态
+        """
+        endpoint, llm = self.acquire_endpoint_llm(metrics)
+        started, latency, error = time.monotonic(), None, None
+        try:
+            message = llm.invoke(messages)
+            latency = time.monotonic() - started
+            return message
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            if endpoint is not None:
+                self.endpoint_pool.release(endpoint, latency=latency, error=error)
+
+    async def acall_llm(self, messages, metrics: RequestMetrics):
+        """
+        异步发出一次 LLM 请求 (单次尝试), 配置了 hedge_policy 时:
+        主请求超过对冲延迟仍未返回, 且在对冲预算内, 则向另一个副本发出相同的请求,
+        先成功返回的结果胜出, 另一个请求被取消; 两个请求都失败时抛出先失败的错误
+        """
+        if self.hedge_policy is None:
+            return await self.acall_llm_once(messages, metrics)
+
+        self.hedge_policy.on_request()
+        primary = asyncio.ensure_future(self.acall_llm_once(messages, metrics))
+        attempts = {primary: metrics}
+        try:
+            delay = self.hedge_policy.get_delay()
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+                if not primary.done() and self.hedge_policy.try_acquire_hedge():
+                    hedge_metrics = metrics.model_copy()
+                    hedge = asyncio.ensure_future(
+                        self.acall_llm_once(messages, hedge_metrics, exclude=metrics.endpoint)
+                    )
+                    attempts[hedge] = hedge_metrics
+
+            error = None
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_policy.on_hedge_win()
+                            metrics.endpoint = attempts[task].endpoint
+                            metrics.ttft = attempts[task].ttft
+                            metrics.finish_reason = attempts[task].finish_reason
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    async def acall_llm_once(self, messages, metrics: RequestMetrics, exclude=None):
+        """
+        异步发出一次 LLM 请求, 多副本时记录所选副本的耗时与健康状态
+        请求被取消时 latency 与 error 均为 None, 不影响副本的健康状态
+        """
+        endpoint, llm = self.acquire_endpoint_llm(metrics, exclude=exclude)
+        started, latency, error = time.monotonic(), None, None
+        try:
+            if self.streaming:
+                message = await self.astream_llm_message(llm, messages, metrics)
+            else:
+                message = await llm.ainvoke(messages)
+            latency = time.monotonic() - started
+            return message
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            if endpoint is not None:
+                self.endpoint_pool.release(endpoint, latency=latency, error=error)
+            self.observe_concurrency(latency, error)
+            if self.hedge_policy is not None and latency is not None:
+                self.hedge_policy.observe(latency)
+
+    def observe_concurrency(self, latency, error):
+        """
+        把每次尝试的结果反馈给并发控制器, 请求被取消时两者均为 None
+        """
+        if self.concurrency_controller is None:
+            return
+        if latency is not None:
+            self.concurrency_controller.on_success(latency)
+        elif error is not None:
+            self.concurrency_controller.on_error(error)
+
+    def make_stream_parser(self) -> IncrementalJsonParser:
+        skip_until = "</think>" if is_reasoning_llm(self.llm_name) else None
+        return IncrementalJsonParser(array_key=self.STREAM_ARRAY_KEY, skip_until=skip_until)
+
+    async def astream_llm_message(self, llm, messages, metrics: RequestMetrics):
+        """
+        流式调用 LLM, 合并所有 chunk 为完整的消息, 同时记录 time to first token
+
+        生成的文本同时送入增量 JSON 解析器: 数组元素闭合后立即回调 on_stream_item,
+        顶层 JSON 对象闭合后提前关闭流, 不再等待模型生成多余的内容 (此时 token 数按文本预估);
+        配置了 degeneration_detector 时, 检测到复读立即关闭流并抛出 DegeneratedOutputError
+        """
+        message = None
+        metrics.ttft = None
+        parser = self.make_stream_parser()
+        stream_context = _stream_context.get()
+        item_count = 0
+        checked_length = 0
+        stream = llm.astream(messages)
+        try:
+            async for chunk in stream:
+                if metrics.ttft is None and chunk.content:
+                    metrics.ttft = time.monotonic() - metrics.started_at
+                message = chunk if message is None else message + chunk
+                new_items = parser.feed(self.get_response_text(chunk))
+                for item in new_items:
+                    item_count += 1
+                    if stream_context is not None and item_count > stream_context["emitted"]:
+                        stream_context["emitted"] = item_count
+                        if self.on_stream_item is not None:
+                            self.on_stream_item(stream_context["record"], item)
+                detector = self.degeneration_detector
+                if detector is not None and (
+                    new_items or len(parser.text) - checked_length >= detector.check_interval
+                ):
+                    checked_length = len(parser.text)
+                    degeneration = detector.check(parser.text, parser.items)
+                    if degeneration is not None:
+                        reason, prefix_length = degeneration
+                        raise DegeneratedOutputError(
+                            reason, parser.text[:prefix_length], dedupe_items(parser.items)
+                        )
+                if parser.done and self.stream_early_stop:
+                    metrics.finish_reason = FINISH_REASON_EARLY_STOP
+                    break
+        finally:
+            await stream.aclose()
+        if message is not None and not getattr(message, "usage_metadata", None):
+            # 提前结束时收不到流末尾的 usage, 按文本预估 token 数, 以便统计吞吐与归还限流配额
+            message.usage_metadata = self.estimate_usage(messages, parser.text)
+        return message
+
+    @staticmethod
+    def estimate_usage(messages, response_text: str) -> Dict[str, int]:
+        input_tokens = estimate_token_count(
+            "".join(TaskAgent.get_response_text(m) for m in messages)
+        )
+        output_tokens = estimate_token_count(response_text)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    async def ainvoke_llm(self, messages, record=None) -> str:
+        """
+        异步调用 LLM, 返回响应文本, 配置了缓存时先查缓存
+        传入 record 时, 本次请求的排队时间、耗时与 token 统计会记录到 record.metrics
+        """
+        started = time.monotonic()
+        metrics = RequestMetrics(started_at=started)
+        dispatch_context = _dispatch_context.get()
+        if dispatch_context is not None:
+            metrics.queue_wait = started - dispatch_context["admitted_at"]
+        if self.streaming:
+            _stream_context.set({"record": record, "emitted": 0})
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.get_cache_key(messages)
+            metrics.cache_key = cache_key
+            response = self.cache.get(cache_key)
+            if response is not None:
+                metrics.cached = True
+                metrics.latency = time.monotonic() - started
+                self.record_metrics(record, metrics)
+                if dispatch_context is not None:
+                    dispatch_context["metrics"].append(metrics)
+                return response
+
+        try:
+            message = await self.retry_policy.arun(lambda: self.acall_llm(messages, metrics))
+        except Exception:
+            self.telemetry.record_error()
+            raise
+        metrics.latency = time.monotonic() - started
+        self.fill_usage_metrics(metrics, message)
+        self.record_metrics(record, metrics)
+        if dispatch_context is not None:
+            dispatch_context["metrics"].append(metrics)
+        response = self.get_response_text(message)
+        if cache_key is not None:
+            self.cache.set(cache_key, response, model=self.llm_name)
+        return response
+
+    def evict_cached_responses(self, records):
+        """
+        从缓存中删除这些 record 所用的响应, 之后重新请求时不会再命中同样的响应
+        """
+        if self.cache is None:
+            return
+        for record in records:
+            cache_key = (getattr(record, "metrics", None) or {}).get("cache_key")
+            if cache_key:
+                self.cache.delete(cache_key)
+
+    def evict_failed_responses(self, records):
+        """
+        响应在后处理之前写入缓存, 最终状态属于 FAILURE_STATUSES (如解析失败、校验失败) 的 record
+        需要删除其响应, 否则按 resume_statuses 重新请求时总是得到同样的响应
+        """
+        self.evict_cached_responses(
+            [record for record in records if getattr(record, "status", None) in FAILURE_STATUSES]
+        )
+
+    def handle_process_error(self, record, exc: Exception):
+        """
+        调用 LLM 最终失败时, 在 record.status 中记录失败类型, 便于之后有选择地重新请求
+        """
+        print(exc)
+        cause = exc.cause if isinstance(exc, LLMCallError) else exc
+        if isinstance(cause, DegeneratedOutputError):
+            return self.handle_degenerated_output(record, cause)
+        record.llm_response = None
+        record.predict_output = {}
+        record.model = self.get_unique_label()
+        if classify_error(exc) == RETRYABLE:
+            record.status = STATUS_RETRYABLE_ERROR
+        else:
+            record.status = STATUS_FATAL_ERROR
+        return record
+
+    def expand_results(self, record, results):
+        """
+        把解析出的 STREAM_ARRAY_KEY 数组元素转换为最终的结果格式 (如紧凑输出模式还原 detail), 默认不转换
+        """
+        return results
+
+    def handle_degenerated_output(self, record, exc: DegeneratedOutputError):
+        """
+        输出退化时保留有效前缀: 响应文本去掉重复部分, STREAM_ARRAY_KEY 数组只保留去重后已闭合的元素
+        """
+        record.llm_response = exc.text
+        record.predict_output = (
+            {self.STREAM_ARRAY_KEY: self.expand_results(record, exc.items)} if self.STREAM_ARRAY_KEY else {}
+        )
+        record.model = self.get_unique_label()
+        record.status = STATUS_DEGENERATED
+        return record
+
     @abstractmethod
     def init_process_chain(self):
         """
-        初始化 LangChain 调用链
+        初始化 prompt 模板等调用前的准备; LLM 请求统一经过 invoke_llm / ainvoke_llm
         """
         pass
 
@@ -45,34 +559,263 @@ class TaskAgent(ABC):
         """
         pass
 
-    async def async_process_multiple(self, records, max_batch_size: int = 64):
+    def render_messages(self, record):
+        """
+        渲染 record 请求的完整 prompt 消息, 子类未实现时返回 None
+        """
+        return None
+
+    def render_pack_messages(self, records):
+        """
+        渲染一组 records 打包请求的完整 prompt 消息, 子类未实现时返回 None
+        """
+        return None
+
+    def is_response_cached(self, records) -> bool:
+        """
+        一个 record 或一组打包的 records 的请求是否已有缓存的响应, 用于命中缓存时跳过限流
         """
-        调用 LLM 处理 record 一个Batch并发异步Inference过程
-        """
-
-        batch_records = []
-        new_records = []
-
-        if not is_restricted_llm(self.llm_name):
-            for record in records:
-                if len(batch_records) >= max_batch_size:
-                    tasks = [self.async_process(record) for record in batch_records]
-                    delta_new_records = await asyncio.gather(*tasks)
-                    new_records.extend(delta_new_records)
-                    batch_records.clear()
-                batch_records.append(record)
-            if len(batch_records) > 0:
-                tasks = [self.async_process(record) for record in batch_records]
-                delta_new_records = await asyncio.gather(*tasks)
-                new_records.extend(delta_new_records)
-                batch_records.clear()
+        if self.cache is None:
+            return False
+        if len(records) == 1:
+            messages = self.render_messages(records[0])
         else:
-            # 如果是被限制频率调用的LLM, 严格按照一次一个请求进行调用
+            messages = self.render_pack_messages(records)
+        return messages is not None and self.cache.contains(self.get_cache_key(messages))
+
+    def estimate_prompt_tokens(self, record) -> int:
+        """
+        预估 record 请求的 prompt tokens, 优先按渲染后的完整 prompt 计算,
+        无法渲染时按系统提示词 + 输入消息计算
+        """
+        messages = self.render_messages(record)
+        if messages is not None:
+            return estimate_token_count("".join(m.content for m in messages))
+        text = getattr(self, "system_prompt", "")
+        for message in record.input:
+            text += message.get("content") or ""
+        return estimate_token_count(text)
+
+    def estimate_input_tokens(self, record) -> int:
+        """
+        预估 record 自身输入 (不含系统提示词) 的 tokens, 用于打包
+        """
+        return estimate_token_count(
+            "".join(m.get("content") or "" for m in record.input if m.get("role") == "user")
+        )
+
+    async def async_process_limited(self, record):
+        """
+        按限流器配额等待后, 再调用 async_process 处理 record
+        """
+        new_records = await self.async_process_pack_limited([record])
+        return new_records[0]
+
+    async def async_process_pack_limited(self, records, part: bool = False):
+        """
+        按限流器配额等待后, 处理一个 record 或一组打包的 records
+        配额按 prompt 预估 tokens + max_tokens 计算, 请求完成后按实际用量归还多预约的部分;
+        请求已有缓存的响应时不申请配额
+        part 为 True 时 record 是 split_record 拆分出的一部分, 调用 async_process_part 处理
+
+        async_process 会给 record 的字段重新赋值, 这里传入浅拷贝作为本 agent 的结果对象,
+        原始 records 保持不变, 多个 agent 可以共享同一份 records 而无需深拷贝
+        """
+        # metrics 收集本次派发内的所有 LLM 请求; 嵌套的 async_process_limited (如打包请求的回退) 使用各自的上下文
+        dispatch_context = {"admitted_at": time.monotonic(), "reserved_tokens": 0, "metrics": []}
+        context_token = _dispatch_context.set(dispatch_context)
+        try:
+            if self.rate_limiter is not None and not self.is_response_cached(records):
+                # 打包时系统提示词只发送一次
+                tokens = self.estimate_prompt_tokens(records[0]) + (self.max_tokens or 0)
+                tokens += sum(self.estimate_input_tokens(record) for record in records[1:])
+                dispatch_context["reserved_tokens"] = await self.rate_limiter.acquire(tokens)
+
+            records = [record.model_copy() for record in records]
+            if part:
+                new_records = [await self.async_process_part(record) for record in records]
+            elif len(records) == 1:
+                new_records = [await self.async_process(records[0])]
+            else:
+                new_records = await self.async_process_pack(records)
+        finally:
+            _dispatch_context.reset(context_token)
+        self.evict_failed_responses(new_records)
+
+        metrics_list = dispatch_context["metrics"]
+        if self.rate_limiter is not None and metrics_list:
+            used_tokens = sum(
+                (metrics.prompt_tokens or 0) + (metrics.completion_tokens or 0)
+                for metrics in metrics_list
+            )
+            # reserved_tokens 为限流器实际扣减的数量, 只归还其中未用完的部分
+            if all(metrics.cached for metrics in metrics_list) or used_tokens > 0:
+                self.rate_limiter.refund(dispatch_context["reserved_tokens"] - used_tokens)
+        return new_records
+
+    async def async_process_pack(self, records):
+        """
+        把多个 record 合并为一个请求处理, 返回与 records 一一对应的结果
+        默认不支持打包, 逐个调用 async_process
+        """
+        return [await self.async_process(record) for record in records]
+
+    def split_record(self, record) -> Optional[list]:
+        """
+        把一个 record 拆分为多个独立请求的部分 (如长输入分窗口抽取), 返回各部分的 record;
+        不需要拆分时返回 None. 调度时每个部分作为一个请求, 各自占用并发窗口、token_budget 与限流配额,
+        全部完成后由 merge_split_records 合并. 默认不拆分
+        """
+        return None
+
+    def merge_split_records(self, record, parts):
+        """
+        合并 split_record 拆分出的各部分的处理结果, 写回 record (原始 record 的浅拷贝) 并返回
+        默认: record.input 保留原始输入, llm_response 按顺序拼接, metrics 合并;
+        predict_output 中 STREAM_ARRAY_KEY 数组按顺序拼接, 其它字段取靠前的部分;
+        任一部分不是 success 时 record.status 取第一个这样的部分的状态, 以便整体重新请求
+        """
+        record.llm_response = "\n\n".join(part.llm_response or "" for part in parts)
+        record.model = self.get_unique_label()
+        record.metrics = merge_request_metrics(part.metrics for part in parts)
+        predict_output = {}
+        for part in parts:
+            for key, value in (part.predict_output or {}).items():
+                predict_output.setdefault(key, value)
+        if self.STREAM_ARRAY_KEY:
+            predict_output[self.STREAM_ARRAY_KEY] = [
+                item for part in parts for item in (part.predict_output or {}).get(self.STREAM_ARRAY_KEY) or []
+            ]
+        record.predict_output = predict_output
+        failed = [part.status for part in parts if part.status != STATUS_SUCCESS]
+        record.status = failed[0] if failed else STATUS_SUCCESS
+        return record
+
+    async def async_process_part(self, record):
+        """
+        处理 split_record 拆分出的一个部分, 默认与 async_process 相同
+        """
+        return await self.async_process(record)
+
+    def make_packs(self, records, order, singles=()) -> List[List[int]]:
+        """
+        按派发顺序把相邻的短 record 分组, 返回每组的原始下标; 同一组内的 record id 不重复
+        singles 中的下标各自单独成组
+        """
+        packs = []
+        current, current_tokens, current_ids = [], 0, set()
+        for idx in order:
+            if idx in singles:
+                packs.append([idx])
+                continue
+            record = records[idx]
+            tokens = self.estimate_input_tokens(record)
+            record_id = getattr(record, "id", idx)
+            if current and (
+                len(current) >= self.pack_size
+                or current_tokens + tokens > self.pack_max_tokens
+                or record_id in current_ids
+            ):
+                packs.append(current)
+                current, current_tokens, current_ids = [], 0, set()
+            current.append(idx)
+            current_tokens += tokens
+            current_ids.add(record_id)
+        if current:
+            packs.append(current)
+        return packs
+
+    def get_max_concurrency(self, max_concurrency: int) -> int:
+        """
+        受限模型若没有配置限流器, 只能严格按照一次一个请求进行调用
+        """
+        if is_restricted_llm(self.llm_name) and self.rate_limiter is None:
             print(
-                f"{self.llm_name} is a restricted llm, so we can only run request one by one..."
+                f"{self.llm_name} is a restricted llm without rate limits, so we can only run request one by one..."
             )
-            for record in records:
-                new_record = await self.async_process(record)
-                new_records.append(new_record)
+            return 1
+        return max_concurrency
+
+    async def async_process_as_completed(self, records, max_concurrency: int = 64):
+        """
+        调用 LLM 处理 records 的滑动窗口并发异步Inference过程,
+        始终保持 max_concurrency 个请求在途, 按完成顺序 yield (原始下标, new_record)
+
+        split_record 拆分出的各部分作为独立的请求调度, 全部完成后合并为一个结果;
+        配置了 dispatch_order / token_budget 时, 按预估的 prompt tokens 决定派发顺序,
+        并把在途请求的 prompt tokens 之和控制在 token_budget 以内, 下标仍为原始下标;
+        打包模式下按派发顺序分组, 一组 records 作为一个请求调度
+        """
+        max_concurrency = self.get_max_concurrency(max_concurrency)
+        if self.concurrency_controller is not None:
+            self.concurrency_controller.bound(max_concurrency)
+
+        # 展开为请求单元: owners[i] 为单元 i 所属的 record 下标, 拆分出的单元记录其在各部分中的位置
+        records = list(records)
+        units, owners, part_positions, part_counts = [], [], {}, {}
+        for idx, record in enumerate(records):
+            parts = self.split_record(record)
+            if not parts:
+                units.append(record)
+                owners.append(idx)
+                continue
+            part_counts[idx] = len(parts)
+            for position, part in enumerate(parts):
+                part_positions[len(units)] = position
+                units.append(part)
+                owners.append(idx)
+
+        order = costs = None
+        if self.dispatch_order is not None or self.token_budget is not None:
+            costs = [self.estimate_prompt_tokens(unit) for unit in units]
+            order = get_dispatch_order(costs, self.dispatch_order)
+        if order is None:
+            order = range(len(units))
+
+        if self.pack_size > 1:
+            packs = self.make_packs(units, order, singles=part_positions)
+        else:
+            packs = [[idx] for idx in order]
+        pack_costs = None
+        if costs is not None:
+            pack_costs = [sum(costs[idx] for idx in pack) for pack in packs]
+
+        def process_pack(pack):
+            return self.async_process_pack_limited(
+                [units[idx] for idx in pack], part=pack[0] in part_positions
+            )
+
+        finished_parts = {}
+        async for pack_idx, new_units in iter_as_completed(
+            process_pack,
+            packs,
+            max_concurrency=max_concurrency,
+            concurrency_controller=self.concurrency_controller,
+            costs=pack_costs,
+            cost_budget=self.token_budget,
+        ):
+            for unit_idx, new_unit in zip(packs[pack_idx], new_units):
+                owner = owners[unit_idx]
+                if unit_idx not in part_positions:
+                    yield owner, new_unit
+                    continue
+                parts = finished_parts.setdefault(owner, [None] * part_counts[owner])
+                parts[part_positions[unit_idx]] = new_unit
+                if all(part is not None for part in parts):
+                    del finished_parts[owner]
+                    yield owner, self.merge_split_records(records[owner].model_copy(), parts)
+
+    async def async_process_multiple(self, records, max_batch_size: int = 64):
+        """
+        调用 LLM 处理 records 的并发异步Inference过程, 结果按原始顺序返回
+        max_batch_size 为同时在途的最大请求数
+        """
+        records = list(records)
+        new_records = [None] * len(records)
+
+        async for idx, new_record in self.async_process_as_completed(
+            records, max_concurrency=max_batch_size
+        ):
+            new_records[idx] = new_record
 
         return new_records
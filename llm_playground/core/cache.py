@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from ..utils.helpers import md5_text
+
+
+class ResponseCache(object):
+    """
+    基于 SQLite 的 LLM 响应持久化缓存 (内容寻址)
+
+    key = md5(模型名 + 生成参数 + 渲染后的完整 prompt 消息), 同样的输入发给同样的模型时
+    直接返回上次的响应, 不再重新请求 LLM
+
+    Args:
+        db_path: SQLite 文件路径
+        max_entries: 最多缓存条数, 超出后按最近访问时间淘汰
+        max_bytes: 响应文本总字节数上限, 超出后按最近访问时间淘汰
+        max_age_seconds: 缓存有效期, 过期条目视为未命中并在淘汰时删除
+        bypass: 为 True 时不读取缓存(强制重新请求), 但仍写入最新响应
+    """
+
+    def __init__(
+        self,
+        db_path: str = ".cache/llm_responses.sqlite",
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+        bypass: bool = False,
+    ):
+        dirpath = os.path.dirname(db_path)
+        if dirpath and not os.path.exists(dirpath):
+            os.makedirs(dirpath, exist_ok=True)
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, params: Dict[str, Any], messages: List[Dict[str, str]]) -> str:
+        """
+        由模型名、生成参数与渲染后的消息列表计算缓存 key
+        """
+        payload = json.dumps(
+            {"model": model, "params": params, "messages": messages},
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str,
+        )
+        return md5_text(payload)
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.max_age_seconds is not None and now - created_at > self.max_age_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        if self.bypass:
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._is_expired(row[1], now):
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def contains(self, key: str) -> bool:
+        """
+        是否有未过期的缓存条目, 不计入命中统计, 也不更新访问时间
+        """
+        if self.bypass:
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None and not self._is_expired(row[0], time.time())
+
+    def set(self, key: str, response: str, model: str = ""):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (key, model, response, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+        self.evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def evict(self):
+        """
+        删除过期条目, 并在超过条数或字节数上限时按最近访问时间淘汰
+        """
+        with self._lock:
+            if self.max_age_seconds is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?",
+                    (time.time() - self.max_age_seconds,),
+                )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY accessed_at DESC"
+                    " LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            if self.max_bytes is not None:
+                total = self._conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+                    ).fetchall()
+                    evicted_keys = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        evicted_keys.append((key,))
+                        total -= size
+                    self._conn.executemany(
+                        "DELETE FROM responses WHERE key = ?", evicted_keys
+                    )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 6) if lookups else 0.0,
+            "entries": entries,
+            "bytes": total_bytes,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
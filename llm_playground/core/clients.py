@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import weakref
+from typing import Any, Callable, Dict, Hashable
+
+import httpx
+
+# 每个 endpoint 共享的连接池参数
+HTTP_POOL_LIMITS = {
+    "max_connections": 256,
+    "max_keepalive_connections": 64,
+    "keepalive_expiry": 60.0,
+}
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+
+def is_http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _get_http_client_kwargs(base_url: str) -> Dict[str, Any]:
+    # httpx 只支持基于 TLS 的 HTTP/2, vLLM 等明文 http 服务仍使用 HTTP/1.1 keep-alive
+    return {
+        "limits": httpx.Limits(**HTTP_POOL_LIMITS),
+        "timeout": HTTP_TIMEOUT,
+        "http2": base_url.startswith("https://") and is_http2_available(),
+    }
+
+
+class LoopLocalAsyncClient(httpx.AsyncClient):
+    """
+    httpx.AsyncClient 的连接与创建它的事件循环绑定, 不能跨事件循环复用
+    这里按事件循环各自维护一个内部客户端: 同一事件循环中的所有请求共享同一个连接池,
+    run_in_sequence / run_in_multithread 等多个事件循环的场景也不会复用到失效的连接
+    """
+
+    def __init__(self, **client_kwargs):
+        super().__init__(**client_kwargs)
+        self._client_kwargs = client_kwargs
+        self._loop_clients = weakref.WeakKeyDictionary()
+
+    def _get_loop_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._loop_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(**self._client_kwargs)
+            self._loop_clients[loop] = client
+        return client
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        return await self._get_loop_client().send(request, **kwargs)
+
+    async def aclose(self):
+        client = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+# 进程级客户端注册表: endpoint -> (httpx.Client, LoopLocalAsyncClient), 参数 -> LLM 客户端
+_HTTP_CLIENTS: Dict[str, tuple] = {}
+_LLM_CLIENTS: Dict[Hashable, Any] = {}
+_REGISTRY_LOCK = threading.RLock()
+
+
+def get_shared_http_clients(base_url: str):
+    """
+    获取 endpoint 共享的同步与异步 httpx 客户端
+    """
+    with _REGISTRY_LOCK:
+        if base_url not in _HTTP_CLIENTS:
+            client_kwargs = _get_http_client_kwargs(base_url)
+            _HTTP_CLIENTS[base_url] = (
+                httpx.Client(**client_kwargs),
+                LoopLocalAsyncClient(**client_kwargs),
+            )
+        return _HTTP_CLIENTS[base_url]
+
+
+def get_or_create_llm_client(key: Hashable, factory: Callable[[], Any]):
+    """
+    按 key (endpoint + 生成参数) 缓存已构造的 LLM 客户端, 相同配置的 agent 共享同一个客户端
+    """
+    with _REGISTRY_LOCK:
+        if key not in _LLM_CLIENTS:
+            _LLM_CLIENTS[key] = factory()
+        return _LLM_CLIENTS[key]
+
+
+def reset_client_registry():
+    """
+    清空注册表 (例如修改了 MODEL_CONFIGS 或环境变量之后)
+    """
+    with _REGISTRY_LOCK:
+        for sync_client, _ in _HTTP_CLIENTS.values():
+            sync_client.close()
+        _HTTP_CLIENTS.clear()
+        _LLM_CLIENTS.clear()
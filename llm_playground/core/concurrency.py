@@ -0,0 +1,147 @@
+import time
+import asyncio
+import threading
+from typing import Dict, Optional
+
+from .retry import get_status_code
+
+# 表示服务端已经过载的状态码: 限流、服务不可用、网关超时
+OVERLOAD_STATUS_CODES = {429, 503, 504}
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """
+    429 / 503 / 504 与各类超时说明服务端已经饱和, 需要降低并发
+    """
+    status_code = get_status_code(exc)
+    if status_code is not None:
+        return status_code in OVERLOAD_STATUS_CODES
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    return any("Timeout" in cls.__name__ for cls in type(exc).__mro__)
+
+
+class AIMDController(object):
+    """
+    AIMD (加性增、乘性减) 自适应并发控制, 代替手工调 max_batch_size
+
+    - 每个成功请求把并发上限增加 increase / limit, 即每完成一轮窗口约 +increase
+    - 遇到 429 / 超时, 或短期延迟 EWMA 超过长期基线的 latency_tolerance 倍时, 上限乘以 decrease_factor
+    - 降低后的一个延迟周期内不再重复降低, 避免同一波拥塞被多次计入;
+      短期 EWMA 随之重置, 积累 warmup_samples 个样本后才重新判断延迟突增
+    - 延迟基线取预热后观察到的最低 EWMA (近似无排队时的延迟), 并按 baseline_drift 缓慢上调,
+      以适应请求长度分布的变化; EWMA 平滑了不同长度请求之间的波动, 不会被误判为拥塞
+
+    调度器每次补位时读取 limit, limit 降低后在途请求自然完成, 不会被取消
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        ewma_alpha: float = 0.1,
+        baseline_drift: float = 0.0002,
+        warmup_samples: int = 10,
+        label: str = "",
+    ):
+        if not 0 < decrease_factor < 1:
+            raise ValueError(f"decrease_factor 必须在 0~1 之间: {decrease_factor}")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.ewma_alpha = ewma_alpha
+        self.baseline_drift = baseline_drift
+        self.warmup_samples = warmup_samples
+        self.label = label
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._lock = threading.Lock()
+        self.latency_ewma: Optional[float] = None
+        self.latency_baseline: Optional[float] = None
+        self._samples = 0
+        self._cooldown_until = 0.0
+        self.peak_limit = int(self._limit)
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def bound(self, max_concurrency: int) -> int:
+        """
+        并发上限不超过调用方给定的 max_concurrency, 返回当前的 limit
+        """
+        with self._lock:
+            self.max_limit = min(self.max_limit, max_concurrency)
+            self._limit = min(self._limit, self.max_limit)
+            return self.limit
+
+    def log(self, message: str):
+        print(f"[AIMD] {self.label} {message}")
+
+    def on_success(self, latency: float):
+        now = time.monotonic()
+        with self._lock:
+            self._samples += 1
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += self.ewma_alpha * (latency - self.latency_ewma)
+            if self._samples >= self.warmup_samples:
+                if self.latency_baseline is None or self.latency_ewma < self.latency_baseline:
+                    self.latency_baseline = self.latency_ewma
+                else:
+                    self.latency_baseline *= 1 + self.baseline_drift
+
+            if (
+                self.latency_baseline is not None
+                and self.latency_ewma > self.latency_tolerance * self.latency_baseline
+            ):
+                self._decrease(
+                    now,
+                    f"latency spike ({self.latency_ewma:.2f}s > "
+                    f"{self.latency_tolerance} x {self.latency_baseline:.2f}s)",
+                )
+                return
+
+            old_limit = self.limit
+            self._limit = min(self._limit + self.increase / self._limit, self.max_limit)
+            if self.limit > self.peak_limit:
+                self.peak_limit = self.limit
+                # 只在达到新的 2 的幂次或上限时输出, 避免刷屏
+                if self.limit & (self.limit - 1) == 0 or self.limit == self.max_limit:
+                    self.log(f"concurrency {old_limit} -> {self.limit}")
+
+    def on_error(self, exc: BaseException):
+        if not is_overload_error(exc):
+            return
+        with self._lock:
+            self._decrease(time.monotonic(), type(exc).__name__)
+
+    def _decrease(self, now: float, reason: str):
+        if now < self._cooldown_until:
+            return
+        old_limit = self.limit
+        self._limit = max(self._limit * self.decrease_factor, self.min_limit)
+        self.decreases += 1
+        # 冷却一个延迟周期, 并以新并发下的延迟重新估计 EWMA
+        self._cooldown_until = now + (self.latency_ewma or 0.0)
+        self.latency_ewma = None
+        self._samples = 0
+        self.log(f"{reason}, concurrency {old_limit} -> {self.limit}")
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "peak_limit": self.peak_limit,
+                "decreases": self.decreases,
+                "latency_baseline": (
+                    None if self.latency_baseline is None else round(self.latency_baseline, 6)
+                ),
+            }
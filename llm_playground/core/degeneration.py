@@ -0,0 +1,105 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+# 退化类型
+DEGENERATION_LOOP = "repetition_loop"  # 输出末尾是同一片段的连续重复
+DEGENERATION_REPEATED_ITEM = "repeated_item"  # results 中同一个元素反复出现
+
+
+class DegeneratedOutputError(Exception):
+    """
+    流式生成中检测到退化 (复读) 时抛出, 保留退化之前的有效前缀:
+    text 为去掉重复部分后的响应文本, items 为去重后已闭合的数组元素
+    """
+
+    def __init__(self, reason: str, text: str, items: List[Any]):
+        super().__init__(f"LLM 输出退化 ({reason}), 已生成 {len(text)} 个字符, 保留 {len(items)} 个元素")
+        self.reason = reason
+        self.text = text
+        self.items = items
+
+
+def get_item_key(item: Any) -> str:
+    return json.dumps(item, sort_keys=True, ensure_ascii=False)
+
+
+def dedupe_items(items: List[Any]) -> List[Any]:
+    """
+    按首次出现的顺序去掉重复的元素
+    """
+    seen = set()
+    unique_items = []
+    for item in items:
+        key = get_item_key(item)
+        if key not in seen:
+            seen.add(key)
+            unique_items.append(item)
+    return unique_items
+
+
+class DegenerationDetector(object):
+    """
+    检测流式输出中的复读, 模型陷入循环时直到 max_tokens 才会停止, 既浪费 GPU 又拖慢同一服务上的其他请求
+
+    - 末尾长度为 1~max_period 的片段连续重复 min_repeats 次以上, 且重复部分不少于 min_span 个字符
+    - 同一个数组元素 (如 results 中的某个反应步骤) 出现 max_item_repeats 次以上
+
+    检测本身不保存状态, 可以在多个并发请求间共享; 调用方每生成 check_interval 个字符检查一次
+    """
+
+    def __init__(
+        self,
+        max_period: int = 200,
+        min_repeats: int = 4,
+        min_span: int = 200,
+        max_item_repeats: int = 3,
+        check_interval: int = 64,
+    ):
+        if min_repeats < 2:
+            raise ValueError(f"min_repeats 必须大于 1: {min_repeats}")
+        self.max_period = max_period
+        self.min_repeats = min_repeats
+        self.min_span = min_span
+        self.max_item_repeats = max_item_repeats
+        self.check_interval = check_interval
+
+    def find_repetition_loop(self, text: str) -> Optional[int]:
+        """
+        末尾存在复读时返回有效前缀的长度 (保留重复片段的第一次出现), 否则返回 None
+        """
+        length = len(text)
+        for period in range(1, self.max_period + 1):
+            span = max(period * self.min_repeats, self.min_span)
+            if span > length:
+                break
+            # 先比较末尾字符, 大多数周期可以直接排除
+            if text[-1] != text[-1 - period]:
+                continue
+            tail = text[-span:]
+            if tail[period:] != tail[:-period]:
+                continue
+            start = length - span
+            while start > 0 and text[start - 1] == text[start - 1 + period]:
+                start -= 1
+            return start + period
+        return None
+
+    def find_repeated_item(self, items: List[Any]) -> bool:
+        """
+        最新闭合的元素是否已出现 max_item_repeats 次, 调用方在每次有新元素闭合时检查
+        """
+        if self.max_item_repeats is None or len(items) < self.max_item_repeats:
+            return False
+        last_item = items[-1]
+        return sum(1 for item in items if item == last_item) >= self.max_item_repeats
+
+    def check(self, text: str, items: List[Any]) -> Optional[Tuple[str, int]]:
+        """
+        返回 (退化类型, 有效前缀长度), 未退化时返回 None
+        """
+        if self.find_repeated_item(items):
+            return DEGENERATION_REPEATED_ITEM, len(text)
+        prefix_length = self.find_repetition_loop(text)
+        if prefix_length is not None:
+            return DEGENERATION_LOOP, prefix_length
+        return None
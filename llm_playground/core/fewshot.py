@@ -0,0 +1,122 @@
+import re
+from typing import FrozenSet, Iterable, List, Optional, Sequence
+
+from .prompts import (
+    base_few_shot2,
+    scheme_few_shot,
+    isomer_few_shots1,
+    isomer_few_shots2,
+)
+from ..utils.helpers import estimate_token_count
+
+# 输入文本的结构特征, 用于判断哪些 few-shot 与当前 record 相关
+FEATURE_SCHEME = "scheme"
+FEATURE_TABLE = "table"
+FEATURE_ISOMER = "isomer"
+
+FEATURE_PATTERNS = {
+    FEATURE_SCHEME: re.compile(r"<scheme\b"),
+    FEATURE_TABLE: re.compile(r"<table\b"),
+    # 异构体拆分: 显式的 isomer 描述、"Example 65 and 66" 式的成对编号、同一个 <mol> 中的多个结构
+    FEATURE_ISOMER: re.compile(
+        r"\bisomers?\b|diastereomer|enantiomer|\b(?:first|second) eluting\b"
+        r"|\bExamples?\s+\d+\s+and\s+\d+|<mol\b[^>]*>[^<]*;",
+        re.IGNORECASE,
+    ),
+}
+
+_WORD_PATTERN = re.compile(r"[a-z]{4,}")
+
+
+def extract_features(text: str) -> FrozenSet[str]:
+    return frozenset(name for name, pattern in FEATURE_PATTERNS.items() if pattern.search(text))
+
+
+def get_words(text: str) -> FrozenSet[str]:
+    return frozenset(_WORD_PATTERN.findall(text.lower()))
+
+
+class FewShot(object):
+    """
+    一个 few-shot 示例
+    features 为空的示例只按词汇重合度排序; always 为 True 的示例总是被选中 (如基础格式示例)
+    """
+
+    def __init__(self, name: str, text: str, features: Iterable[str] = (), always: bool = False):
+        self.name = name
+        self.text = text
+        self.features = frozenset(features)
+        self.always = always
+        self.tokens = estimate_token_count(text)
+        self.words = get_words(text)
+
+
+class FewShotSelector(object):
+    """
+    按 record 动态选择 few-shot, 替代把所有示例都拼接到 system prompt 中
+
+    - 与输入有相同结构特征 (如 <scheme> 标签、异构体) 的示例才会被选中
+    - 多个候选按 (共同特征数, 词汇 Jaccard 相似度) 排序, 在 token_budget 与 max_shots 内依次加入
+    - 选中的示例按库中的原始顺序拼接, 相同组合的 prompt 前缀一致, 便于服务端的 prefix cache 复用
+    """
+
+    def __init__(
+        self,
+        shots: Sequence[FewShot],
+        token_budget: Optional[int] = None,
+        max_shots: Optional[int] = None,
+    ):
+        self.shots = list(shots)
+        self.token_budget = token_budget
+        self.max_shots = max_shots
+
+    @staticmethod
+    def get_similarity(shot: FewShot, words: FrozenSet[str]) -> float:
+        if not shot.words or not words:
+            return 0.0
+        return len(shot.words & words) / len(shot.words | words)
+
+    def select(self, text: str) -> List[FewShot]:
+        features = extract_features(text)
+        words = get_words(text)
+        candidates = []
+        for index, shot in enumerate(self.shots):
+            if shot.always or not shot.features or shot.features & features:
+                score = (
+                    shot.always,
+                    len(shot.features & features),
+                    self.get_similarity(shot, words),
+                )
+                candidates.append((score, index, shot))
+        candidates.sort(key=lambda x: x[0], reverse=True)
+
+        selected, tokens = [], 0
+        for _, index, shot in candidates:
+            if self.max_shots is not None and len(selected) >= self.max_shots:
+                break
+            if self.token_budget is not None and tokens + shot.tokens > self.token_budget:
+                continue
+            selected.append((index, shot))
+            tokens += shot.tokens
+        return [shot for _, shot in sorted(selected, key=lambda x: x[0])]
+
+    def build_system_prompt(self, base_prompt: str, text: str) -> str:
+        return base_prompt + "".join(shot.text for shot in self.select(text))
+
+
+def get_patent_synthesis_few_shots() -> List[FewShot]:
+    """
+    PATENT_SYNTHESIS_SYSTEM_PROMPT 中的 few-shot, 顺序与原 prompt 一致
+    """
+    return [
+        FewShot("base", base_few_shot2, always=True),
+        FewShot("scheme", scheme_few_shot, features=[FEATURE_SCHEME]),
+        FewShot("isomer_mol_group", isomer_few_shots1, features=[FEATURE_ISOMER]),
+        FewShot("isomer_mol_list", isomer_few_shots2, features=[FEATURE_ISOMER]),
+    ]
+
+
+def get_patent_synthesis_few_shot_selector(
+    token_budget: Optional[int] = None, max_shots: Optional[int] = None
+) -> FewShotSelector:
+    return FewShotSelector(get_patent_synthesis_few_shots(), token_budget=token_budget, max_shots=max_shots)
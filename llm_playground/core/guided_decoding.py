@@ -0,0 +1,65 @@
+import copy
+import functools
+from typing import Any, Dict, Type
+
+from pydantic import BaseModel
+
+
+def make_strict_json_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    转换为 Azure structured outputs 的 strict 模式要求的 schema, vLLM 的 guided_json 同样适用:
+    - 每个对象的所有字段都是必填, 且不允许额外字段; 原来可选的字段由模型输出默认值或 null
+    - 去掉 strict 模式不支持的 default
+    """
+    schema = copy.deepcopy(schema)
+
+    def visit(node):
+        if not isinstance(node, dict):
+            return
+        node.pop("default", None)
+        properties = node.get("properties")
+        if isinstance(properties, dict):
+            node["required"] = list(properties)
+            node["additionalProperties"] = False
+            for value in properties.values():
+                visit(value)
+        for key in ("$defs", "definitions"):
+            for value in (node.get(key) or {}).values():
+                visit(value)
+        for key in ("anyOf", "oneOf", "allOf", "prefixItems"):
+            for value in node.get(key) or []:
+                visit(value)
+        visit(node.get("items"))
+
+    visit(schema)
+    return schema
+
+
+@functools.lru_cache(maxsize=None)
+def _get_model_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    return make_strict_json_schema(model.model_json_schema())
+
+
+def get_model_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    由 pydantic 模型生成用于约束解码的 JSON schema, 返回副本, 调用方可以修改
+    """
+    return copy.deepcopy(_get_model_json_schema(model))
+
+
+def get_results_json_schema(item_model: Type[BaseModel], array_key: str = "results") -> Dict[str, Any]:
+    """
+    {array_key: [item, ...]} 格式输出的 JSON schema
+    """
+    item_schema = get_model_json_schema(item_model)
+    defs = item_schema.pop("$defs", None)
+    schema = {
+        "title": item_schema.get("title", "Item") + "List",
+        "type": "object",
+        "properties": {array_key: {"type": "array", "items": item_schema}},
+        "required": [array_key],
+        "additionalProperties": False,
+    }
+    if defs:
+        schema["$defs"] = defs
+    return schema
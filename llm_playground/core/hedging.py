@@ -0,0 +1,78 @@
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from .telemetry import percentile
+
+
+class HedgePolicy(object):
+    """
+    对冲请求 (hedged request) 策略, 用于降低长尾延迟
+
+    - 请求超过近期延迟的 percentile 分位数仍未返回时, 向另一个副本再发一次相同的请求,
+      先返回的结果胜出, 另一个请求被取消
+    - 对冲请求数不超过主请求数的 max_hedge_ratio, 即额外负载最多增加 max_hedge_ratio
+    - 延迟样本不足 min_samples 时不进行对冲
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        max_hedge_ratio: float = 0.1,
+        min_samples: int = 20,
+        window: int = 1000,
+        min_delay: float = 0.0,
+    ):
+        if not 0 < percentile < 100:
+            raise ValueError(f"percentile 必须在 0~100 之间: {percentile}")
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def get_delay(self) -> Optional[float]:
+        """
+        主请求发出后等待多久发出对冲请求, 样本不足时返回 None
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = list(self._latencies)
+        return max(percentile(latencies, self.percentile), self.min_delay)
+
+    def on_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_acquire_hedge(self) -> bool:
+        """
+        预算内返回 True 并计入一次对冲
+        """
+        with self._lock:
+            if self.hedges + 1 > self.max_hedge_ratio * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def on_hedge_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+    def summary(self) -> Dict:
+        delay = self.get_delay()
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedge_delay": None if delay is None else round(delay, 6),
+            }
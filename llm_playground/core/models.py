@@ -1,10 +1,31 @@
 import os
-from typing import Dict, Any, Tuple, Union
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI, OpenAI
-from langchain_openai import AzureChatOpenAI, AzureOpenAI
+import re
+import json
+import threading
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple, Union
 
-load_dotenv()
+# langchain_openai 导入耗时 1s 以上, 只在真正创建客户端时导入, 保证 import llm_playground 足够快
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI, OpenAI
+    from langchain_openai import AzureChatOpenAI, AzureOpenAI
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+
+def load_env():
+    """
+    首次需要读取 API key 或创建客户端时才加载 .env, 只加载一次
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _env_loaded = True
 
 
 # =============================================================================================
@@ -18,7 +39,15 @@ GPT_4_LLM_NAME = "gpt-4"
 GPT_4O_LLM_NAME = "gpt-4o"
 GPT_4O_MINI_LLM_NAME = "gpt-4o-mini"
 
+# 支持 structured outputs (response_format 为 json_schema) 的 Azure 部署及所需的 API 版本
+AZURE_JSON_SCHEMA_LLM_NAMES = [GPT_4O_LLM_NAME, GPT_4O_MINI_LLM_NAME]
+AZURE_JSON_SCHEMA_API_VERSION = "2024-08-01-preview"
+
 # 模型配置统一管理
+# 同一模型部署了多个副本时, 用 endpoints 代替 url 配置各副本地址与权重, 请求按负载均衡分发:
+#     "endpoints": [{"url": "http://host-a:12633/v1", "weight": 2}, {"url": "http://host-b:12633/v1"}]
+# 可选的 token_budget 为单个副本同时处理的 prompt tokens 上限 (如 vLLM 的 KV cache 容量),
+# 配置后调度器按预估的 prompt tokens 装箱派发, 也可以在 endpoints 中为每个副本单独配置
 MODEL_CONFIGS = {
     # QWEN 模型配置
     "QWEN25_14B": {
@@ -44,6 +73,16 @@ MODEL_CONFIGS = {
     },
 }
 
+# 受限模型的调用配额: rpm = requests-per-minute, tpm = tokens-per-minute
+# tokens 按 prompt 预估 tokens + max_tokens 计, 与 Azure 的配额计算方式一致
+MODEL_RATE_LIMITS = {
+    GPT_4_LLM_NAME: {"rpm": 60, "tpm": 40 * 1000},
+    GPT_4O_LLM_NAME: {"rpm": 300, "tpm": 150 * 1000},
+    GPT_4O_MINI_LLM_NAME: {"rpm": 300, "tpm": 150 * 1000},
+    "DS_R1": {"rpm": 30, "tpm": 100 * 1000},
+    "QWQ_32B": {"rpm": 30, "tpm": 100 * 1000},
+}
+
 # 保持向后兼容的常量
 QWEN25_7B_LLM_NAME = "QWEN25_7B"
 QWEN25_14B_LLM_NAME = "QWEN25_14B"
@@ -85,6 +124,7 @@ def is_reasoning_llm(llm_name:str) -> bool:
 
 def _get_azure_config(llm_name: str) -> Tuple[str, str]:
     """获取Azure OpenAI配置"""
+    load_env()
     if llm_name == GPT_4_LLM_NAME:
         api_key = os.getenv("GPT_4_API_KEY")
         endpoint = os.getenv("GPT_4_ENDPOINT")
@@ -109,12 +149,62 @@ def _get_model_config(llm_name: str) -> Dict[str, Any]:
         raise ValueError(f"不支持的模型: {llm_name}")
 
     config = MODEL_CONFIGS[llm_name]
-    if not config["url"]:
+    if not config.get("url") and not config.get("endpoints"):
         raise ValueError(f"模型 {llm_name} 的URL未配置")
 
     return config
 
 
+def get_model_endpoints(llm_name: str) -> List[Dict[str, Any]]:
+    """
+    获取模型配置的所有副本 [{"url": ..., "weight": ...}], 未在 MODEL_CONFIGS 中配置的模型返回空列表
+    """
+    config = MODEL_CONFIGS.get(llm_name)
+    if not config:
+        return []
+    if config.get("endpoints"):
+        return [
+            {"url": e["url"], "weight": e.get("weight", 1.0)} for e in config["endpoints"]
+        ]
+    if config.get("url"):
+        return [{"url": config["url"], "weight": 1.0}]
+    return []
+
+
+def get_model_token_budget(llm_name: str) -> Optional[int]:
+    """
+    模型所有副本的 token_budget 之和, 任一副本未配置时返回 None (不限制)
+    """
+    config = MODEL_CONFIGS.get(llm_name)
+    if not config:
+        return None
+    budgets = [
+        e.get("token_budget", config.get("token_budget"))
+        for e in config.get("endpoints") or [config]
+    ]
+    if not budgets or any(budget is None for budget in budgets):
+        return None
+    return sum(budgets)
+
+
+def check_llm_config(llm_name: str):
+    """
+    检查模型配置是否完整, 不创建客户端, 配置缺失时抛出 ValueError
+    """
+    if not llm_name:
+        raise ValueError("模型名称不能为空")
+    if llm_name in [GPT_4_LLM_NAME, GPT_4O_LLM_NAME, GPT_4O_MINI_LLM_NAME]:
+        _get_azure_config(llm_name)
+    else:
+        _get_model_config(llm_name)
+
+
+def _get_model_url(llm_name: str) -> str:
+    """多副本的模型默认使用第一个副本"""
+    config = _get_model_config(llm_name)
+    return config.get("url") or config["endpoints"][0]["url"]
+
+
 def get_chat_openai(
     llm_name: str = "",
     n: int = 1,
@@ -123,7 +213,10 @@ def get_chat_openai(
     max_tokens: int = None,
     streaming: bool = False,
     stop: list = None,
-) -> Union[ChatOpenAI, AzureChatOpenAI]:
+    shared: bool = True,
+    base_url: str = None,
+    json_schema: dict = None,
+) -> Union["ChatOpenAI", "AzureChatOpenAI"]:
     """
     创建ChatOpenAI客户端
 
@@ -135,42 +228,115 @@ def get_chat_openai(
         max_tokens: 最大token数
         streaming: 是否流式输出
         stop: 停止词列表
+        shared: 是否复用进程级共享的客户端与连接池 (相同 endpoint + 参数返回同一个客户端)
+        base_url: 指定模型的某个副本地址, 默认使用配置中的第一个副本
+        json_schema: 约束输出格式的 JSON schema, MODEL_CONFIGS 中的 vLLM 模型以 guided_json 传入,
+            Azure 模型以 response_format 传入; 不支持 json_schema 的 Azure 部署忽略该参数
 
     Returns:
         ChatOpenAI或AzureChatOpenAI客户端
     """
+    if not llm_name:
+        raise ValueError("模型名称不能为空")
+
+    from .clients import get_shared_http_clients, get_or_create_llm_client
+
+    is_azure = llm_name in [GPT_4_LLM_NAME, GPT_4O_LLM_NAME, GPT_4O_MINI_LLM_NAME]
+    if is_azure:
+        base_url = _get_azure_config(llm_name)[1]
+    elif base_url is None:
+        base_url = _get_model_url(llm_name)
+
+    if not shared:
+        return _create_chat_openai(
+            llm_name, n, presence_penalty, temperature, max_tokens, streaming, stop,
+            base_url, None, json_schema,
+        )
+
+    key = (
+        llm_name,
+        base_url,
+        n,
+        presence_penalty,
+        temperature,
+        max_tokens,
+        streaming,
+        tuple(stop) if stop else None,
+        json.dumps(json_schema, sort_keys=True) if json_schema else None,
+    )
+    return get_or_create_llm_client(
+        key,
+        lambda: _create_chat_openai(
+            llm_name, n, presence_penalty, temperature, max_tokens, streaming, stop,
+            base_url, get_shared_http_clients(base_url), json_schema,
+        ),
+    )
+
+
+def _create_chat_openai(
+    llm_name, n, presence_penalty, temperature, max_tokens, streaming, stop, base_url,
+    http_clients, json_schema=None,
+) -> Union["ChatOpenAI", "AzureChatOpenAI"]:
+    from langchain_openai import ChatOpenAI, AzureChatOpenAI
+
+    load_env()
     if stop is None:
         stop = ["<|eot_id|>"]
 
-    if not llm_name:
-        raise ValueError("模型名称不能为空")
+    # 共享的 httpx 连接池: 同一 endpoint 的所有 agent 复用 keep-alive 连接
+    client_kwargs = {}
+    if http_clients is not None:
+        client_kwargs = {"http_client": http_clients[0], "http_async_client": http_clients[1]}
 
     # Azure OpenAI 模型
     if llm_name in [GPT_4_LLM_NAME, GPT_4O_LLM_NAME, GPT_4O_MINI_LLM_NAME]:
         api_key, endpoint = _get_azure_config(llm_name)
         # print(f"llm_name: {llm_name}, api_key: {api_key}, endpoint: {endpoint}")
+        api_version = "2024-02-01"
+        model_kwargs = {}
+        if json_schema and llm_name in AZURE_JSON_SCHEMA_LLM_NAMES:
+            api_version = AZURE_JSON_SCHEMA_API_VERSION
+            model_kwargs["response_format"] = get_response_format(json_schema)
         return AzureChatOpenAI(
             openai_api_key=api_key,
             azure_endpoint=endpoint,
             azure_deployment=llm_name,
-            openai_api_version="2024-02-01",
+            openai_api_version=api_version,
+            streaming=streaming,
+            stream_usage=streaming,
+            model_kwargs=model_kwargs,
+            **client_kwargs,
         )
 
     # 其他模型
     config = _get_model_config(llm_name)
     return ChatOpenAI(
         openai_api_key="EMPTY",
-        openai_api_base=config["url"],
+        openai_api_base=base_url,
         model_name=config["name"],
         n=n,
         presence_penalty=presence_penalty,
         temperature=temperature,
         max_tokens=max_tokens,
         streaming=streaming,
+        stream_usage=streaming,
         stop=config["stop"],
+        extra_body={"guided_json": json_schema} if json_schema else None,
+        **client_kwargs,
     )
 
 
+def get_response_format(json_schema: dict) -> Dict[str, Any]:
+    """
+    OpenAI / Azure structured outputs 的 response_format 参数, json_schema 需满足 strict 模式的要求
+    """
+    name = re.sub(r"[^a-zA-Z0-9_-]", "_", json_schema.get("title") or "output")
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "schema": json_schema, "strict": True},
+    }
+
+
 def get_openai(
     llm_name: str = "",
     n: int = 1,
@@ -179,7 +345,7 @@ def get_openai(
     max_tokens: int = None,
     streaming: bool = False,
     stop: list = None,
-) -> Union[OpenAI, AzureOpenAI]:
+) -> Union["OpenAI", "AzureOpenAI"]:
     """
     创建OpenAI客户端
 
@@ -195,6 +361,9 @@ def get_openai(
     Returns:
         OpenAI或AzureOpenAI客户端
     """
+    from langchain_openai import OpenAI, AzureOpenAI
+
+    load_env()
     if stop is None:
         stop = ["<|eot_id|>"]
 
@@ -215,7 +384,7 @@ def get_openai(
     config = _get_model_config(llm_name)
     return OpenAI(
         openai_api_key="EMPTY",
-        openai_api_base=config["url"],
+        openai_api_base=_get_model_url(llm_name),
         model_name=config["name"],
         n=n,
         presence_penalty=presence_penalty,
@@ -1187,8 +1187,49 @@ Tags are top-level, ordered, and IDs must not be changed.
 # base case
 # PATENT_SYNTHESIS_SYSTEM_PROMPT = PATENT_SYNTHESIS_SYSTEM_PROMPT + base_few_shot2
 
+# 紧凑输出模式: 模型不再逐字复述 detail, 只输出定位用的开头与结尾, detail 由调用方按 detail_ids 从原文还原
+PATENT_SYNTHESIS_COMPACT_OUTPUT_INSTRUCTION = """
+# Compact Output (overrides the Output Format and examples above)
+Do NOT output the "detail" field; it is rebuilt from the source blocks listed in detail_ids.
+Instead, for every record output:
+- "detail_start": the first 5-8 words of this step's procedure text, copied verbatim from the source.
+- "detail_end": the last 5-8 words of this step's procedure text, copied verbatim from the source.
+```json
+{{
+  "results": [
+    {{
+      "compound_id": "...",
+      "iupac_name": "...",
+      "structure_id": "...",
+      "detail_ids": ["..."],
+      "detail_start": "...",
+      "detail_end": "...",
+      "refs": [...] or null
+    }}
+  ]
+}}
+```
+"""
+
+# 打包模式: 多个 record 合并为一个请求时, 加在输入文本之前的说明, 模型按 record id 返回结果
+PATENT_SYNTHESIS_PACK_INSTRUCTION = """
+The input below contains {n} independent patent fragments, each wrapped in <record id="..."> ... </record>.
+Extract every record independently, following all the rules above. Never merge steps across records.
+Return ONE JSON object keyed by record id, containing every record id exactly once:
+```json
+{{
+  "records": {{
+    "<record id>": {{"results": [...]}}
+  }}
+}}
+```
+"""
+
+# 不含 few-shot 的指令部分, 按 record 动态选择 few-shot 时使用 (见 core/fewshot.py)
+PATENT_SYNTHESIS_BASE_SYSTEM_PROMPT = PATENT_SYNTHESIS_SYSTEM_PROMPT
+
 # scheme case
-PATENT_SYNTHESIS_SYSTEM_PROMPT = PATENT_SYNTHESIS_SYSTEM_PROMPT + base_few_shot2 + scheme_few_shot + isomer_few_shots1 + isomer_few_shots2
+PATENT_SYNTHESIS_SYSTEM_PROMPT = PATENT_SYNTHESIS_BASE_SYSTEM_PROMPT + base_few_shot2 + scheme_few_shot + isomer_few_shots1 + isomer_few_shots2
 
 
 PATENT_SYNTHESIS_reaction_field_SYSTEM_PROMPT = \
@@ -0,0 +1,110 @@
+import time
+import asyncio
+import threading
+from typing import Dict, Optional
+from .models import MODEL_RATE_LIMITS
+
+
+class TokenBucket(object):
+    """
+    令牌桶: 以 rate 个/秒 的速度补充令牌, 最多积攒 capacity 个
+
+    reserve 采用"预约"方式: 直接扣减令牌(允许为负), 并返回需要等待的秒数,
+    因此多个协程/线程同时申请时按申请顺序排队, 不需要 asyncio 锁
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        if capacity <= 0 or rate <= 0:
+            raise ValueError(f"capacity 与 rate 必须大于 0: {capacity}, {rate}")
+        self.capacity = capacity
+        self.rate = rate
+        self._level = capacity
+        self._last = time.monotonic()
+
+    def _refill(self, now: float):
+        self._level = min(self.capacity, self._level + (now - self._last) * self.rate)
+        self._last = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        # 单次申请量超过桶容量时照常全额扣减, 等待时间相应变长, 保证总量不超过配额
+        self._refill(now)
+        self._level -= amount
+        if self._level >= 0:
+            return 0.0
+        return -self._level / self.rate
+
+    def refund(self, amount: float, now: float):
+        self._refill(now)
+        self._level = min(self.capacity, self._level + amount)
+
+
+class RateLimiter(object):
+    """
+    按 requests-per-minute 与 tokens-per-minute 配额限制调用频率
+
+    为保证任意 60 秒窗口内都不超过配额, 令牌补充速度取 limit / (60 + burst_seconds),
+    桶容量取 burst_seconds 秒的补充量, 即: 容量 + 60 秒补充量 == limit
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None,
+                 burst_seconds: float = 10.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock = threading.Lock()
+        self._request_bucket = self._make_bucket(rpm, burst_seconds)
+        self._token_bucket = self._make_bucket(tpm, burst_seconds)
+
+    @staticmethod
+    def _make_bucket(limit: Optional[int], burst_seconds: float) -> Optional[TokenBucket]:
+        if not limit:
+            return None
+        rate = limit / (60.0 + burst_seconds)
+        return TokenBucket(capacity=max(1.0, rate * burst_seconds), rate=rate)
+
+    def reserve(self, tokens: int = 0) -> float:
+        """预约一次请求及其 tokens, 返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._request_bucket is not None:
+                wait = max(wait, self._request_bucket.reserve(1, now))
+            if self._token_bucket is not None and tokens > 0:
+                wait = max(wait, self._token_bucket.reserve(tokens, now))
+            return wait
+
+    async def acquire(self, tokens: int = 0) -> int:
+        """
+        等待直到配额允许发出一次消耗 tokens 的请求, 返回实际从 tokens 配额中扣减的数量,
+        请求完成后最多归还这么多
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return tokens if self._token_bucket is not None and tokens > 0 else 0
+
+    def refund(self, tokens: int):
+        """请求实际消耗少于预估时, 归还多扣的 tokens"""
+        if self._token_bucket is None or tokens <= 0:
+            return
+        with self._lock:
+            self._token_bucket.refund(tokens, time.monotonic())
+
+
+# 同一模型的所有 agent 共享一个限流器, 保证整个进程不超过该模型的配额
+_RATE_LIMITERS: Dict[str, RateLimiter] = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(llm_name: str) -> Optional[RateLimiter]:
+    """
+    获取模型对应的进程级共享限流器, 未在 MODEL_RATE_LIMITS 中配置的模型返回 None
+    """
+    limits = MODEL_RATE_LIMITS.get(llm_name)
+    if not limits:
+        return None
+    with _RATE_LIMITERS_LOCK:
+        if llm_name not in _RATE_LIMITERS:
+            _RATE_LIMITERS[llm_name] = RateLimiter(
+                rpm=limits.get("rpm"), tpm=limits.get("tpm")
+            )
+        return _RATE_LIMITERS[llm_name]
@@ -0,0 +1,138 @@
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+# 错误分类
+RETRYABLE = "retryable"
+FATAL = "fatal"
+
+# 可重试的 HTTP 状态码: 超时、冲突、限流, 另外所有 5xx 服务端错误均可重试
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429}
+
+# 没有状态码时按异常类名判断, 覆盖 openai / httpx / aiohttp 以及内置的连接类异常
+RETRYABLE_ERROR_NAMES = (
+    "RateLimitError",
+    "APITimeoutError",
+    "APIConnectionError",
+    "InternalServerError",
+    "ServiceUnavailableError",
+    "TimeoutException",
+    "ConnectError",
+    "ReadError",
+    "RemoteProtocolError",
+    "ServerDisconnectedError",
+    "ClientConnectionError",
+)
+
+
+class LLMCallError(Exception):
+    """
+    重试耗尽或遇到不可重试错误时抛出, kind 为 RETRYABLE / FATAL
+    """
+
+    def __init__(self, kind: str, attempts: int, cause: BaseException):
+        super().__init__(f"[{kind}] LLM 调用失败 (共尝试 {attempts} 次): {cause!r}")
+        self.kind = kind
+        self.attempts = attempts
+        self.cause = cause
+
+
+def get_status_code(exc: BaseException) -> Optional[int]:
+    status_code = getattr(exc, "status_code", None)
+    if status_code is None:
+        response = getattr(exc, "response", None)
+        status_code = getattr(response, "status_code", None)
+    if status_code is None:
+        status_code = getattr(exc, "status", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def classify_error(exc: BaseException) -> str:
+    """
+    区分可重试错误(限流、连接中断、超时、5xx)与不可重试错误(鉴权、参数错误等)
+    """
+    if isinstance(exc, LLMCallError):
+        return exc.kind
+    status_code = get_status_code(exc)
+    if status_code is not None:
+        return RETRYABLE if status_code in RETRYABLE_STATUS_CODES or status_code >= 500 else FATAL
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return RETRYABLE
+    for cls in type(exc).__mro__:
+        if cls.__name__ in RETRYABLE_ERROR_NAMES:
+            return RETRYABLE
+    return FATAL
+
+
+def get_retry_after(exc: BaseException) -> Optional[float]:
+    """
+    从响应头 retry-after-ms / retry-after (秒数或 HTTP 日期) 中读取服务端建议的等待秒数
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms is not None:
+            return max(0.0, float(retry_after_ms) / 1000)
+        retry_after = headers.get("retry-after")
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class RetryPolicy(object):
+    """
+    指数退避 + full jitter 重试策略
+
+    第 attempt 次失败后等待 uniform(0, min(max_delay, base_delay * 2 ** attempt)) 秒,
+    服务端返回 Retry-After 时优先使用该值(不超过 max_delay)
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0,
+                 max_delay: float = 60.0):
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts 必须大于 0: {max_attempts}")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int, exc: BaseException) -> float:
+        retry_after = get_retry_after(exc)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def arun(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        for attempt in range(self.max_attempts):
+            try:
+                return await fn()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                kind = classify_error(exc)
+                if kind == FATAL or attempt + 1 >= self.max_attempts:
+                    raise LLMCallError(kind, attempt + 1, exc) from exc
+                delay = self.get_delay(attempt, exc)
+                print(f"LLM 调用失败, {delay:.1f} 秒后第 {attempt + 2} 次尝试: {exc!r}")
+                await asyncio.sleep(delay)
+
+    def run(self, fn: Callable[[], Any]) -> Any:
+        for attempt in range(self.max_attempts):
+            try:
+                return fn()
+            except Exception as exc:
+                kind = classify_error(exc)
+                if kind == FATAL or attempt + 1 >= self.max_attempts:
+                    raise LLMCallError(kind, attempt + 1, exc) from exc
+                delay = self.get_delay(attempt, exc)
+                print(f"LLM 调用失败, {delay:.1f} 秒后第 {attempt + 2} 次尝试: {exc!r}")
+                time.sleep(delay)
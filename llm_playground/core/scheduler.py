@@ -0,0 +1,125 @@
+import asyncio
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+# 派发顺序: file 按输入顺序; longest_first 先派发长请求, 缩短整体完成时间 (makespan);
+# shortest_first 先派发短请求, 尽快得到部分结果
+DISPATCH_FILE = "file"
+DISPATCH_LONGEST_FIRST = "longest_first"
+DISPATCH_SHORTEST_FIRST = "shortest_first"
+DISPATCH_ORDERS = (DISPATCH_FILE, DISPATCH_LONGEST_FIRST, DISPATCH_SHORTEST_FIRST)
+
+
+def get_dispatch_order(
+    costs: Sequence[float],
+    dispatch_order: Union[str, Callable[[Sequence[float]], List[int]], None] = None,
+) -> List[int]:
+    """
+    按派发策略返回下标顺序, dispatch_order 也可以是 costs -> 下标列表 的自定义函数
+    排序是稳定的, 相同 cost 的 item 保持输入顺序
+    """
+    if callable(dispatch_order):
+        return list(dispatch_order(costs))
+    if dispatch_order in (None, DISPATCH_FILE):
+        return list(range(len(costs)))
+    if dispatch_order == DISPATCH_LONGEST_FIRST:
+        return sorted(range(len(costs)), key=lambda i: -costs[i])
+    if dispatch_order == DISPATCH_SHORTEST_FIRST:
+        return sorted(range(len(costs)), key=lambda i: costs[i])
+    raise ValueError(f"不支持的派发顺序: {dispatch_order}, 可选 {DISPATCH_ORDERS}")
+
+
+async def iter_as_completed(
+    process: Callable[[Any], Awaitable[Any]],
+    items: Iterable[Any],
+    max_concurrency: int = 64,
+    concurrency_controller=None,
+    order: Optional[Sequence[int]] = None,
+    costs: Optional[Sequence[float]] = None,
+    cost_budget: Optional[float] = None,
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    滑动窗口并发调度: 始终保持 max_concurrency 个请求在途,
+    任意一个请求完成后立即补入下一条, 不再等待整个 Batch 结束。
+
+    按完成顺序 yield (原始下标, 结果), 由调用方按下标还原原始顺序。
+    生成器被提前关闭时, 会取消所有尚未完成的请求。
+
+    传入 concurrency_controller (如 AIMDController) 时, 每次补位按其当前的 limit 计算窗口大小,
+    max_concurrency 作为上限
+
+    order 为派发顺序 (原始下标列表), 默认按输入顺序;
+    传入 costs 与 cost_budget 时, 在途 item 的 cost 之和不超过 cost_budget (如副本的 token 容量),
+    补位时按 first-fit 在待派发队列中选第一个放得下的 item; 单个超出预算的 item 在没有其他在途请求时单独派发
+    """
+    if max_concurrency < 1:
+        raise ValueError(f"max_concurrency 必须大于 0: {max_concurrency}")
+    if cost_budget is not None and costs is None:
+        raise ValueError("按 cost_budget 调度时必须提供 costs")
+
+    if order is None and cost_budget is None:
+        item_iter = iter(enumerate(items))
+        queue = None
+    else:
+        items = list(items)
+        queue = deque(range(len(items)) if order is None else order)
+    pending = {}
+    in_flight_cost = 0.0
+
+    def get_window() -> int:
+        if concurrency_controller is None:
+            return max_concurrency
+        return max(1, min(concurrency_controller.limit, max_concurrency))
+
+    def next_item():
+        nonlocal in_flight_cost
+        if queue is None:
+            return next(item_iter, None)
+        if not queue:
+            return None
+        if cost_budget is None:
+            idx = queue.popleft()
+            return idx, items[idx]
+        for pos, idx in enumerate(queue):
+            if not pending or in_flight_cost + costs[idx] <= cost_budget:
+                del queue[pos]
+                in_flight_cost += costs[idx]
+                return idx, items[idx]
+        return None
+
+    def admit():
+        while len(pending) < get_window():
+            entry = next_item()
+            if entry is None:
+                return
+            idx, item = entry
+            task = asyncio.ensure_future(process(item))
+            pending[task] = idx
+
+    admit()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(
+                pending.keys(), return_when=asyncio.FIRST_COMPLETED
+            )
+            finished = [(pending.pop(task), task) for task in done]
+            if cost_budget is not None:
+                in_flight_cost -= sum(costs[idx] for idx, _ in finished)
+            # 先补位再把结果交给调用方, 避免下游写文件等操作拖慢在途请求数
+            admit()
+            for idx, task in sorted(finished, key=lambda x: x[0]):
+                yield idx, task.result()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,214 @@
+import os
+import json
+import math
+import threading
+from typing import Dict, Iterable, List, Optional
+from pydantic import BaseModel
+
+
+class RequestMetrics(BaseModel):
+    """
+    单次 LLM 请求的耗时与 token 统计, 附加在 record.metrics 上
+
+    - queue_wait: 从进入调度窗口到真正发出请求的等待时间(含限流等待), 秒
+    - ttft: time to first token, 仅流式调用时可得, 秒
+    - latency: 发出请求到拿到完整响应的总耗时(含重试), 秒
+    - endpoint: 多副本负载均衡时, 最后一次尝试所用的副本地址
+    - cache_key: 配置了缓存时该请求的缓存 key, record 最终处理失败时据此删除缓存的响应
+    """
+    queue_wait: Optional[float] = None
+    ttft: Optional[float] = None
+    latency: float = 0.0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    finish_reason: Optional[str] = None
+    cached: bool = False
+    started_at: float = 0.0
+    endpoint: Optional[str] = None
+    cache_key: Optional[str] = None
+
+
+def merge_request_metrics(metrics_list: Iterable[Dict]) -> Optional[Dict]:
+    """
+    合并同一个 record 拆分出的多个并行请求 (如分窗口抽取) 的统计:
+    tokens 求和, latency 取最长的一个, 等待时间与 ttft 取最早的一个
+    """
+    metrics_list = [RequestMetrics(**m) for m in metrics_list if m]
+    if not metrics_list:
+        return None
+
+    def first(values):
+        values = [v for v in values if v is not None]
+        return min(values) if values else None
+
+    def total(values):
+        values = [v for v in values if v is not None]
+        return sum(values) if values else None
+
+    finish_reasons = sorted({m.finish_reason for m in metrics_list if m.finish_reason})
+    endpoints = {m.endpoint for m in metrics_list}
+    merged = RequestMetrics(
+        queue_wait=first(m.queue_wait for m in metrics_list),
+        ttft=first(m.ttft for m in metrics_list),
+        latency=max(m.latency for m in metrics_list),
+        prompt_tokens=total(m.prompt_tokens for m in metrics_list),
+        completion_tokens=total(m.completion_tokens for m in metrics_list),
+        finish_reason=",".join(finish_reasons) or None,
+        cached=all(m.cached for m in metrics_list),
+        started_at=min(m.started_at for m in metrics_list),
+        endpoint=endpoints.pop() if len(endpoints) == 1 else None,
+    )
+    return merged.model_dump()
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """
+    线性插值计算百分位数, p 取值 0~100
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100.0
+    lo = math.floor(k)
+    hi = math.ceil(k)
+    if lo == hi:
+        return values[int(k)]
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class AgentTelemetry(object):
+    """
+    按 agent 聚合请求统计: 延迟 p50/p95/p99、tokens/sec 等
+    """
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, label: str):
+        self.label = label
+        self._lock = threading.Lock()
+        self._metrics: List[RequestMetrics] = []
+        self.errors = 0
+
+    def record(self, metrics: RequestMetrics):
+        with self._lock:
+            self._metrics.append(metrics)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def latencies(self) -> List[float]:
+        with self._lock:
+            return [m.latency for m in self._metrics if not m.cached]
+
+    def _percentiles(self, values: List[float]) -> Dict[str, Optional[float]]:
+        return {
+            f"p{p}": (None if not values else round(percentile(values, p), 6))
+            for p in self.PERCENTILES
+        }
+
+    def summary(self) -> Dict:
+        with self._lock:
+            metrics = list(self._metrics)
+            errors = self.errors
+        requested = [m for m in metrics if not m.cached]
+        prompt_tokens = sum(m.prompt_tokens or 0 for m in requested)
+        completion_tokens = sum(m.completion_tokens or 0 for m in requested)
+
+        # 吞吐按第一条请求发出到最后一条请求完成的墙钟时间计算
+        wall_time = 0.0
+        if requested:
+            wall_time = max(m.started_at + m.latency for m in requested) - min(
+                m.started_at for m in requested
+            )
+
+        finish_reasons: Dict[str, int] = {}
+        for m in requested:
+            reason = m.finish_reason or "unknown"
+            finish_reasons[reason] = finish_reasons.get(reason, 0) + 1
+
+        # 多副本时按副本统计请求数与延迟
+        endpoints: Dict[str, List[float]] = {}
+        for m in requested:
+            if m.endpoint is not None:
+                endpoints.setdefault(m.endpoint, []).append(m.latency)
+
+        summary = {
+            "agent": self.label,
+            "requests": len(requested),
+            "cached": len(metrics) - len(requested),
+            "errors": errors,
+            "latency": self._percentiles([m.latency for m in requested]),
+            "ttft": self._percentiles([m.ttft for m in requested if m.ttft is not None]),
+            "queue_wait": self._percentiles(
+                [m.queue_wait for m in metrics if m.queue_wait is not None]
+            ),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "completion_tokens_per_sec": (
+                round(completion_tokens / wall_time, 6) if wall_time > 0 else 0.0
+            ),
+            "finish_reasons": finish_reasons,
+        }
+        if endpoints:
+            summary["endpoints"] = {
+                url: {"requests": len(latencies), "latency": self._percentiles(latencies)}
+                for url, latencies in endpoints.items()
+            }
+        return summary
+
+
+def write_telemetry_json(json_filepath: str, telemetries: Iterable[AgentTelemetry]):
+    summaries = [t.summary() for t in telemetries]
+    with open(json_filepath, mode="w", encoding="utf-8") as fp:
+        fp.write(json.dumps(summaries, ensure_ascii=False, indent=2))
+    return summaries
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_prometheus_textfile(prom_filepath: str, telemetries: Iterable[AgentTelemetry]):
+    """
+    输出 Prometheus textfile collector 格式, 写入临时文件后原子替换,
+    避免 node_exporter 读到写了一半的文件
+    """
+    lines = []
+    summaries = [t.summary() for t in telemetries]
+
+    def add_summary_metric(name: str, key: str, help_text: str):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} summary")
+        for s in summaries:
+            agent = _escape_label(s["agent"])
+            for p, value in s[key].items():
+                if value is None:
+                    continue
+                quantile = int(p[1:]) / 100
+                lines.append(f'{name}{{agent="{agent}",quantile="{quantile}"}} {value}')
+
+    def add_metric(name: str, metric_type: str, key: str, help_text: str):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for s in summaries:
+            lines.append(f'{name}{{agent="{_escape_label(s["agent"])}"}} {s[key]}')
+
+    add_summary_metric("llm_request_latency_seconds", "latency", "LLM request latency.")
+    add_summary_metric("llm_time_to_first_token_seconds", "ttft", "LLM time to first token.")
+    add_summary_metric("llm_queue_wait_seconds", "queue_wait", "Time spent waiting before dispatch.")
+    add_metric("llm_requests_total", "counter", "requests", "LLM requests sent.")
+    add_metric("llm_cached_requests_total", "counter", "cached", "Requests served from cache.")
+    add_metric("llm_request_errors_total", "counter", "errors", "Failed LLM requests.")
+    add_metric("llm_prompt_tokens_total", "counter", "prompt_tokens", "Prompt tokens.")
+    add_metric("llm_completion_tokens_total", "counter", "completion_tokens", "Completion tokens.")
+    add_metric(
+        "llm_completion_tokens_per_second", "gauge", "completion_tokens_per_sec",
+        "Completion tokens per second over the run.",
+    )
+
+    tmp_filepath = prom_filepath + ".tmp"
+    with open(tmp_filepath, mode="w", encoding="utf-8") as fp:
+        fp.write("\n".join(lines) + "\n")
+    os.replace(tmp_filepath, prom_filepath)
+    return summaries
@@ -21,6 +21,20 @@ class ReactionStepDescriptionRecord(BaseModel):
     status: str | None
     name: str | None
     header_name: str | None
+    metrics: Dict | None = None  # 本次请求的耗时与 token 统计, 见 core.telemetry.RequestMetrics
+    validation_issues: List[Dict] | None = None  # 本地校验发现的问题, 见 utils.validation.validate_results
+
+
+def make_detail_key(detail_ids: List[str], compound_id: str, structure_id: str) -> str:
+    """
+    合成步骤的组合主键, 评测对齐与分窗口抽取结果去重共用
+    """
+    # 1) 规范化：detail_ids 排序 + 去重
+    norm_ids = sorted(dict.fromkeys(detail_ids))
+    base = "|".join(norm_ids)
+    # 2) 安全拼接（避免分隔符冲突可再做转义，这里简化处理）
+    return f"{base}||{compound_id}||{structure_id}"
+
 
 class ReactionStepDescription(BaseModel):
     """
@@ -8,7 +8,8 @@ import pandas as pd
 
 from llm_playground.datamodel.synthesis_route import (
     ReactionStepDescriptionRecord,
-    ReactionStepDescription
+    ReactionStepDescription,
+    make_detail_key,
 )
 
 
@@ -47,14 +48,6 @@ class ComparisonResult(BaseModel):
     total_predicted_items: int
 
 # ---------- 规范化 ----------
-def make_detail_key(detail_ids: List[str], compound_id: str, structure_id: str) -> str:
-    # 1) 规范化：detail_ids 排序 + 去重
-    norm_ids = sorted(dict.fromkeys(detail_ids))
-    base = "|".join(norm_ids)
-    # 2) 安全拼接（避免分隔符冲突可再做转义，这里简化处理）
-    return f"{base}||{compound_id}||{structure_id}"
-
-
 def conv_output_to_dict(results: List[Dict[str, Any]]) -> Dict[str, "ReactionStepDescription"]:
     """
     主键 = sorted(detail_ids) + compound_id + structure_id 的组合
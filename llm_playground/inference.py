@@ -1,25 +1,164 @@
 import os
+import json
 import time
-import copy
 import asyncio
 import threading
-from typing import List
-from llm_playground.core.baseagent import TaskAgent
+from typing import Dict, List, Optional
+from llm_playground.core.baseagent import TaskAgent, FAILURE_STATUSES
 
-from llm_playground.utils.helpers import write_base_model_items_to_json_array_file
+from llm_playground.utils.helpers import (
+    write_base_model_items_to_json_array_file,
+    JsonlResultWriter,
+    convert_jsonl_to_json_array_file,
+    iter_jsonl_file,
+    iter_result_items_from_file,
+    make_ordered_jsonl_line,
+    JSONL_ORDER_KEY,
+)
 from llm_playground.core.models import is_restricted_llm
+from llm_playground.core.telemetry import (
+    write_telemetry_json,
+    write_prometheus_textfile,
+)
 
 
 class InferenceRunner(object):
+    """
+    output_format:
+        "json"  - 运行结束后一次性写出 JSON 数组文件 (默认)
+        "jsonl" - 每完成一条 record 立即追加到 {label}.jsonl, 内存占用不随数据量增长,
+                  中途崩溃也只丢失在途的请求; 运行结束后再转换出 {label}.json
+    resume:
+        读取已有的输出 ({label}.json / {label}.jsonl), 跳过 predict_output 非空的 record,
+        只重新请求缺失或失败的 record, 最终合并为一份合法的输出文件。
+        JSON 格式下 is_appending=True 会得到非法 JSON, 因此同样按 resume 处理
+    resume_statuses:
+        只重新请求 status 属于该集合的失败 record (例如只重跑 "retryable_error"),
+        为 None 时重新请求所有失败状态 (FAILURE_STATUSES) 的 record;
+        被截断的 "truncated" record 保留了部分结果, 默认视为已完成, 需要时在这里指定并调大 max_tokens
+    """
+
+    OUTPUT_FORMATS = ("json", "jsonl")
+
     def __init__(
-        self, agents: List[TaskAgent], output_dirpath: str, records, is_appending=False
+        self,
+        agents: List[TaskAgent],
+        output_dirpath: str,
+        records,
+        is_appending=False,
+        output_format: str = "json",
+        resume: bool = False,
+        resume_statuses: Optional[set] = None,
     ):
+        if output_format not in self.OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}")
         self.agents = agents
         self.output_dirpath = output_dirpath
         if not os.path.exists(self.output_dirpath):
             os.makedirs(self.output_dirpath)
         self.records = records
         self.is_appending = is_appending
+        self.output_format = output_format
+        self.resume = resume or (is_appending and output_format == "json")
+        self.resume_statuses = resume_statuses
+
+    def is_completed_item(self, item) -> bool:
+        """
+        判断已有输出中的一条结果是否已完成, 已完成的 record 在 resume 时不再重新请求
+        """
+        status = item.get("status")
+        if self.resume_statuses is None:
+            return bool(item.get("predict_output")) and status not in FAILURE_STATUSES
+        # 只重跑指定状态的失败 record, 其它失败状态视为已完成
+        if status in self.resume_statuses:
+            return False
+        return bool(item.get("predict_output")) or status in FAILURE_STATUSES
+
+    def load_completed_items(self, output_json_array_filepath: str):
+        """
+        从已有的 JSON 数组与 JSONL 输出中读取已完成的结果, 返回 {record_id: item}
+        """
+        jsonl_filepath = os.path.splitext(output_json_array_filepath)[0] + ".jsonl"
+        completed_items = {}
+        for filepath in [output_json_array_filepath, jsonl_filepath]:
+            if not os.path.exists(filepath):
+                continue
+            for item in iter_result_items_from_file(filepath):
+                if self.is_completed_item(item):
+                    completed_items[item.get("id")] = item
+        return completed_items
+
+    async def run_by_agent_resume(
+        self,
+        agent: TaskAgent,
+        output_json_array_filepath: str,
+        max_batch_size: int,
+        records,
+    ):
+        """
+        断点续跑: 已完成的结果先压缩写入 JSONL, 再只请求剩余的 record 并追加写入,
+        最终转换为一份合法的 JSON 数组文件; 再次中断后可以继续 resume
+        """
+        completed_items = self.load_completed_items(output_json_array_filepath)
+        pending_records = [
+            record for record in records if record.id not in completed_items
+        ]
+        print(
+            f"{agent.get_unique_label()} resume: {len(completed_items)} completed, "
+            f"{len(pending_records)} remaining."
+        )
+
+        # 已完成与待请求的结果都按 record 在 records 中的位置写入顺序字段, 最终输出保持输入顺序
+        index_by_id = {record.id: idx for idx, record in enumerate(records)}
+        jsonl_filepath = os.path.splitext(output_json_array_filepath)[0] + ".jsonl"
+        tmp_filepath = jsonl_filepath + ".tmp"
+        with open(tmp_filepath, mode="w", encoding="utf-8") as fp:
+            for record_id, item in completed_items.items():
+                item.pop(JSONL_ORDER_KEY, None)
+                fp.write(make_ordered_jsonl_line(
+                    json.dumps(item, ensure_ascii=False), index_by_id.get(record_id)
+                ))
+                fp.write("\n")
+        os.replace(tmp_filepath, jsonl_filepath)
+
+        await self.run_by_agent_to_jsonl(
+            agent, output_json_array_filepath, max_batch_size, pending_records,
+            mode="a", indices=[index_by_id[record.id] for record in pending_records],
+        )
+
+    async def run_by_agent_to_jsonl(
+        self,
+        agent: TaskAgent,
+        output_json_array_filepath: str,
+        max_batch_size: int,
+        records,
+        mode: str = None,
+        indices: Optional[List[int]] = None,
+    ):
+        """
+        流式运行: 每完成一条 record 追加写入 JSONL, 结束后转换为 JSON 数组文件
+        JSONL 按完成顺序写入, 每行带有 record 的输入顺序 (indices, 默认为在 records 中的位置,
+        追加模式下接在已有结果之后), 转换出的 JSON 数组与非流式输出的顺序一致
+        """
+        jsonl_filepath = os.path.splitext(output_json_array_filepath)[0] + ".jsonl"
+        OUTPUT_MODE = mode or ("a" if self.is_appending else "w")
+        if indices is None:
+            base = 0
+            if OUTPUT_MODE == "a" and os.path.exists(jsonl_filepath):
+                base = sum(1 for _ in iter_jsonl_file(jsonl_filepath))
+            indices = [base + idx for idx in range(len(records))]
+
+        cnt_total_records = len(records)
+        with JsonlResultWriter(jsonl_filepath, mode=OUTPUT_MODE) as writer:
+            async for idx, new_record in agent.async_process_as_completed(
+                records, max_concurrency=max_batch_size
+            ):
+                writer.write(new_record, indices[idx])
+                print(
+                    f"{agent.get_unique_label()} running... ({writer.count} of {cnt_total_records})"
+                )
+
+        convert_jsonl_to_json_array_file(jsonl_filepath, output_json_array_filepath)
 
     async def run_by_agent(
         self,
@@ -35,51 +174,48 @@ class InferenceRunner(object):
         if self.is_appending:
             OUTPUT_MODE = "a"
 
+        if self.resume:
+            await self.run_by_agent_resume(
+                agent, output_json_array_filepath, max_batch_size, records
+            )
+        elif self.output_format == "jsonl":
+            await self.run_by_agent_to_jsonl(
+                agent, output_json_array_filepath, max_batch_size, records
+            )
         # restricted llm condition
-        if is_restricted_llm(agent.llm_name):
+        elif is_restricted_llm(agent.llm_name):
+            # 受限模型按限流器配额并发调用, 结果按原始顺序增量写入,
+            # 中途出错时已完成的部分仍然保留在文件中
             fp = open(output_json_array_filepath, mode=OUTPUT_MODE, encoding="utf-8")
             fp.write("[\n")
 
             JSON_INDENT = 2
             cnt_total_records = len(records)
+            cnt_done = 0
+            next_idx = 0
+            ready_records = {}
 
-            if cnt_total_records <= 1:
-                for idx, record in enumerate(records):
-                    print(
-                        f"{agent.get_unique_label()} running... ({idx + 1} of {cnt_total_records})"
-                    )
-                    new_record = await agent.async_process(record)
-                    fp.write(
-                        new_record.model_dump_json(
-                            indent=JSON_INDENT,
-                        )
-                    )
-                    fp.write("\n")
-            else:
-                for idx, record in enumerate(records[:-1]):
-                    print(
-                        f"{agent.get_unique_label()} running... ({idx + 1} of {cnt_total_records})"
-                    )
-                    new_record = await agent.async_process(record)
+            async for idx, new_record in agent.async_process_as_completed(
+                records, max_concurrency=max_batch_size
+            ):
+                cnt_done += 1
+                print(
+                    f"{agent.get_unique_label()} running... ({cnt_done} of {cnt_total_records})"
+                )
+                ready_records[idx] = new_record
+                while next_idx in ready_records:
+                    if next_idx > 0:
+                        fp.write(",\n")
                     fp.write(
-                        new_record.model_dump_json(
+                        ready_records.pop(next_idx).model_dump_json(
                             indent=JSON_INDENT,
                         )
                     )
-                    fp.write(",\n")
                     fp.flush()
+                    next_idx += 1
 
-                print(
-                    f"{agent.get_unique_label()} running... ({cnt_total_records} of {cnt_total_records})"
-                )
-                new_record = await agent.async_process(records[-1])
-                fp.write(
-                    new_record.model_dump_json(
-                        indent=JSON_INDENT,
-                    )
-                )
+            if next_idx > 0:
                 fp.write("\n")
-
             fp.write("]\n")
             fp.close()
         else:
@@ -94,6 +230,29 @@ class InferenceRunner(object):
         print(
             f"{agent.get_unique_label()} is completed, elapse {time.time() - _start} seconds."
         )
+        print(
+            f"{agent.get_unique_label()} telemetry: "
+            f"{json.dumps(agent.telemetry.summary(), ensure_ascii=False)}"
+        )
+        if agent.concurrency_controller is not None:
+            print(
+                f"{agent.get_unique_label()} concurrency: "
+                f"{json.dumps(agent.concurrency_controller.summary(), ensure_ascii=False)}"
+            )
+        if agent.hedge_policy is not None:
+            print(
+                f"{agent.get_unique_label()} hedging: "
+                f"{json.dumps(agent.hedge_policy.summary(), ensure_ascii=False)}"
+            )
+
+    def export_telemetry(self, dirpath: Optional[str] = None):
+        """
+        导出所有 agent 的请求统计: telemetry.json 与 Prometheus textfile telemetry.prom
+        """
+        dirpath = dirpath or self.output_dirpath
+        telemetries = [agent.telemetry for agent in self.agents]
+        write_telemetry_json(os.path.join(dirpath, "telemetry.json"), telemetries)
+        write_prometheus_textfile(os.path.join(dirpath, "telemetry.prom"), telemetries)
 
     def run_by_agent_thread(
         self,
@@ -118,6 +277,7 @@ class InferenceRunner(object):
                     agent, output_json_array_filepath, max_batch_size, self.records
                 )
             )
+        self.export_telemetry()
 
     def run_in_multithread(self, max_batch_size: int = 64):
         threads = []
@@ -125,16 +285,58 @@ class InferenceRunner(object):
             output_json_array_filepath = os.path.join(
                 self.output_dirpath, f"{agent.get_unique_label()}.json"
             )
-            # 这里 records 参数在 process 函数中会被修改然后返回
-            # 因此这里需要深拷贝一份 records, 再传入每个线程中进行执行
-
-            records = copy.deepcopy(self.records)
+            # agent 处理的是 record 的浅拷贝, 不会修改 self.records,
+            # 因此各线程可以共享同一份 records, 无需深拷贝
 
             t = threading.Thread(
                 target=self.run_by_agent_thread,
-                args=(agent, output_json_array_filepath, max_batch_size, records),
+                args=(agent, output_json_array_filepath, max_batch_size, self.records),
             )
             t.start()
             threads.append(t)
         for t in threads:
             t.join()
+        self.export_telemetry()
+
+    async def run_all_agents(
+        self,
+        max_batch_size: int = 64,
+        max_batch_sizes: Optional[Dict[str, int]] = None,
+    ):
+        """
+        在当前事件循环中并发运行所有 agent
+        max_batch_sizes 可按 agent.get_unique_label() 单独指定并发上限, 未指定的使用 max_batch_size
+        """
+        max_batch_sizes = max_batch_sizes or {}
+        tasks = []
+        for agent in self.agents:
+            label = agent.get_unique_label()
+            output_json_array_filepath = os.path.join(
+                self.output_dirpath, f"{label}.json"
+            )
+            tasks.append(
+                self.run_by_agent(
+                    agent,
+                    output_json_array_filepath,
+                    max_batch_sizes.get(label, max_batch_size),
+                    self.records,
+                )
+            )
+        await asyncio.gather(*tasks)
+
+    def run_in_event_loop(
+        self,
+        max_batch_size: int = 64,
+        max_batch_sizes: Optional[Dict[str, int]] = None,
+    ):
+        """
+        所有 agent 的请求调度在同一个事件循环上, 每个 agent 有各自的并发上限,
+        相比 run_in_multithread 不需要 N 个线程与 N 个事件循环, 共享同一个 LLM 客户端的
+        agent 也能复用同一个连接池
+        """
+        asyncio.run(
+            self.run_all_agents(
+                max_batch_size=max_batch_size, max_batch_sizes=max_batch_sizes
+            )
+        )
+        self.export_telemetry()
@@ -3,6 +3,17 @@
 包含各种辅助功能
 """
 
-from .helpers import write_base_model_items_to_json_array_file
+from .helpers import (
+    write_base_model_items_to_json_array_file,
+    JsonlResultWriter,
+    convert_jsonl_to_json_array_file,
+)
+from .json_stream import IncrementalJsonParser, find_json_value
 
-__all__ = ["write_base_model_items_to_json_array_file"]
+__all__ = [
+    "write_base_model_items_to_json_array_file",
+    "JsonlResultWriter",
+    "convert_jsonl_to_json_array_file",
+    "IncrementalJsonParser",
+    "find_json_value",
+]
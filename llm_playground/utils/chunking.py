@@ -0,0 +1,98 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+from .helpers import estimate_token_count
+from .tagged_document import TaggedBlock, split_tagged_blocks
+from ..datamodel.synthesis_route import make_detail_key
+
+
+class TextWindow(object):
+    """
+    切分后的一个窗口, overlap_ids 是开头从上一个窗口重复过来、仅用作上下文的标签块
+    """
+
+    def __init__(self, blocks: Sequence[TaggedBlock], overlap: int = 0):
+        self.blocks = list(blocks)
+        self.text = "\n".join(block.text for block in self.blocks)
+        self.block_ids = [block.block_id for block in self.blocks]
+        self.overlap_ids = set(self.block_ids[:overlap])
+        self.tokens = sum(block.tokens for block in self.blocks)
+
+
+class TaggedTextChunker(object):
+    """
+    把过长的专利片段切分为多个窗口, 以便并行抽取后合并
+
+    - 优先在 Example / Intermediate 等章节标题处切分, 一个窗口放入尽可能多的完整章节
+    - 单个章节超过 max_tokens 时, 在标签块边界处切分
+    - 除第一个窗口外, 每个窗口开头重复上一个窗口末尾的 overlap_blocks 个标签块, 作为跨窗口步骤的上下文
+    - 总长度不超过 max_tokens 的输入不切分
+    """
+
+    def __init__(self, max_tokens: int = 4000, overlap_blocks: int = 1):
+        if max_tokens < 1:
+            raise ValueError(f"max_tokens 必须大于 0: {max_tokens}")
+        self.max_tokens = max_tokens
+        self.overlap_blocks = overlap_blocks
+
+    def split_sections(self, blocks: List[TaggedBlock]) -> List[List[TaggedBlock]]:
+        sections = []
+        for block in blocks:
+            if not sections or block.is_section_start():
+                sections.append([])
+            sections[-1].append(block)
+        return sections
+
+    def split(self, text: str) -> List[TextWindow]:
+        blocks = split_tagged_blocks(text)
+        if len(blocks) <= 1 or estimate_token_count(text) <= self.max_tokens:
+            return [TextWindow(blocks)] if blocks else []
+
+        # 先按章节装箱, 超长的章节拆成单个标签块
+        units = []
+        for section in self.split_sections(blocks):
+            if sum(block.tokens for block in section) <= self.max_tokens:
+                units.append(section)
+            else:
+                units.extend([block] for block in section)
+
+        windows = []
+        current: List[TaggedBlock] = []
+        overlap: List[TaggedBlock] = []
+        for unit in units:
+            unit_tokens = sum(block.tokens for block in unit)
+            current_tokens = sum(block.tokens for block in overlap + current)
+            if current and current_tokens + unit_tokens > self.max_tokens:
+                windows.append(TextWindow(overlap + current, overlap=len(overlap)))
+                overlap = current[-self.overlap_blocks:] if self.overlap_blocks > 0 else []
+                current = []
+            current.extend(unit)
+        if current:
+            windows.append(TextWindow(overlap + current, overlap=len(overlap)))
+        return windows
+
+
+def merge_window_results(
+    windows: Sequence[TextWindow], window_results: Sequence[Optional[List[Dict[str, Any]]]]
+) -> List[Dict[str, Any]]:
+    """
+    按窗口顺序合并各窗口抽取的步骤:
+    - detail_ids 全部落在重叠部分的步骤属于上一个窗口, 丢弃
+    - 按评测使用的组合主键 make_detail_key 去重, 保留首次出现的步骤
+    """
+    merged = []
+    seen = set()
+    for window, results in zip(windows, window_results):
+        for item in results or []:
+            if not isinstance(item, dict):
+                continue
+            detail_ids = item.get("detail_ids") or []
+            if detail_ids and window.overlap_ids.issuperset(detail_ids):
+                continue
+            key = make_detail_key(
+                detail_ids, item.get("compound_id", ""), item.get("structure_id", "") or ""
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(item)
+    return merged
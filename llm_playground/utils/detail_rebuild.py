@@ -0,0 +1,84 @@
+from typing import Any, List, Mapping, Optional, Tuple
+
+from .tagged_document import TaggedBlock, get_tagged_document
+
+# 紧凑输出模式下模型输出的定位字段, 代替逐字复述的 detail
+DETAIL_START_KEY = "detail_start"
+DETAIL_END_KEY = "detail_end"
+
+
+def _strip_whitespace(text: str) -> Tuple[str, List[int]]:
+    """
+    去掉所有空白字符, 同时返回每个字符在原文中的位置, 用于忽略换行/空格差异的定位
+    """
+    chars, positions = [], []
+    for pos, ch in enumerate(text):
+        if not ch.isspace():
+            chars.append(ch)
+            positions.append(pos)
+    return "".join(chars), positions
+
+
+def rebuild_detail(
+    blocks: Mapping[str, TaggedBlock],
+    detail_ids: List[str],
+    detail_start: Optional[str] = None,
+    detail_end: Optional[str] = None,
+) -> str:
+    """
+    按 detail_ids 拼接输入中 <text> 块的原文 (块内换行替换为空格), 得到步骤的 detail
+
+    一个文本块可能包含多个步骤, detail_start / detail_end 为步骤原文开头与结尾的几个词,
+    按忽略空白的方式在拼接结果中定位并截取, detail_end 取 detail_start 之后第一次出现的位置; 找不到时保留块的边界
+    """
+    text = " ".join(
+        " ".join(blocks[block_id].content.split())
+        for block_id in detail_ids
+        if isinstance(block_id, str) and block_id in blocks
+    )
+    stripped, positions = _strip_whitespace(text)
+    start, end = 0, len(text)
+    stripped_start = 0
+    if detail_start:
+        anchor = "".join(detail_start.split())
+        pos = stripped.find(anchor)
+        if anchor and pos >= 0:
+            start = positions[pos]
+            stripped_start = pos
+    if detail_end:
+        # 从开头定位词向后找第一个结尾定位词: 同一个块中的多个步骤 (如一对异构体) 可能以相同的文字结尾
+        anchor = "".join(detail_end.split())
+        pos = stripped.find(anchor, stripped_start)
+        if anchor and pos >= 0:
+            end = positions[pos + len(anchor) - 1] + 1
+    return text[start:end]
+
+
+def expand_compact_results(results: List[Any], input_text: str) -> List[Any]:
+    """
+    紧凑输出模式: 用输入中的原文还原每个步骤的 detail, 并去掉定位字段, 得到与普通模式相同格式的 results
+    """
+    blocks = get_tagged_document(input_text)
+    expanded = []
+    for item in results:
+        if not isinstance(item, dict):
+            expanded.append(item)
+            continue
+        detail_start = item.get(DETAIL_START_KEY)
+        detail_end = item.get(DETAIL_END_KEY)
+        detail_ids = item.get("detail_ids")
+        detail = item.get("detail")
+        if not detail and isinstance(detail_ids, list):
+            detail = rebuild_detail(blocks, detail_ids, detail_start, detail_end)
+        # detail 放回 detail_ids 之后, 与普通模式的字段顺序一致
+        new_item = {}
+        for key, value in item.items():
+            if key in (DETAIL_START_KEY, DETAIL_END_KEY, "detail"):
+                continue
+            new_item[key] = value
+            if key == "detail_ids":
+                new_item["detail"] = detail or ""
+        if "detail" not in new_item:
+            new_item["detail"] = detail or ""
+        expanded.append(new_item)
+    return expanded
@@ -1,6 +1,11 @@
+import os
 import re
 import json
+import time
 import hashlib
+from typing import Optional, Tuple
+
+from .json_stream import find_json_value
 
 
 def md5_text(text):
@@ -17,42 +22,59 @@ def md5_text(text):
     return hashlib.md5(text.encode('utf-8')).hexdigest()
 
 
-def get_json_text_from_response(response:str):
+def estimate_token_count(text: str) -> int:
     """
-    用于从 LLM 返回的结果 ResponseText 大段文本中提取出完整的 JSON-Text 部分
-    因为模型的输出不一定严格遵循JSON语法格式，该操作只是简单的对Response内容截取
-    首尾 "{", "}" 得到一个完整的JSON串。
+    粗略估计文本的 token 数, 用于限流与调度, 不追求精确
+    英文约 4 个字符一个 token, 中文约 1 个字符一个 token, 这里取折中
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
 
-    如果找不到首尾匹配的括号，则直接返回原始输出
+def extract_json_text_from_response(response: str, start_chars: str = "{") -> Tuple[str, bool]:
+    """
+    用于从 LLM 返回的结果 ResponseText 大段文本中提取出完整的 JSON-Text 部分, 返回 (json_text, 是否经过截断修复)
+    按字符串感知的括号配对扫描, 返回第一个以 start_chars 中的字符开头、完整且合法的顶层 JSON 值,
+    忽略字符串内的括号与前后的说明文字 (如 "Based on refs [1], ..." 中的 [1]);
+    输出被截断 (如达到 max_tokens) 时丢弃未完成的最后一个元素并闭合, 保留已经完整输出的部分, 此时 repaired 为 True
+
+    如果找不到合法的 JSON，则按首尾括号截取; 仍找不到时直接返回原始输出
     """
     start_json_pos = response.find('```json')
     content = response
     if start_json_pos >= 0:
         content = response[start_json_pos:]
-    l_pos = content.find('{')
-    r_pos = content.rfind('}')
+    json_text, repaired = find_json_value(content, start_chars=start_chars)
+    if json_text is not None:
+        return json_text, repaired
+    l_char = start_chars[0]
+    r_char = "}" if l_char == "{" else "]"
+    l_pos = content.find(l_char)
+    r_pos = content.rfind(r_char)
     if l_pos >= 0 and l_pos < r_pos:
-        return content[l_pos:r_pos+1]
-    return content 
+        return content[l_pos:r_pos+1], False
+    return content, False
+
+
+def get_json_text_from_response(response:str):
+    """
+    提取响应中第一个完整的 JSON 对象, 见 extract_json_text_from_response
+    """
+    json_text, _ = extract_json_text_from_response(response)
+    return json_text
 
 
 def get_json_text_of_compound_from_response(response: str) -> str:
     """
-    提取首个完整 JSON（对象或数组）：
-    - 去掉 ```json/``` 围栏
-    - 去掉常见前缀（如 'Output json results:'、'Results:' 等）
-    - 从首个 '[' 或 '{' 起，做配对扫描，截到匹配的 ']' 或 '}'
-    - 清理少量非法控制字符与尾随逗号
+    提取首个完整 JSON 数组：
+    - 跳过 ```json 围栏之前的内容以及数组之前的说明文字
+    - 从首个 '[' 起做字符串感知的配对扫描，截到匹配的 ']'
+    - 输出被截断时丢弃未完成的最后一个元素并闭合
     """
-    start_json_pos = response.find('```json')
-    content = response
-    if start_json_pos >= 0:
-        content = response[start_json_pos:]
-    l_pos = content.find('[')
-    r_pos = content.rfind(']')
-    if l_pos >= 0 and l_pos < r_pos:
-        return content[l_pos:r_pos+1]
-    return content 
+    json_text, _ = extract_json_text_from_response(response, start_chars='[')
+    return json_text
 
 
 def split_llm_thinking_content_from_response(response:str):
@@ -103,6 +125,166 @@ def write_base_model_items_to_jsonl_file(
             fp.write('\n')
 
 
+# JSONL 结果行中记录 record 原始顺序的字段, 按完成顺序写入, 转换为 JSON 数组时按它恢复输入顺序
+JSONL_ORDER_KEY = "_index"
+_JSONL_ORDER_PATTERN = re.compile((r'^\{"' + JSONL_ORDER_KEY + r'":(\d+),').encode())
+
+
+def make_ordered_jsonl_line(item_json: str, index: Optional[int]) -> str:
+    """
+    在一行 JSON 对象的开头插入 JSONL_ORDER_KEY, 便于转换时不解析整行即可取得顺序
+    """
+    if index is None or len(item_json) <= 2:
+        return item_json
+    return f'{{"{JSONL_ORDER_KEY}":{index},{item_json[1:]}'
+
+
+class JsonlResultWriter(object):
+    """
+    流式 JSONL 结果写入器: 每完成一条 record 追加一行 JSON,
+    写入经过缓冲, 每 flush_every 条 flush 一次, 每 fsync_interval 秒 fsync 一次,
+    进程崩溃时最多丢失最近一个 fsync 周期内的结果, 内存占用与数据量无关
+
+    write 传入 index 时写入 record 在输入中的位置, convert_jsonl_to_json_array_file 按它排序
+
+    用法:
+        with JsonlResultWriter(jsonl_filepath) as writer:
+            writer.write(record, index)
+    """
+
+    def __init__(self, jsonl_filepath: str, mode: str = 'a',
+                 flush_every: int = 1, fsync_interval: float = 5.0,
+                 buffering: int = 1024 * 1024):
+        self.jsonl_filepath = jsonl_filepath
+        self.flush_every = flush_every
+        self.fsync_interval = fsync_interval
+        self.count = 0
+        self._fp = open(jsonl_filepath, mode=mode, encoding='utf-8', buffering=buffering)
+        self._last_fsync = time.monotonic()
+
+    def write(self, record, index: Optional[int] = None):
+        self._fp.write(make_ordered_jsonl_line(record.model_dump_json(), index))
+        self._fp.write('\n')
+        self.count += 1
+        if self.flush_every > 0 and self.count % self.flush_every == 0:
+            self._fp.flush()
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self.fsync()
+
+    def fsync(self):
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self._last_fsync = time.monotonic()
+
+    def close(self):
+        if self._fp.closed:
+            return
+        self.fsync()
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_jsonl_file(jsonl_filepath: str):
+    """
+    逐行读取 JSONL 文件, 跳过空行以及崩溃时写了一半的末行
+    """
+    with open(jsonl_filepath, mode='r', encoding='utf-8') as fp:
+        for line in fp:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"跳过无法解析的行: {line[:80]}")
+
+
+def iter_result_items_from_file(filepath: str):
+    """
+    逐条读取结果文件中的 JSON 对象, 同时支持 JSON 数组与 JSONL 两种格式
+    JSON 数组文件若在写入中途中断(缺少结尾的 "]"), 或是旧版 is_appending 模式追加出的
+    多个数组首尾相接, 仍会返回其中全部完整的对象
+    """
+    with open(filepath, mode='r', encoding='utf-8') as fp:
+        first_char = ''
+        while not first_char:
+            chunk = fp.read(4096)
+            if not chunk:
+                return
+            first_char = chunk.lstrip()[:1]
+        if first_char != '[':
+            content = None
+        else:
+            fp.seek(0)
+            content = fp.read()
+
+    if content is None:
+        yield from iter_jsonl_file(filepath)
+        return
+
+    decoder = json.JSONDecoder()
+    pos = 0
+    while pos < len(content):
+        # 顶层对象之间只会出现空白、逗号与数组括号
+        while pos < len(content) and content[pos] in ' \t\r\n,[]':
+            pos += 1
+        if pos >= len(content):
+            return
+        try:
+            item, pos = decoder.raw_decode(content, pos)
+        except json.JSONDecodeError:
+            print(f"{filepath} 在位置 {pos} 处截断, 忽略之后的内容")
+            return
+        yield item
+
+
+def convert_jsonl_to_json_array_file(jsonl_filepath: str, json_array_filepath: str):
+    """
+    将 JSONL 结果文件转换为 JSON 数组文件 (与 write_base_model_items_to_json_array_file 格式一致)
+    带有 JSONL_ORDER_KEY 的行按其排序 (即输入顺序), 没有的行保持文件中的顺序排在之后;
+    先扫描一遍只记录每行的顺序与偏移, 再按顺序逐行转换, 不会把全部结果读入内存
+    """
+    entries = []
+    with open(jsonl_filepath, mode='rb') as fp:
+        offset = 0
+        for line_no, line in enumerate(fp):
+            if line.strip():
+                match = _JSONL_ORDER_PATTERN.match(line)
+                order = (0, int(match.group(1))) if match else (1, 0)
+                entries.append((order, line_no, offset))
+            offset += len(line)
+    entries.sort()
+
+    JSON_INDENT = 2
+    cnt = 0
+    with open(jsonl_filepath, mode='rb') as src, \
+            open(json_array_filepath, mode='w', encoding='utf-8') as fp:
+        fp.write('[\n')
+        for _, _, offset in entries:
+            src.seek(offset)
+            line = src.readline().decode('utf-8', errors='replace').strip()
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"跳过无法解析的行: {line[:80]}")
+                continue
+            if isinstance(item, dict):
+                item.pop(JSONL_ORDER_KEY, None)
+            if cnt > 0:
+                fp.write(',\n')
+            fp.write(json.dumps(item, ensure_ascii=False, indent=JSON_INDENT))
+            cnt += 1
+        if cnt > 0:
+            fp.write('\n')
+        fp.write(']\n')
+    return cnt
+
+
 def write_base_model_items_to_json_array_file(
     json_array_filepath:str, records, uid_filtering:bool=True):
 
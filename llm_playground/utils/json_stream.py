@@ -0,0 +1,213 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class IncrementalJsonParser(object):
+    """
+    流式 LLM 输出的增量 JSON 解析器
+
+    每次 feed 一段新生成的文本, 只扫描新增部分:
+    - 顶层对象中 array_key 对应数组 (默认 "results") 的每个对象元素闭合后立即解析并返回
+    - 顶层对象闭合且是合法 JSON 时 done 置为 True, 调用方可以提前结束生成, 丢弃之后的多余输出
+    - skip_until 用于跳过推理模型的 <think>...</think> 部分, 出现该标记前不做解析
+    - 顶层对象之前的说明文字、```json 围栏会被跳过; 闭合后不是合法 JSON 的花括号片段
+      (如说明文字中的 "{...}") 不会触发 done, 继续向后查找; 已返回的元素各自都是合法 JSON, 不会撤回
+    """
+
+    def __init__(self, array_key: Optional[str] = "results", skip_until: Optional[str] = None):
+        self.array_key = array_key
+        self.skip_until = skip_until
+        self.text = ""
+        self.done = False
+        self.start_pos: Optional[int] = None  # 顶层对象的起始位置
+        self.end_pos: Optional[int] = None  # 顶层对象结束后的位置
+        self.items: List[Any] = []
+        self._pos = 0  # 下一个待扫描字符
+        self._skipping = skip_until is not None
+        self._reset_object()
+
+    def _reset_object(self):
+        self.start_pos = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None  # 顶层对象中最近一个字符串 token, 用于识别 key
+        self._array_depth = None  # array_key 数组内部的深度
+        self._item_start = None
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        追加新生成的文本, 返回本次新闭合的数组元素
+        """
+        if self.done:
+            return []
+        self.text += text
+        if self._skipping:
+            marker_pos = self.text.find(self.skip_until, max(0, self._pos - len(self.skip_until)))
+            if marker_pos < 0:
+                self._pos = len(self.text)
+                return []
+            self._skipping = False
+            self._pos = marker_pos + len(self.skip_until)
+        new_items = []
+        self._scan(new_items)
+        return new_items
+
+    def _scan(self, new_items: List[Any]):
+        text = self.text
+        pos = self._pos
+        length = len(text)
+        while pos < length and not self.done:
+            char = text[pos]
+            if self.start_pos is None:
+                if char == "{":
+                    self.start_pos = pos
+                    self._depth = 1
+                pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = text[self._string_start + 1:pos]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char in "{[":
+                self._depth += 1
+                if (
+                    char == "["
+                    and self._depth == 2
+                    and self.array_key is not None
+                    and self._last_key == self.array_key
+                ):
+                    self._array_depth = 2
+                elif self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_start = pos
+            elif char in "}]":
+                self._depth -= 1
+                if self._array_depth is not None and self._depth == self._array_depth:
+                    self._emit_item(text[self._item_start:pos + 1], new_items)
+                elif self._array_depth is not None and self._depth < self._array_depth:
+                    self._array_depth = None
+                if self._depth == 0:
+                    self._close_object(pos + 1)
+            pos += 1
+        self._pos = pos
+
+    def _emit_item(self, item_text: str, new_items: List[Any]):
+        try:
+            item = json.loads(item_text)
+        except ValueError:
+            return
+        self.items.append(item)
+        new_items.append(item)
+
+    def _close_object(self, end_pos: int):
+        try:
+            json.loads(self.text[self.start_pos:end_pos])
+        except ValueError:
+            # 不是合法的 JSON 对象, 继续向后查找
+            self._reset_object()
+            return
+        self.end_pos = end_pos
+        self.done = True
+
+    def get_json_text(self) -> Optional[str]:
+        """
+        顶层对象闭合后返回其完整文本, 否则返回 None
+        """
+        if not self.done:
+            return None
+        return self.text[self.start_pos:self.end_pos]
+
+
+def _repair_truncated_json(text: str, start: int, stack: List[list]) -> Optional[str]:
+    """
+    补全被截断的 JSON: 丢弃未完成的最后一个元素, 再依次闭合未闭合的数组与对象
+    stack 中每一层为 [开括号, 该层最后一个完整元素之后的截断位置]
+    除顶层外, 未闭合的对象整体视为未完成的元素, 在其所在的上一层截断
+    """
+    level = len(stack) - 1
+    for i in range(1, len(stack)):
+        if stack[i][0] == "{":
+            level = i - 1
+            break
+    for level in range(level, -1, -1):
+        closers = "".join("}" if char == "{" else "]" for char, _ in reversed(stack[:level + 1]))
+        candidate = text[start:stack[level][1]].rstrip() + closers
+        try:
+            json.loads(candidate)
+        except ValueError:
+            continue
+        return candidate
+    return None
+
+
+def find_json_value(
+    text: str, start_chars: str = "{[", repair: bool = True
+) -> Tuple[Optional[str], bool]:
+    """
+    单次扫描 text, 返回 (第一个完整且合法的顶层 JSON 值的文本, 是否经过截断修复)
+
+    - 从 start_chars 中的字符开始做括号配对, 跳过字符串内部的括号与转义字符
+    - 闭合后不是合法 JSON 的片段 (如说明文字中的 "{...}") 与括号不匹配的片段会整体跳过, 继续向后查找
+    - 到达文本末尾仍未闭合时 (如生成达到 max_tokens), repair 为 True 则丢弃未完成的最后一个元素并闭合,
+      保留已经完整输出的部分
+    - 找不到时返回 (None, False)
+    """
+    pos = 0
+    length = len(text)
+    while pos < length:
+        start = min((p for p in (text.find(char, pos) for char in start_chars) if p >= 0), default=-1)
+        if start < 0:
+            break
+        stack = []
+        in_string = False
+        escape = False
+        next_pos = start + 1
+        for i in range(start, length):
+            char = text[i]
+            if in_string:
+                if escape:
+                    escape = False
+                elif char == "\\":
+                    escape = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                stack.append([char, i + 1])
+            elif char in "}]":
+                if stack[-1][0] != ("{" if char == "}" else "["):
+                    # 括号不匹配: 整个片段都不是合法 JSON, 跳过它而不是从片段内部重新查找, 以免把内层的值当作顶层值
+                    next_pos = i + 1
+                    break
+                stack.pop()
+                if not stack:
+                    candidate = text[start:i + 1]
+                    try:
+                        json.loads(candidate)
+                    except ValueError:
+                        next_pos = i + 1
+                        break
+                    return candidate, False
+                stack[-1][1] = i + 1
+            elif char == ",":
+                stack[-1][1] = i
+        else:
+            # 到达末尾仍未闭合; 修复失败时可能是说明文字中多余的开括号, 从下一个字符继续查找
+            if not repair:
+                break
+            candidate = _repair_truncated_json(text, start, stack)
+            if candidate is not None:
+                return candidate, True
+        pos = next_pos
+    return None, False
@@ -0,0 +1,156 @@
+import re
+import functools
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .helpers import estimate_token_count
+
+# 专利片段中的顶层标签块: <text id=...> / <mol id=...> / <table id=...> / <scheme id=...>
+TAG_BLOCK_PATTERN = re.compile(r"<(text|mol|table|scheme) id=([^>]*)>(.*?)</\1>", re.DOTALL)
+
+# 标签块的第一行是 Example / Intermediate 等标题, 或整行加粗时视为新章节的开始
+SECTION_HEADING_PATTERN = re.compile(
+    r"^\s*(?:<b>.*</b>|(?:Reference\s+|Comparative\s+)?Examples?\b|Intermediates?\b|Preparations?\b"
+    r"|Synthesis\s+of\b|实施例|中间体|制备例)",
+    re.IGNORECASE,
+)
+
+# <scheme> 表格中引用的结构名, 如 "page_12.mol_1"
+SCHEME_STRUCTURE_PATTERN = re.compile(r"\bpage_\d+\.mol_\d+\b")
+
+# 文档索引缓存的最大数量
+DOCUMENT_CACHE_SIZE = 256
+
+
+class TaggedBlock(NamedTuple):
+    """
+    一个标签块, start / end 为完整文本 (含标签及之后的游离文本) 在输入中的字符位置
+    """
+    tag: str
+    block_id: str
+    start: int
+    end: int
+    content: str  # 标签内部的文本
+    text: str  # 包含标签的完整文本
+    tokens: int
+
+    def is_section_start(self) -> bool:
+        if self.tag != "text":
+            return False
+        first_line = self.content.strip().split("\n", 1)[0]
+        return bool(SECTION_HEADING_PATTERN.match(first_line))
+
+
+def parse_tagged_blocks(text: str) -> Tuple[TaggedBlock, ...]:
+    """
+    单次扫描按顶层标签切分专利片段, 按页面顺序返回
+    标签之间的游离文本 (通常只有换行) 并入前一个标签块
+    """
+    matches = list(TAG_BLOCK_PATTERN.finditer(text))
+    blocks = []
+    for i, match in enumerate(matches):
+        end = match.end()
+        next_start = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        if text[end:next_start].strip():
+            end = next_start
+        tag, block_id, content = match.groups()
+        block_text = text[match.start():end]
+        blocks.append(TaggedBlock(
+            tag, block_id.strip(), match.start(), end, content, block_text,
+            estimate_token_count(block_text),
+        ))
+    return tuple(blocks)
+
+
+class TaggedDocument(Mapping):
+    """
+    专利片段的只读索引: block id -> TaggedBlock, 迭代顺序为页面顺序
+    第一次访问时才解析; 重复的 block id 以第一次出现的为准
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._blocks: Optional[Tuple[TaggedBlock, ...]] = None
+        self._index: Optional[Dict[str, int]] = None
+        self._structures: Optional[Dict[str, str]] = None
+
+    def _parse(self):
+        if self._blocks is None:
+            blocks = parse_tagged_blocks(self.text)
+            index = {}
+            for position, block in enumerate(blocks):
+                index.setdefault(block.block_id, position)
+            self._index = index
+            self._blocks = blocks
+
+    @property
+    def blocks(self) -> Tuple[TaggedBlock, ...]:
+        self._parse()
+        return self._blocks
+
+    def __getitem__(self, block_id: str) -> TaggedBlock:
+        self._parse()
+        return self._blocks[self._index[block_id]]
+
+    def __iter__(self) -> Iterator[str]:
+        return (block.block_id for block in self.blocks)
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def __contains__(self, block_id) -> bool:
+        self._parse()
+        return isinstance(block_id, str) and block_id in self._index
+
+    def position(self, block_id: str) -> Optional[int]:
+        """
+        block 在页面顺序中的位置, 不存在时返回 None
+        """
+        self._parse()
+        return self._index.get(block_id)
+
+    def ids(self, tag: Optional[str] = None) -> List[str]:
+        return [block.block_id for block in self.blocks if tag is None or block.tag == tag]
+
+    def get_structure_block(self, structure_id: str) -> Optional[TaggedBlock]:
+        """
+        按结构名 (如 "page_76.mol_1") 查找所在的 <mol> 块, 一个 <mol> 块中可以有多个以 ";" 或换行分隔的结构;
+        只在 <scheme> 表格的反应物/产物中出现的结构返回所在的 <scheme> 块
+        """
+        if self._structures is None:
+            structures = {}
+            for block in self.blocks:
+                if block.tag == "mol":
+                    names = re.split(r"[;\s]+", block.content)
+                elif block.tag == "scheme":
+                    names = SCHEME_STRUCTURE_PATTERN.findall(block.content)
+                else:
+                    continue
+                for name in names:
+                    if name:
+                        structures.setdefault(name, block.block_id)
+            self._structures = structures
+        block_id = self._structures.get(structure_id)
+        return None if block_id is None else self[block_id]
+
+
+@functools.lru_cache(maxsize=DOCUMENT_CACHE_SIZE)
+def get_tagged_document(text: str) -> TaggedDocument:
+    """
+    按输入文本缓存文档索引, 切分、detail 还原、id 校验等处理同一个 record 时只解析一次
+    """
+    return TaggedDocument(text)
+
+
+def get_user_content(messages: List[Dict]) -> str:
+    """
+    取 record.input 中第一条用户消息的内容, 渲染后的用户消息 role 为 "human"
+    """
+    for message in messages:
+        if message.get("role") in ("user", "human"):
+            return message.get("content") or ""
+    return ""
+
+
+def split_tagged_blocks(text: str) -> List[TaggedBlock]:
+    return list(get_tagged_document(text).blocks)
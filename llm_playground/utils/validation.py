@@ -0,0 +1,103 @@
+import difflib
+from typing import Any, Dict, List
+
+from .tagged_document import TaggedDocument
+
+# 校验问题的类型
+ISSUE_UNKNOWN_ID = "unknown_id"  # 输入中不存在的 id
+ISSUE_WRONG_BLOCK_TYPE = "wrong_block_type"  # detail_ids 不是 <text> 块, 或 structure_id 不是 <mol> 中的结构
+ISSUE_DETAIL_MISMATCH = "detail_mismatch"  # detail 与引用的文本块原文对不上
+
+# detail 中能在引用原文里按顺序找到的字符比例低于该值时视为不匹配
+DETAIL_MATCH_THRESHOLD = 0.95
+# 分段比对 detail 的段长与定位锚点的长度 (去掉空白后的字符数)
+DETAIL_MATCH_SEGMENT_SIZE = 256
+DETAIL_MATCH_ANCHOR_SIZE = 16
+
+
+def _strip_whitespace(text: str) -> str:
+    return "".join(text.split())
+
+
+def get_detail_match_ratio(detail: str, cited_text: str) -> float:
+    """
+    忽略空白字符, detail 中能在引用原文里按顺序匹配上的字符比例
+
+    SequenceMatcher 的耗时随两段文本长度之积增长, 长 detail 对长原文时可达数秒;
+    这里把 detail 按 DETAIL_MATCH_SEGMENT_SIZE 分段, 每段先在原文中精确查找,
+    找不到时用段内的短锚点定位, 只与原文中对应位置附近 2 倍段长的窗口比对, 耗时与 detail 长度成正比
+    """
+    detail = _strip_whitespace(detail)
+    cited_text = _strip_whitespace(cited_text)
+    if not detail or detail in cited_text:
+        return 1.0
+    matched, position = 0, 0
+    for start in range(0, len(detail), DETAIL_MATCH_SEGMENT_SIZE):
+        segment = detail[start:start + DETAIL_MATCH_SEGMENT_SIZE]
+        found = cited_text.find(segment, position)
+        if found >= 0:
+            matched += len(segment)
+            position = found + len(segment)
+            continue
+        position = _locate_segment(segment, cited_text, position)
+        window = cited_text[position:position + 2 * len(segment)]
+        matcher = difflib.SequenceMatcher(None, segment, window, autojunk=False)
+        matched += sum(block.size for block in matcher.get_matching_blocks())
+    return matched / len(detail)
+
+
+def _locate_segment(segment: str, cited_text: str, position: int) -> int:
+    """
+    按段内第一个能在原文 position 之后找到的锚点, 推算该段在原文中的起始位置; 都找不到时返回 position
+    """
+    for offset in range(0, len(segment) - DETAIL_MATCH_ANCHOR_SIZE + 1, DETAIL_MATCH_ANCHOR_SIZE):
+        found = cited_text.find(segment[offset:offset + DETAIL_MATCH_ANCHOR_SIZE], position)
+        if found >= 0:
+            return max(position, found - offset)
+    return position
+
+
+def make_issue(index: int, field: str, kind: str, value: Any) -> Dict[str, Any]:
+    return {"index": index, "field": field, "kind": kind, "value": value}
+
+
+def validate_results(
+    results: List[Any],
+    document: TaggedDocument,
+    detail_match_threshold: float = DETAIL_MATCH_THRESHOLD,
+) -> List[Dict[str, Any]]:
+    """
+    不调用 LLM、不依赖标准答案, 按输入的标签块索引检查预测的合成步骤, 返回发现的问题列表:
+    - detail_ids 必须是输入中存在的 <text> 块
+    - structure_id 必须是某个 <mol> 块或 <scheme> 表格中的结构名 (或 <mol> 块的 id)
+    - detail 必须能在 detail_ids 引用的原文中找到
+    """
+    issues = []
+    for index, item in enumerate(results):
+        if not isinstance(item, dict):
+            continue
+        detail_ids = item.get("detail_ids") or []
+        cited_ids = []
+        for block_id in detail_ids if isinstance(detail_ids, list) else [detail_ids]:
+            if block_id not in document:
+                issues.append(make_issue(index, "detail_ids", ISSUE_UNKNOWN_ID, block_id))
+            elif document[block_id].tag != "text":
+                issues.append(make_issue(index, "detail_ids", ISSUE_WRONG_BLOCK_TYPE, block_id))
+            else:
+                cited_ids.append(block_id)
+
+        structure_id = item.get("structure_id")
+        if structure_id and isinstance(structure_id, str):
+            if structure_id in document:
+                if document[structure_id].tag != "mol":
+                    issues.append(make_issue(index, "structure_id", ISSUE_WRONG_BLOCK_TYPE, structure_id))
+            elif document.get_structure_block(structure_id) is None:
+                issues.append(make_issue(index, "structure_id", ISSUE_UNKNOWN_ID, structure_id))
+
+        detail = item.get("detail")
+        if detail and isinstance(detail, str) and cited_ids:
+            cited_text = "".join(document[block_id].content for block_id in cited_ids)
+            ratio = get_detail_match_ratio(detail, cited_text)
+            if ratio < detail_match_threshold:
+                issues.append(make_issue(index, "detail", ISSUE_DETAIL_MISMATCH, round(ratio, 3)))
+    return issues
@@ -26,6 +26,12 @@ def test():
     return run_command(["uv", "run", "pytest", "tests/", "-v"])
 
 
+def bench():
+    """推理性能基准测试 (本地模拟服务)"""
+    print("运行推理基准测试...")
+    return run_command(["uv", "run", "python", "-m", "benchmarks.bench_inference"] + sys.argv[2:])
+
+
 def format_code():
     """格式化代码"""
     print("格式化代码...")
@@ -92,6 +98,7 @@ def main():
         print("可用命令:")
         print("  install    - 安装依赖")
         print("  test       - 运行测试")
+        print("  bench      - 推理性能基准测试")
         print("  format     - 格式化代码")
         print("  lint       - 代码检查")
         print("  type-check - 类型检查")
@@ -104,6 +111,7 @@ def main():
     commands = {
         "install": install,
         "test": test,
+        "bench": bench,
         "format": format_code,
         "lint": lint,
         "type-check": type_check,
@@ -0,0 +1,70 @@
+"""
+测试多副本负载均衡
+"""
+
+import httpx
+
+from llm_playground.core.balancer import EndpointPool, get_endpoint_pool
+from llm_playground.core.models import MODEL_CONFIGS, QWEN_STOP, get_model_endpoints
+
+
+def make_connect_error():
+    return httpx.ConnectError("connection refused")
+
+
+def test_least_outstanding_with_weights():
+    pool = EndpointPool([{"url": "a", "weight": 2}, {"url": "b"}])
+    picked = [pool.acquire().url for _ in range(6)]
+    # 权重为 2 的副本承担 2/3 的在途请求
+    assert picked.count("a") == 4
+    assert picked.count("b") == 2
+
+    a = pool.endpoints[0]
+    for _ in range(4):
+        pool.release(a, latency=0.1)
+    assert pool.acquire().url == "a"
+    assert a.latency_ewma == 0.1
+
+
+def test_passive_ejection():
+    pool = EndpointPool(
+        [{"url": "a"}, {"url": "b"}], failure_threshold=2, ejection_seconds=60
+    )
+    a, b = pool.endpoints
+    for _ in range(2):
+        a.outstanding += 1
+        pool.release(a, error=make_connect_error())
+    assert a.is_ejected(a.ejected_until - 1)
+    assert all(pool.acquire() is b for _ in range(3))
+    assert pool.stats()[0]["ejected"] is True
+
+    # 不可重试错误与副本健康无关
+    pool.release(b, error=ValueError("bad request"))
+    pool.release(b, error=ValueError("bad request"))
+    assert not b.is_ejected(0) and b.consecutive_failures == 0
+
+    # 所有副本都被摘除时, 选择最早恢复的副本
+    b.ejected_until = a.ejected_until + 10
+    assert pool.acquire() is a
+
+
+def test_get_endpoint_pool():
+    MODEL_CONFIGS["TEST_REPLICAS"] = {
+        "endpoints": [
+            {"url": "http://127.0.0.1:1/v1", "weight": 3},
+            {"url": "http://127.0.0.1:2/v1"},
+        ],
+        "name": "test",
+        "stop": QWEN_STOP,
+    }
+    try:
+        assert get_model_endpoints("TEST_REPLICAS")[1] == {
+            "url": "http://127.0.0.1:2/v1", "weight": 1.0
+        }
+        pool = get_endpoint_pool("TEST_REPLICAS")
+        assert pool is get_endpoint_pool("TEST_REPLICAS")
+        assert [e.weight for e in pool.endpoints] == [3, 1.0]
+        # 单副本的模型不需要负载均衡
+        assert get_endpoint_pool("QWEN25_32B") is None
+    finally:
+        MODEL_CONFIGS.pop("TEST_REPLICAS")
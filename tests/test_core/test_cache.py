@@ -0,0 +1,90 @@
+"""
+测试 LLM 响应缓存
+"""
+
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from llm_playground.agents.synthesis_route_desc_agents import PatentSynthesisRouteAgent
+from llm_playground.core.cache import ResponseCache
+from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+
+
+def make_record(content: str):
+    return ReactionStepDescriptionRecord(
+        id="r0", input=[{"role": "user", "content": content}], output={},
+        predict_output={}, llm_response="", model="", status="", name="",
+        header_name="",
+    )
+
+
+def test_cache_hit_skips_llm(tmp_path):
+    """相同输入第二次命中缓存, 不再调用 LLM"""
+    cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite"))
+    llm = FakeListChatModel(responses=['{"results": [{"compound_id": "1"}]}', "{}"])
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, cache=cache)
+
+    first = asyncio.run(agent.async_process(make_record("text")))
+    second = asyncio.run(agent.async_process(make_record("text")))
+    assert first.predict_output == second.predict_output
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    # 输入不同则不命中
+    third = asyncio.run(agent.async_process(make_record("other text")))
+    assert third.predict_output == {"results": []}
+
+
+def test_cache_eviction_and_bypass(tmp_path):
+    """按条数淘汰最久未访问的条目, bypass 时不读缓存"""
+    cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.stats()["entries"] == 2
+
+    cache.bypass = True
+    assert cache.get("a") is None
+
+
+def test_failed_response_not_cached(tmp_path):
+    """解析失败的响应从缓存中删除, 重新请求时得到新的响应"""
+    cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite"))
+    llm = FakeListChatModel(responses=["not json", '{"results": [{"compound_id": "1"}]}'])
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, cache=cache)
+
+    first = asyncio.run(agent.async_process_multiple([make_record("text")]))[0]
+    assert first.status == "parse_error"
+    assert first.metrics["cache_key"] and cache.stats()["entries"] == 0
+
+    second = asyncio.run(agent.async_process_multiple([make_record("text")]))[0]
+    assert second.status == "success"
+    assert second.predict_output == {"results": [{"compound_id": "1"}]}
+    assert cache.stats()["entries"] == 1
+
+
+def test_cache_hit_skips_rate_limiter(tmp_path):
+    """命中缓存的请求不申请限流配额"""
+    class CountingRateLimiter(object):
+        def __init__(self):
+            self.acquired = []
+
+        async def acquire(self, tokens):
+            self.acquired.append(tokens)
+            return tokens
+
+        def refund(self, tokens):
+            pass
+
+    cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite"))
+    limiter = CountingRateLimiter()
+    llm = FakeListChatModel(responses=['{"results": [{"compound_id": "1"}]}'])
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, cache=cache, rate_limiter=limiter)
+
+    asyncio.run(agent.async_process_multiple([make_record("text")]))
+    assert len(limiter.acquired) == 1
+    record = asyncio.run(agent.async_process_multiple([make_record("text")]))[0]
+    assert record.metrics["cached"] and len(limiter.acquired) == 1
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,63 @@
+"""
+测试共享 LLM 客户端注册表
+"""
+
+import asyncio
+
+from llm_playground.core.clients import (
+    LoopLocalAsyncClient,
+    get_shared_http_clients,
+    reset_client_registry,
+)
+from llm_playground.agents.synthesis_route_desc_agents import (
+    PatentReactionFieldAgent,
+    PatentSynthesisRouteAgent,
+)
+from llm_playground.core.models import get_chat_openai
+from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+
+
+def test_get_chat_openai_shared():
+    reset_client_registry()
+    llm1 = get_chat_openai("QWEN25_32B", max_tokens=1024)
+    llm2 = get_chat_openai("QWEN25_32B", max_tokens=1024)
+    llm3 = get_chat_openai("QWEN25_32B", max_tokens=2048)
+    llm4 = get_chat_openai("CHATDD_32B", max_tokens=1024)
+    assert llm1 is llm2
+    assert llm1 is not llm3
+    # 同一 endpoint 的客户端共享连接池
+    assert llm1.root_async_client._client is llm3.root_async_client._client
+    assert llm1.root_async_client._client is not llm4.root_async_client._client
+    assert get_chat_openai("QWEN25_32B", max_tokens=1024, shared=False) is not llm1
+    reset_client_registry()
+    assert get_chat_openai("QWEN25_32B", max_tokens=1024) is not llm1
+
+
+def test_loop_local_async_client():
+    reset_client_registry()
+    _, async_client = get_shared_http_clients("http://127.0.0.1:1/v1")
+    assert isinstance(async_client, LoopLocalAsyncClient)
+
+    async def get_inner():
+        inner = async_client._get_loop_client()
+        assert async_client._get_loop_client() is inner
+        return inner
+
+    # 不同事件循环各自使用独立的连接池
+    inner1 = asyncio.run(get_inner())
+    inner2 = asyncio.run(get_inner())
+    assert inner1 is not inner2
+    reset_client_registry()
+
+
+def test_render_messages_does_not_create_client():
+    """渲染 prompt 与预估 tokens 不创建 LLM 客户端"""
+    record = ReactionStepDescriptionRecord(
+        id="r0", input=[{"role": "user", "content": "text"}], output={},
+        predict_output={}, llm_response="", model="", status="", name="", header_name="",
+    )
+    for agent in (PatentSynthesisRouteAgent("QWEN25_32B"), PatentReactionFieldAgent("QWEN25_32B")):
+        messages = agent.render_messages(record)
+        assert "text" in messages[-1].content
+        assert agent.estimate_prompt_tokens(record) > 0
+        assert agent._llm is None
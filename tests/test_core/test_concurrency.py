@@ -0,0 +1,81 @@
+"""
+测试 AIMD 自适应并发控制
+"""
+
+import asyncio
+
+import httpx
+from pydantic import BaseModel
+
+from llm_playground.core.concurrency import AIMDController, is_overload_error
+from llm_playground.core.scheduler import iter_as_completed
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_is_overload_error():
+    assert is_overload_error(StatusError(429))
+    assert is_overload_error(StatusError(503))
+    assert is_overload_error(httpx.ReadTimeout("timeout"))
+    assert is_overload_error(asyncio.TimeoutError())
+    assert not is_overload_error(StatusError(400))
+    assert not is_overload_error(StatusError(500))
+    assert not is_overload_error(ValueError("bad json"))
+
+
+def test_additive_increase_multiplicative_decrease():
+    controller = AIMDController(initial_limit=4, max_limit=10)
+    # 每完成约一轮窗口的请求, 并发上限 +1
+    for _ in range(6):
+        controller.on_success(1.0)
+    assert controller.limit == 5
+    for _ in range(100):
+        controller.on_success(1.0)
+    assert controller.limit == 10
+    assert controller.bound(8) == 8
+
+    controller.on_error(StatusError(429))
+    assert controller.limit == 4
+    # 冷却期内的同一波拥塞不重复降低
+    controller.on_error(StatusError(429))
+    assert controller.limit == 4
+    controller.on_error(StatusError(400))
+    assert controller.summary()["decreases"] == 1
+
+
+def test_latency_spike_decrease():
+    controller = AIMDController(initial_limit=16, latency_tolerance=2.0, ewma_alpha=0.5)
+    for _ in range(10):
+        controller.on_success(1.0)
+    limit = controller.limit
+    for _ in range(3):
+        controller.on_success(5.0)
+    assert controller.limit == limit // 2
+    assert round(controller.summary()["latency_baseline"]) == 1
+
+
+class Delay(BaseModel):
+    value: float
+
+
+def test_iter_as_completed_with_controller():
+    controller = AIMDController(initial_limit=2, max_limit=2)
+    in_flight = {"now": 0, "max": 0}
+
+    async def process(item):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(item.value)
+        in_flight["now"] -= 1
+        return item.value
+
+    async def run():
+        items = [Delay(value=0.01) for _ in range(10)]
+        return [r async for r in iter_as_completed(process, items, 64, controller)]
+
+    assert len(asyncio.run(run())) == 10
+    assert in_flight["max"] == 2
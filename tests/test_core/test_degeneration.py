@@ -0,0 +1,38 @@
+"""
+测试复读检测
+"""
+
+from llm_playground.core.degeneration import (
+    DEGENERATION_LOOP,
+    DEGENERATION_REPEATED_ITEM,
+    DegenerationDetector,
+    dedupe_items,
+)
+
+
+def test_repetition_loop():
+    detector = DegenerationDetector(min_repeats=4, min_span=40)
+    prefix = '{"results": [{"name": "2-溴'
+    text = prefix + "甲基-乙基-" * 20
+    assert detector.check(text, []) == (DEGENERATION_LOOP, len(prefix) + len("甲基-乙基-"))
+
+    # 重复次数不足或重复部分太短都不算复读
+    assert detector.check(prefix + "甲基-乙基-" * 3, []) is None
+    assert detector.check(prefix + "C" * 39, []) is None
+    assert detector.check(prefix + "C" * 60, []) == (DEGENERATION_LOOP, len(prefix) + 1)
+
+
+def test_normal_json_is_not_degenerated():
+    detector = DegenerationDetector()
+    items = [{"step": i, "reactants": ["A", "B"], "product": f"P{i}"} for i in range(30)]
+    text = '{"results": [' + ", ".join(str(item) for item in items) + "]}"
+    assert detector.check(text, items) is None
+
+
+def test_repeated_item():
+    detector = DegenerationDetector(max_item_repeats=3)
+    items = [{"name": "a"}, {"name": "b"}, {"name": "a"}, {"name": "b"}]
+    assert detector.check("", items) is None
+    items.append({"name": "a"})
+    assert detector.check("text", items) == (DEGENERATION_REPEATED_ITEM, 4)
+    assert dedupe_items(items) == [{"name": "a"}, {"name": "b"}]
@@ -0,0 +1,70 @@
+"""
+测试动态 few-shot 选择
+"""
+
+from langchain_core.messages import HumanMessage
+
+from llm_playground.agents.synthesis_route_desc_agents import PatentSynthesisRouteAgent
+from llm_playground.core.fewshot import (
+    FEATURE_ISOMER,
+    FEATURE_SCHEME,
+    FewShot,
+    FewShotSelector,
+    extract_features,
+    get_patent_synthesis_few_shot_selector,
+)
+from llm_playground.core.prompts import PATENT_SYNTHESIS_SYSTEM_PROMPT
+from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+
+
+def test_extract_features():
+    assert extract_features("<scheme id=p1.i0>...</scheme>") == {FEATURE_SCHEME}
+    assert extract_features("<text id=p74.i3>\nExample 63 and 64\n</text>") == {FEATURE_ISOMER}
+    assert extract_features("<mol id=p76.i0>\npage_76.mol_0; page_76.mol_1\n</mol>") == {FEATURE_ISOMER}
+    # 柱层析的 "eluting with" 不是异构体
+    assert extract_features("purified by silica gel chromatography eluting with ethyl acetate") == set()
+
+
+def test_select_by_feature_and_budget():
+    shots = [
+        FewShot("base", "base example " * 10, always=True),
+        FewShot("scheme", "scheme reactant product " * 10, features=[FEATURE_SCHEME]),
+        FewShot("isomer_a", "first eluting isomer mixture " * 10, features=[FEATURE_ISOMER]),
+        FewShot("isomer_b", "diastereomer separated chiral column " * 10, features=[FEATURE_ISOMER]),
+    ]
+    selector = FewShotSelector(shots)
+    assert [shot.name for shot in selector.select("plain text")] == ["base"]
+    assert [shot.name for shot in selector.select("<scheme id=1> diastereomer")] == [
+        "base", "scheme", "isomer_a", "isomer_b",
+    ]
+
+    # 预算只够一个异构体示例时, 选词汇更接近的那个, 并保持库中的顺序
+    selector = FewShotSelector(shots, token_budget=shots[0].tokens + shots[3].tokens)
+    assert [shot.name for shot in selector.select("separated diastereomer on chiral column")] == [
+        "base", "isomer_b",
+    ]
+
+
+def make_record(text):
+    return ReactionStepDescriptionRecord(
+        id="r0", input=[{"role": "user", "content": text}], output={},
+        predict_output={}, llm_response="", model="", status="", name="", header_name="",
+    )
+
+
+def test_agent_renders_selected_shots():
+    agent = PatentSynthesisRouteAgent(
+        "fake", llm=lambda x: x, few_shot_selector=get_patent_synthesis_few_shot_selector()
+    )
+    full_agent = PatentSynthesisRouteAgent("fake", llm=lambda x: x)
+
+    plain = agent.render_messages(make_record("<text id=p1.i0>\nStep 1: ...\n</text>"))
+    full = full_agent.render_messages(make_record("<text id=p1.i0>\nStep 1: ...\n</text>"))
+    assert len(plain[0].content) < len(full[0].content)
+    assert "<scheme id=p12.i9>" not in plain[0].content
+
+    scheme = agent.render_messages(make_record("<scheme id=p2.i0>\n</scheme>"))
+    assert "<scheme id=p12.i9>" in scheme[0].content
+    assert isinstance(scheme[1], HumanMessage)
+    # 不传 selector 时仍使用包含全部 few-shot 的 prompt
+    assert full_agent.system_prompt == PATENT_SYNTHESIS_SYSTEM_PROMPT
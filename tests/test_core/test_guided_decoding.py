@@ -0,0 +1,72 @@
+"""
+测试约束解码的 JSON schema 生成与请求参数
+"""
+
+from langchain_core.messages import HumanMessage
+
+from llm_playground.agents.synthesis_route_desc_agents import (
+    PatentReactionFieldAgent,
+    PatentSynthesisRouteAgent,
+)
+from llm_playground.core.clients import reset_client_registry
+from llm_playground.core.guided_decoding import get_model_json_schema, make_strict_json_schema
+from llm_playground.core.models import get_chat_openai
+from llm_playground.datamodel.synthesis_route import ReactionInfo
+
+
+def test_make_strict_json_schema():
+    schema = {
+        "type": "object",
+        "properties": {
+            "a": {"type": "string", "default": ""},
+            "b": {"anyOf": [{"type": "array", "items": {"$ref": "#/$defs/C"}}, {"type": "null"}], "default": None},
+        },
+        "required": ["a"],
+        "$defs": {"C": {"type": "object", "properties": {"default": {"type": "string"}}}},
+    }
+    strict = make_strict_json_schema(schema)
+    assert strict["required"] == ["a", "b"]
+    assert strict["additionalProperties"] is False
+    assert "default" not in strict["properties"]["a"] and "default" not in strict["properties"]["b"]
+    # 名为 default 的字段不受影响
+    assert strict["$defs"]["C"]["required"] == ["default"]
+    assert schema["required"] == ["a"]
+
+
+def test_agent_output_schema():
+    agent = PatentSynthesisRouteAgent("QWEN25_32B", guided_decoding=True)
+    item = agent.get_json_schema()["properties"]["results"]["items"]
+    assert item["required"] == ["compound_id", "iupac_name", "structure_id", "detail_ids", "detail", "refs"]
+
+    agent = PatentSynthesisRouteAgent("QWEN25_32B", guided_decoding=True, compact_output=True)
+    item = agent.get_json_schema()["properties"]["results"]["items"]
+    assert item["required"] == [
+        "compound_id", "iupac_name", "structure_id", "detail_ids", "detail_start", "detail_end", "refs",
+    ]
+    assert "json_schema" in agent.get_generation_params()
+
+    assert PatentSynthesisRouteAgent("QWEN25_32B").get_json_schema() is None
+    assert PatentSynthesisRouteAgent("QWEN25_32B", guided_decoding=True, pack_size=4).get_json_schema() is None
+    assert PatentReactionFieldAgent("QWEN25_32B", guided_decoding=True).get_json_schema() == (
+        get_model_json_schema(ReactionInfo)
+    )
+
+
+def test_guided_json_request_payload():
+    reset_client_registry()
+    schema = get_model_json_schema(ReactionInfo)
+    llm = get_chat_openai("QWEN25_32B", max_tokens=1024, json_schema=schema)
+    assert llm is not get_chat_openai("QWEN25_32B", max_tokens=1024)
+    payload = llm._get_request_payload([HumanMessage(content="hi")])
+    assert payload["extra_body"] == {"guided_json": schema}
+
+
+def test_azure_response_format(monkeypatch):
+    monkeypatch.setenv("GPT_4O_API_KEY", "key")
+    monkeypatch.setenv("GPT_4O_ENDPOINT", "https://example.openai.azure.com/")
+    schema = get_model_json_schema(ReactionInfo)
+    llm = get_chat_openai("gpt-4o", json_schema=schema, shared=False)
+    payload = llm._get_request_payload([HumanMessage(content="hi")])
+    assert payload["response_format"]["type"] == "json_schema"
+    assert payload["response_format"]["json_schema"]["name"] == "ReactionInfo"
+    assert payload["response_format"]["json_schema"]["schema"] == schema
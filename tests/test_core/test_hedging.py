@@ -0,0 +1,71 @@
+"""
+测试对冲请求
+"""
+
+import time
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from llm_playground.agents.synthesis_route_desc_agents import PatentSynthesisRouteAgent
+from llm_playground.core.hedging import HedgePolicy
+
+
+class SleepLLM(object):
+    """按调用顺序依次睡眠 delays 中的秒数后返回, 记录被取消的调用"""
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def ainvoke(self, messages):
+        delay = self.delays[self.calls % len(self.delays)]
+        self.calls += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return AIMessage(content=f"slept {delay}")
+
+
+def test_hedge_policy_budget():
+    policy = HedgePolicy(percentile=50, max_hedge_ratio=0.1, min_samples=3)
+    assert policy.get_delay() is None
+    for latency in (1.0, 2.0, 3.0):
+        policy.observe(latency)
+    assert policy.get_delay() == 2.0
+
+    for _ in range(20):
+        policy.on_request()
+    assert policy.try_acquire_hedge()
+    assert policy.try_acquire_hedge()
+    # 对冲请求不超过主请求的 10%
+    assert not policy.try_acquire_hedge()
+    assert policy.summary()["hedges"] == 2
+
+
+def test_hedged_request_wins():
+    llm = SleepLLM([1.0, 0.01])
+    policy = HedgePolicy(percentile=50, max_hedge_ratio=1.0, min_samples=1)
+    policy.observe(0.05)
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, hedge_policy=policy)
+
+    started = time.monotonic()
+    response = asyncio.run(agent.ainvoke_llm([HumanMessage(content="text")]))
+    assert time.monotonic() - started < 0.5
+    assert response == "slept 0.01"
+    assert llm.calls == 2 and llm.cancelled == 1
+    assert policy.summary()["hedge_wins"] == 1
+
+
+def test_no_hedge_without_budget():
+    llm = SleepLLM([0.2, 0.01])
+    policy = HedgePolicy(percentile=50, max_hedge_ratio=0.0, min_samples=1)
+    policy.observe(0.01)
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, hedge_policy=policy)
+
+    response = asyncio.run(agent.ainvoke_llm([HumanMessage(content="text")]))
+    assert response == "slept 0.2"
+    assert llm.calls == 1
@@ -0,0 +1,150 @@
+"""
+测试多个短 record 打包为一个请求
+"""
+
+import re
+import json
+import asyncio
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from llm_playground.agents.synthesis_route_desc_agents import PatentSynthesisRouteAgent
+from llm_playground.core.degeneration import DegenerationDetector
+from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+
+
+class PackLLM(object):
+    """打包请求按 record id 返回结果, 跳过 drop_ids 中的 record; 单独请求直接返回输入文本"""
+
+    def __init__(self, drop_ids=()):
+        self.drop_ids = set(drop_ids)
+        self.calls = []
+
+    def __call__(self, messages):
+        return messages
+
+    async def ainvoke(self, messages):
+        content = messages[-1].content
+        record_ids = re.findall(r'<record id="(r\d+)">', content)
+        self.calls.append(record_ids)
+        await asyncio.sleep(0)
+        if record_ids:
+            records = {
+                record_id: {"results": [{"compound_id": record_id}]}
+                for record_id in record_ids if record_id not in self.drop_ids
+            }
+            return AIMessage(content="```json\n" + json.dumps({"records": records}) + "\n```")
+        text = re.search(r"<text id=t>(.*?)</text>", content).group(1)
+        return AIMessage(content=json.dumps({"results": [{"compound_id": text}]}))
+
+
+def make_records(n, size=20):
+    return [
+        ReactionStepDescriptionRecord(
+            id=f"r{i}", input=[{"role": "user", "content": f"<text id=t>r{i}</text>" + " " * size}],
+            output={}, predict_output={}, llm_response="", model="", status="", name="", header_name="",
+        )
+        for i in range(n)
+    ]
+
+
+def test_pack_records():
+    llm = PackLLM()
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, pack_size=3)
+    records = make_records(7)
+    new_records = asyncio.run(agent.async_process_multiple(records, max_batch_size=4))
+    # 剩下的一个 record 单独请求
+    assert sorted(len(ids) for ids in llm.calls) == [0, 3, 3]
+    assert [r.predict_output["results"][0]["compound_id"] for r in new_records] == [r.id for r in records]
+    assert all(r.status == "success" for r in new_records)
+    # 原始 records 不变
+    assert records[0].predict_output == {}
+
+
+def test_pack_respects_token_limit():
+    agent = PatentSynthesisRouteAgent("fake", llm=PackLLM(), pack_size=8, pack_max_tokens=35)
+    records = make_records(4, size=40)
+    assert agent.make_packs(records, range(4)) == [[0, 1], [2, 3]]
+    records = make_records(2, size=100)
+    assert agent.make_packs(records, [1, 0]) == [[1], [0]]
+
+
+def test_pack_falls_back_on_missing_record():
+    llm = PackLLM(drop_ids={"r1"})
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, pack_size=3)
+    new_records = asyncio.run(agent.async_process_multiple(make_records(3)))
+    assert llm.calls == [["r0", "r1", "r2"], []]
+    assert [r.predict_output["results"][0]["compound_id"] for r in new_records] == ["r0", "r1", "r2"]
+    # 打包得到结果的 record 保留打包请求的原始响应
+    assert new_records[0].llm_response.startswith("```json")
+    assert new_records[1].llm_response == json.dumps({"results": [{"compound_id": "r1"}]})
+
+
+def test_pack_truncated_response_falls_back_for_last_record():
+    agent = PatentSynthesisRouteAgent("fake", llm=PackLLM(), pack_size=3)
+    response = '{"r0": [{"compound_id": "r0"}], "r1": [{"compound_id": "r1"}, {"comp'
+    # 最后一个 record 的 results 可能不完整, 不计入打包结果
+    assert agent.split_pack_response(response) == {"r0": [{"compound_id": "r0"}]}
+
+
+class RecordingRateLimiter(object):
+    def __init__(self):
+        self.acquired = []
+        self.refunded = []
+
+    async def acquire(self, tokens):
+        self.acquired.append(tokens)
+        return tokens
+
+    def refund(self, tokens):
+        self.refunded.append(tokens)
+
+
+def test_pack_fallback_acquires_quota():
+    limiter = RecordingRateLimiter()
+    llm = PackLLM(drop_ids={"r1"})
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, pack_size=3, rate_limiter=limiter)
+    asyncio.run(agent.async_process_multiple(make_records(3)))
+    # 打包请求与回退的单独请求各自申请配额
+    assert len(limiter.acquired) == 2
+    assert limiter.acquired[0] > limiter.acquired[1]
+
+
+class StreamPackLLM(PackLLM):
+    """流式返回; degenerate 为 True 时打包请求陷入复读"""
+
+    def __init__(self, degenerate=False):
+        super().__init__()
+        self.degenerate = degenerate
+
+    async def astream(self, messages):
+        content = messages[-1].content
+        if self.degenerate and '<record id="' in content:
+            self.calls.append(re.findall(r'<record id="(r\d+)">', content))
+            text = '{"records": {"r0": {"results": [' + '{"compound_id": "r0"}, ' * 100
+        else:
+            text = (await self.ainvoke(messages)).content
+        for i in range(0, len(text), 8):
+            await asyncio.sleep(0)
+            yield AIMessageChunk(content=text[i:i + 8])
+
+
+def test_failed_pack_falls_back_to_single_requests():
+    llm = StreamPackLLM(degenerate=True)
+    agent = PatentSynthesisRouteAgent(
+        "fake", llm=llm, pack_size=3, streaming=True, degeneration_detector=DegenerationDetector()
+    )
+    new_records = asyncio.run(agent.async_process_multiple(make_records(3)))
+    assert sorted(len(ids) for ids in llm.calls) == [0, 0, 0, 3]
+    assert [r.status for r in new_records] == ["success"] * 3
+    assert [r.predict_output["results"][0]["compound_id"] for r in new_records] == ["r0", "r1", "r2"]
+
+
+def test_packed_records_emit_stream_items():
+    emitted = []
+    agent = PatentSynthesisRouteAgent(
+        "fake", llm=StreamPackLLM(), pack_size=3, streaming=True,
+        on_stream_item=lambda record, item: emitted.append((record.id, item["compound_id"])),
+    )
+    asyncio.run(agent.async_process_multiple(make_records(3)))
+    assert sorted(emitted) == [("r0", "r0"), ("r1", "r1"), ("r2", "r2")]
@@ -0,0 +1,62 @@
+"""
+测试令牌桶限流
+"""
+
+from llm_playground.core.ratelimit import TokenBucket, RateLimiter, get_rate_limiter
+
+
+def test_token_bucket_reserve():
+    """令牌耗尽后按补充速度计算等待时间"""
+    bucket = TokenBucket(capacity=2, rate=1.0)
+    now = bucket._last
+    assert bucket.reserve(1, now) == 0.0
+    assert bucket.reserve(1, now) == 0.0
+    assert bucket.reserve(1, now) == 1.0
+    assert bucket.reserve(1, now) == 2.0
+    # 超过容量的申请全额扣减, 等待补足差额
+    assert bucket.reserve(100, now + 10) == 98.0
+    assert bucket.reserve(1, now + 10) == 99.0
+
+
+def test_rate_limiter_never_exceeds_quota():
+    """任意 60 秒内预约的请求数不超过 rpm"""
+    limiter = RateLimiter(rpm=60)
+    waits = [limiter.reserve() for _ in range(200)]
+    assert sum(1 for w in waits if w < 60) <= 60
+
+
+def test_rate_limiter_tokens():
+    """tokens 配额同样生效, 归还后可立即再次使用"""
+    limiter = RateLimiter(tpm=7000, burst_seconds=10)
+    assert limiter.reserve(1000) == 0.0
+    assert limiter.reserve(1000) > 0
+    limiter.refund(2000)
+    assert limiter.reserve(1000) == 0.0
+
+
+def test_get_rate_limiter_shared():
+    """同一模型共享限流器, 未配置配额的模型没有限流器"""
+    assert get_rate_limiter("gpt-4o") is get_rate_limiter("gpt-4o")
+    assert get_rate_limiter("QWEN25_32B") is None
+
+
+def test_rate_limiter_large_request_not_capped():
+    """单次 tokens 超过桶容量时按全额计, 60 秒内预约的 tokens 不超过 tpm"""
+    limiter = RateLimiter(tpm=40000)
+    waits = [limiter.reserve(19000) for _ in range(10)]
+    assert sum(19000 for w in waits if w < 60) <= 40000
+
+
+def test_rate_limiter_acquire_returns_debited_tokens():
+    """acquire 返回实际扣减的 tokens, 只有配置了 tpm 时才扣减"""
+    import asyncio
+
+    assert asyncio.run(RateLimiter(tpm=7000).acquire(100)) == 100
+    assert asyncio.run(RateLimiter(rpm=60).acquire(100)) == 0
+    # 按实际扣减量归还后, 60 秒内的实际用量仍不超过 tpm
+    limiter = RateLimiter(tpm=40000)
+    waits = []
+    for _ in range(5):
+        waits.append(limiter.reserve(12000))
+        limiter.refund(12000 - 11000)
+    assert sum(11000 for w in waits if w < 60) <= 40000
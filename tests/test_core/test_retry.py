@@ -0,0 +1,64 @@
+"""
+测试重试与错误分类
+"""
+
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from llm_playground.core.retry import (
+    RetryPolicy,
+    LLMCallError,
+    classify_error,
+    get_retry_after,
+    RETRYABLE,
+    FATAL,
+)
+
+
+def make_status_error(status_code: int, headers=None):
+    request = httpx.Request("POST", "http://localhost/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+def test_classify_error():
+    assert classify_error(make_status_error(429)) == RETRYABLE
+    assert classify_error(make_status_error(503)) == RETRYABLE
+    assert classify_error(make_status_error(401)) == FATAL
+    assert classify_error(ConnectionResetError()) == RETRYABLE
+    assert classify_error(asyncio.TimeoutError()) == RETRYABLE
+    assert classify_error(ValueError("bad request")) == FATAL
+
+
+def test_retry_after_header():
+    assert get_retry_after(make_status_error(429, {"retry-after": "3"})) == 3.0
+    assert get_retry_after(make_status_error(429, {"retry-after-ms": "500"})) == 0.5
+    assert get_retry_after(make_status_error(429)) is None
+
+
+def test_retry_policy_retries_transient_errors():
+    """可重试错误按策略重试, 不可重试错误立即失败"""
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise make_status_error(503, {"retry-after": "0"})
+        return "ok"
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0.0)
+    assert asyncio.run(policy.arun(flaky)) == "ok"
+    assert len(calls) == 3
+
+    async def fatal():
+        calls.append(1)
+        raise make_status_error(400)
+
+    calls.clear()
+    with pytest.raises(LLMCallError) as exc_info:
+        asyncio.run(policy.arun(fatal))
+    assert exc_info.value.kind == FATAL
+    assert len(calls) == 1
@@ -0,0 +1,172 @@
+"""
+测试滑动窗口并发调度
+"""
+
+import asyncio
+
+from pydantic import BaseModel
+
+from llm_playground.core.baseagent import TaskAgent
+from llm_playground.core.scheduler import get_dispatch_order, iter_as_completed
+
+
+class Delay(BaseModel):
+    seconds: float
+
+
+class SleepAgent(TaskAgent):
+    """按 record 中给定的秒数 sleep 的假代理, 用于观察调度行为"""
+
+    def __init__(self, **kwargs):
+        super().__init__(llm_name="fake", llm=object(), **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started = []
+
+    def init_process_chain(self):
+        return None
+
+    def post_process_response(self, record, response: str):
+        return record
+
+    def process(self, record):
+        return record
+
+    def estimate_prompt_tokens(self, record) -> int:
+        return int(record.seconds * 1000)
+
+    async def async_process(self, record):
+        self.started.append(record.seconds)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(record.seconds)
+        self.in_flight -= 1
+        return record.seconds
+
+
+def test_iter_as_completed_keeps_window_full():
+    """慢请求不应阻塞后续请求的补位"""
+
+    async def run():
+        started = []
+
+        async def process(delay):
+            started.append(delay)
+            await asyncio.sleep(delay)
+            return delay
+
+        items = [0.3] + [0.01] * 10
+        results = [x async for x in iter_as_completed(process, items, max_concurrency=2)]
+        return started, results
+
+    started, results = asyncio.run(run())
+    assert len(started) == 11
+    # 慢请求最后完成, 其它请求按下标在它之前完成
+    assert results[-1] == (0, 0.3)
+    assert sorted(idx for idx, _ in results) == list(range(11))
+
+
+def test_async_process_multiple_preserves_order():
+    """结果按原始顺序返回, 且在途请求数不超过上限"""
+    agent = SleepAgent()
+    delays = [0.05, 0.01, 0.03, 0.0, 0.02]
+    records = [Delay(seconds=delay) for delay in delays]
+    new_records = asyncio.run(agent.async_process_multiple(records, max_batch_size=3))
+    assert new_records == delays
+    assert agent.max_in_flight == 3
+
+
+def test_get_dispatch_order():
+    costs = [3, 1, 2, 1]
+    assert get_dispatch_order(costs) == [0, 1, 2, 3]
+    assert get_dispatch_order(costs, "longest_first") == [0, 2, 1, 3]
+    assert get_dispatch_order(costs, "shortest_first") == [1, 3, 2, 0]
+    assert get_dispatch_order(costs, lambda c: [3, 2, 1, 0]) == [3, 2, 1, 0]
+
+
+def test_iter_as_completed_cost_budget():
+    """在途 cost 之和不超过预算, 放不下时按 first-fit 选择后面更小的 item"""
+
+    async def run():
+        in_flight = []
+        started = []
+        max_cost = 0
+
+        async def process(cost):
+            nonlocal max_cost
+            started.append(cost)
+            in_flight.append(cost)
+            max_cost = max(max_cost, sum(in_flight))
+            await asyncio.sleep(0.01 * cost)
+            in_flight.remove(cost)
+            return cost
+
+        costs = [6, 5, 2, 12, 1]
+        results = [
+            x async for x in iter_as_completed(
+                process, costs, max_concurrency=8, costs=costs, cost_budget=8
+            )
+        ]
+        return results, started, max_cost
+
+    results, started, max_cost = asyncio.run(run())
+    assert started == [6, 2, 1, 5, 12]
+    # 超出预算的 12 在没有其他在途请求时单独派发
+    assert max_cost == 12
+    assert sorted(idx for idx, _ in results) == list(range(5))
+
+
+def test_longest_first_preserves_result_order():
+    agent = SleepAgent(dispatch_order="longest_first")
+    delays = [0.01, 0.03, 0.0, 0.02]
+    records = [Delay(seconds=delay) for delay in delays]
+    new_records = asyncio.run(agent.async_process_multiple(records, max_batch_size=1))
+    assert agent.started == [0.03, 0.02, 0.01, 0.0]
+    assert new_records == delays
+
+
+class Part(BaseModel):
+    id: str
+    input: list
+    llm_response: str = ""
+    model: str = ""
+    metrics: dict = None
+    predict_output: dict = {}
+    status: str = ""
+
+
+class SplitAgent(SleepAgent):
+    """把 input 中的每条消息拆分为一个部分, 使用默认的合并"""
+
+    STREAM_ARRAY_KEY = "results"
+
+    def estimate_prompt_tokens(self, record) -> int:
+        return 1
+
+    def split_record(self, record):
+        if len(record.input) <= 1:
+            return None
+        return [record.model_copy(update={"input": [message]}) for message in record.input]
+
+    async def async_process(self, record):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        content = record.input[0]
+        record.llm_response = content
+        record.predict_output = {"results": [content], "first": content}
+        record.status = "success" if content != "bad" else "parse_error"
+        return record
+
+
+def test_split_records_are_merged_by_default():
+    agent = SplitAgent()
+    records = [Part(id="a", input=["x", "y", "z"]), Part(id="b", input=["w"]), Part(id="c", input=["u", "bad"])]
+    new_records = asyncio.run(agent.async_process_multiple(records, max_batch_size=2))
+    assert agent.max_in_flight == 2
+    assert new_records[0].input == ["x", "y", "z"]
+    assert new_records[0].predict_output == {"results": ["x", "y", "z"], "first": "x"}
+    assert new_records[0].llm_response == "x\n\ny\n\nz" and new_records[0].status == "success"
+    assert new_records[1].predict_output == {"results": ["w"], "first": "w"}
+    assert new_records[2].status == "parse_error"
@@ -0,0 +1,100 @@
+"""
+测试流式调用的增量解析与提前结束
+"""
+
+import asyncio
+
+from langchain_core.messages import AIMessageChunk, HumanMessage
+
+from llm_playground.agents.synthesis_route_desc_agents import PatentSynthesisRouteAgent
+from llm_playground.core.baseagent import FINISH_REASON_EARLY_STOP, STATUS_DEGENERATED
+from llm_playground.core.degeneration import DegenerationDetector
+from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+
+
+class Record(object):
+    metrics = None
+
+
+class StreamLLM(object):
+    """把 text 切成固定长度的 chunk 逐个返回, 记录已生成的 chunk 数与流是否被关闭"""
+
+    def __init__(self, text, chunk_size=5):
+        self.chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self.generated = 0
+        self.closed = False
+
+    async def astream(self, messages):
+        try:
+            for chunk in self.chunks:
+                self.generated += 1
+                await asyncio.sleep(0)
+                yield AIMessageChunk(content=chunk)
+        finally:
+            self.closed = True
+
+
+def test_stream_items_and_early_stop():
+    text = '```json\n{"results": [{"name": "a"}, {"name": "b"}]}\n```' + " 多余的输出" * 20
+    llm = StreamLLM(text)
+    emitted = []
+    agent = PatentSynthesisRouteAgent(
+        "fake", llm=llm, streaming=True,
+        on_stream_item=lambda record, item: emitted.append((record, item)),
+    )
+
+    record = Record()
+    response = asyncio.run(agent.ainvoke_llm([HumanMessage(content="text")], record=record))
+    assert emitted == [(record, {"name": "a"}), (record, {"name": "b"})]
+    assert response.startswith("```json") and "多余" not in response
+    assert llm.generated < len(llm.chunks) and llm.closed
+    assert record.metrics["finish_reason"] == FINISH_REASON_EARLY_STOP
+    # 提前结束收不到 usage, 按文本预估 token 数
+    assert record.metrics["prompt_tokens"] == 1
+    assert record.metrics["completion_tokens"] > 0
+
+
+def test_stream_without_early_stop():
+    text = '{"results": [{"name": "a"}]} done'
+    llm = StreamLLM(text)
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, streaming=True, stream_early_stop=False)
+    response = asyncio.run(agent.ainvoke_llm([HumanMessage(content="text")]))
+    assert response == text
+    assert llm.generated == len(llm.chunks)
+
+
+def test_degenerated_stream_keeps_valid_prefix():
+    item = '{"name": "a"}, '
+    text = '{"results": [{"name": "x"}, ' + item * 50 + "]}"
+    llm = StreamLLM(text)
+    agent = PatentSynthesisRouteAgent(
+        "fake", llm=llm, streaming=True, degeneration_detector=DegenerationDetector()
+    )
+    record = ReactionStepDescriptionRecord(
+        id="r0", input=[{"role": "user", "content": "text"}], output={},
+        predict_output={}, llm_response="", model="", status="", name="", header_name="",
+    )
+    record = asyncio.run(agent.async_process(record))
+    assert record.status == STATUS_DEGENERATED
+    assert record.predict_output == {"results": [{"name": "x"}, {"name": "a"}]}
+    assert record.llm_response.startswith('{"results": [{"name": "x"}, {"name": "a"}')
+    assert llm.generated < len(llm.chunks) and llm.closed
+
+
+def test_degenerated_compact_output_is_expanded():
+    item = '{"compound_id": "a", "detail_ids": ["t1"], "detail_start": "To", "detail_end": "B."}, '
+    llm = StreamLLM('{"results": [' + item * 50 + "]}")
+    agent = PatentSynthesisRouteAgent(
+        "fake", llm=llm, streaming=True, compact_output=True, degeneration_detector=DegenerationDetector()
+    )
+    text = "<text id=t1>\nTo A was added\nB. Then C.\n</text>"
+    record = ReactionStepDescriptionRecord(
+        id="r0", input=[{"role": "user", "content": text}], output={},
+        predict_output={}, llm_response="", model="", status="", name="", header_name="",
+    )
+    record = asyncio.run(agent.async_process(record))
+    # 与正常输出的 results 格式相同
+    assert record.status == STATUS_DEGENERATED
+    assert record.predict_output == {
+        "results": [{"compound_id": "a", "detail_ids": ["t1"], "detail": "To A was added B."}]
+    }
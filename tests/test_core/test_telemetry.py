@@ -0,0 +1,60 @@
+"""
+测试请求耗时与 token 统计
+"""
+
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from llm_playground.agents.synthesis_route_desc_agents import PatentSynthesisRouteAgent
+from llm_playground.core.telemetry import (
+    AgentTelemetry,
+    RequestMetrics,
+    percentile,
+    write_prometheus_textfile,
+)
+from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50.5
+    assert percentile(values, 99) == 99.01
+    assert percentile([], 50) is None
+
+
+def test_summary_and_prometheus(tmp_path):
+    telemetry = AgentTelemetry("Agent_fake")
+    for i in range(10):
+        telemetry.record(RequestMetrics(
+            latency=1.0 + i, started_at=0.0, prompt_tokens=100,
+            completion_tokens=50, finish_reason="stop",
+        ))
+    telemetry.record(RequestMetrics(latency=0.0, cached=True))
+    summary = telemetry.summary()
+    assert summary["requests"] == 10 and summary["cached"] == 1
+    assert summary["completion_tokens"] == 500
+    assert summary["completion_tokens_per_sec"] == 50.0
+    assert summary["finish_reasons"] == {"stop": 10}
+
+    prom_filepath = tmp_path / "telemetry.prom"
+    write_prometheus_textfile(str(prom_filepath), [telemetry])
+    text = prom_filepath.read_text()
+    assert 'llm_request_latency_seconds{agent="Agent_fake",quantile="0.5"} 5.5' in text
+    assert 'llm_completion_tokens_total{agent="Agent_fake"} 500' in text
+
+
+def test_streaming_agent_records_metrics():
+    """流式调用时记录 time to first token, 并附加到 record.metrics"""
+    llm = FakeListChatModel(responses=['{"results": []}'])
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, streaming=True)
+    record = ReactionStepDescriptionRecord(
+        id="r0", input=[{"role": "user", "content": "text"}], output={},
+        predict_output={}, llm_response="", model="", status="", name="",
+        header_name="",
+    )
+    new_records = asyncio.run(agent.async_process_multiple([record]))
+    metrics = new_records[0].metrics
+    assert metrics["ttft"] is not None and metrics["queue_wait"] is not None
+    assert new_records[0].llm_response == '{"results": []}'
+    assert agent.telemetry.summary()["requests"] == 1
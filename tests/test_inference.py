@@ -0,0 +1,112 @@
+"""
+测试 InferenceRunner 的流式输出与断点续跑
+"""
+
+import json
+import asyncio
+
+from llm_playground.core.baseagent import TaskAgent
+from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+from llm_playground.inference import InferenceRunner
+
+
+class EchoAgent(TaskAgent):
+    """不调用 LLM, 直接把 record id 写入 predict_output 的假代理"""
+
+    def __init__(self):
+        super().__init__(llm_name="fake", llm=object())
+        self.processed_ids = []
+
+    def init_process_chain(self):
+        return None
+
+    def post_process_response(self, record, response: str):
+        record.predict_output = {"results": [{"detail": response}]}
+        return record
+
+    def process(self, record):
+        return self.post_process_response(record, record.id)
+
+    async def async_process(self, record):
+        self.processed_ids.append(record.id)
+        # 编号越小完成越晚, 完成顺序与输入顺序相反
+        await asyncio.sleep(0.01 * (10 - int(record.id[1:])))
+        return self.post_process_response(record, record.id)
+
+
+def make_records(n: int):
+    return [
+        ReactionStepDescriptionRecord(
+            id=f"r{i}", input=[{"role": "user", "content": f"text {i}"}], output={},
+            predict_output={}, llm_response="", model="", status="", name="",
+            header_name="",
+        )
+        for i in range(n)
+    ]
+
+
+def load_ids(filepath):
+    with open(filepath, encoding="utf-8") as fp:
+        return [item["id"] for item in json.load(fp)]
+
+
+def test_run_jsonl_output(tmp_path):
+    """jsonl 模式同时产出 JSONL 与 JSON 数组文件"""
+    agent = EchoAgent()
+    runner = InferenceRunner([agent], str(tmp_path), make_records(5), output_format="jsonl")
+    runner.run_in_sequence(max_batch_size=2)
+    assert load_ids(tmp_path / "EchoAgent_fake.json") == [f"r{i}" for i in range(5)]
+    # JSONL 按完成顺序写入, 每行带有输入顺序
+    items = [json.loads(line) for line in (tmp_path / "EchoAgent_fake.jsonl").read_text().splitlines()]
+    assert [item["id"] for item in items] != [f"r{i}" for i in range(5)]
+    assert all(item["_index"] == int(item["id"][1:]) for item in items)
+
+
+def test_resume_only_runs_remaining(tmp_path):
+    """resume 只请求缺失与失败的 record, 并合并为合法的 JSON 输出"""
+    records = make_records(4)
+    records[0].predict_output = {"results": []}
+    records[1].predict_output = {}  # 失败的 record
+    # 模拟中断: 只写出了前两条, 数组没有闭合
+    with open(tmp_path / "EchoAgent_fake.json", "w", encoding="utf-8") as fp:
+        fp.write("[\n" + records[0].model_dump_json(indent=2) + ",\n")
+        fp.write(records[1].model_dump_json(indent=2) + ",\n{\"id\": \"r2\", ")
+
+    agent = EchoAgent()
+    runner = InferenceRunner([agent], str(tmp_path), make_records(4), resume=True)
+    runner.run_in_sequence()
+    assert sorted(agent.processed_ids) == ["r1", "r2", "r3"]
+    assert load_ids(tmp_path / "EchoAgent_fake.json") == ["r0", "r1", "r2", "r3"]
+
+
+def test_run_in_event_loop_shares_records(tmp_path):
+    """多个 agent 共用一个事件循环, 原始 records 不被修改"""
+
+    class OtherEchoAgent(EchoAgent):
+        pass
+
+    records = make_records(3)
+    agents = [EchoAgent(), OtherEchoAgent()]
+    runner = InferenceRunner(agents, str(tmp_path), records)
+    runner.run_in_event_loop(max_batch_size=2, max_batch_sizes={"OtherEchoAgent_fake": 1})
+    assert load_ids(tmp_path / "EchoAgent_fake.json") == ["r0", "r1", "r2"]
+    assert load_ids(tmp_path / "OtherEchoAgent_fake.json") == ["r0", "r1", "r2"]
+    assert all(record.predict_output == {} for record in records)
+
+
+def test_jsonl_append_keeps_input_order(tmp_path):
+    """追加模式下新结果排在已有结果之后, 各自保持输入顺序"""
+    records = make_records(6)
+    InferenceRunner([EchoAgent()], str(tmp_path), records[:3], output_format="jsonl").run_in_sequence()
+    InferenceRunner(
+        [EchoAgent()], str(tmp_path), records[3:], output_format="jsonl", is_appending=True,
+    ).run_in_sequence()
+    assert load_ids(tmp_path / "EchoAgent_fake.json") == [f"r{i}" for i in range(6)]
+
+
+def test_truncated_items_are_completed_unless_requested(tmp_path):
+    """被截断的 record 默认视为已完成, 只有在 resume_statuses 中指定时才重新请求"""
+    item = {"id": "r0", "predict_output": {"results": [{"detail": "r0"}]}, "status": "truncated"}
+    assert InferenceRunner([EchoAgent()], str(tmp_path), [], resume=True).is_completed_item(item)
+    runner = InferenceRunner([EchoAgent()], str(tmp_path), [], resume=True, resume_statuses={"truncated"})
+    assert not runner.is_completed_item(item)
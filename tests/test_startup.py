@@ -0,0 +1,46 @@
+"""
+测试包的导入耗时与按需加载
+"""
+
+import sys
+import time
+import subprocess
+
+# import llm_playground 的耗时上限 (秒, 包含解释器启动)
+STARTUP_TIME_LIMIT = 0.5
+
+
+def run_python(code: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def test_import_time():
+    """取 3 次中最快的一次, 减少机器抖动的影响"""
+    elapsed = []
+    for _ in range(3):
+        started = time.perf_counter()
+        run_python("import llm_playground")
+        elapsed.append(time.perf_counter() - started)
+    assert min(elapsed) < STARTUP_TIME_LIMIT, elapsed
+
+
+def test_heavy_modules_are_lazy():
+    code = (
+        "import sys, llm_playground.agents.synthesis_route_desc_agents as m\n"
+        "from llm_playground.core import models\n"
+        "print(','.join(name for name in ('langchain_openai', 'langchain_core.prompts', 'dotenv')"
+        " if name in sys.modules), models._env_loaded)"
+    )
+    assert run_python(code) == "False"
+
+
+def test_lazy_attributes():
+    code = (
+        "import sys, llm_playground\n"
+        "assert 'llm_playground.core.baseagent' not in sys.modules\n"
+        "print(llm_playground.TaskAgent.__name__, llm_playground.helpers.__name__)"
+    )
+    assert run_python(code) == "TaskAgent llm_playground.utils.helpers"
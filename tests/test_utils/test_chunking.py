@@ -0,0 +1,141 @@
+"""
+测试专利片段的分窗口切分与结果合并
+"""
+
+import re
+import json
+import asyncio
+
+from langchain_core.messages import AIMessage
+
+from llm_playground.agents.synthesis_route_desc_agents import PatentSynthesisRouteAgent
+from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+from llm_playground.utils.chunking import (
+    TaggedTextChunker,
+    merge_window_results,
+    split_tagged_blocks,
+)
+
+
+def make_text(n_examples=4, steps=3):
+    blocks = []
+    for i in range(n_examples):
+        blocks.append(f"<text id=p{i}.i0>\nExample {i}\n</text>")
+        blocks.append(f"<mol id=p{i}.i1>\npage_{i}.mol_0\n</mol>")
+        for j in range(steps):
+            blocks.append(f"<text id=p{i}.s{j}>\nStep {j + 1}: " + "stirred at rt. " * 20 + "\n</text>")
+    return "\n".join(blocks)
+
+
+def test_split_tagged_blocks():
+    blocks = split_tagged_blocks("<text id=a>\nExample 1\n</text>\n<mol id=b>\nm\n</mol>")
+    assert [(b.tag, b.block_id) for b in blocks] == [("text", "a"), ("mol", "b")]
+    assert blocks[0].is_section_start() and not blocks[1].is_section_start()
+
+
+def test_short_text_is_not_split():
+    text = make_text(n_examples=1)
+    windows = TaggedTextChunker(max_tokens=10000).split(text)
+    assert len(windows) == 1 and windows[0].text == text
+
+
+def test_split_at_section_boundaries():
+    text = make_text()
+    blocks = split_tagged_blocks(text)
+    section_tokens = sum(b.tokens for b in blocks[:5])
+    windows = TaggedTextChunker(max_tokens=section_tokens * 2 + blocks[4].tokens, overlap_blocks=1).split(text)
+    assert len(windows) == 2
+    assert windows[0].block_ids[0] == "p0.i0" and not windows[0].overlap_ids
+    # 第二个窗口从 Example 2 开始, 前面重复上一个窗口的最后一个标签块
+    assert windows[1].block_ids[:2] == ["p1.s2", "p2.i0"]
+    assert windows[1].overlap_ids == {"p1.s2"}
+    # 所有标签块都被覆盖
+    covered = {block_id for w in windows for block_id in w.block_ids}
+    assert covered == {b.block_id for b in blocks}
+
+
+def test_long_section_is_split_at_blocks():
+    text = make_text(n_examples=1, steps=6)
+    windows = TaggedTextChunker(max_tokens=200, overlap_blocks=0).split(text)
+    assert len(windows) > 1
+    assert all(w.tokens <= 200 for w in windows)
+
+
+def test_merge_window_results():
+    text = make_text()
+    blocks = split_tagged_blocks(text)
+    section_tokens = sum(b.tokens for b in blocks[:5])
+    windows = TaggedTextChunker(max_tokens=section_tokens * 2 + blocks[4].tokens).split(text)
+    step = {"compound_id": "Example 1", "structure_id": "", "detail_ids": ["p1.s2"]}
+    results = [
+        [{"compound_id": "", "structure_id": "", "detail_ids": ["p0.s0"]}, step],
+        [
+            # 只落在重叠部分的步骤属于上一个窗口
+            {"compound_id": "", "structure_id": "", "detail_ids": ["p1.s2"]},
+            {"compound_id": "Example 2", "structure_id": "", "detail_ids": ["p2.s0", "p1.s2"]},
+            {"compound_id": "Example 2", "structure_id": "", "detail_ids": ["p1.s2", "p2.s0"]},
+        ],
+    ]
+    merged = merge_window_results(windows, results)
+    assert [item["detail_ids"] for item in merged] == [["p0.s0"], ["p1.s2"], ["p2.s0", "p1.s2"]]
+
+
+class WindowLLM(object):
+    """为输入中的每个 Step 标签块返回一个步骤, 记录同时在途的请求数"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def __call__(self, messages):
+        return messages
+
+    async def ainvoke(self, messages):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        ids = re.findall(r"<text id=(p\d+\.s\d+)>", messages[-1].content)
+        results = [{"compound_id": "", "structure_id": "", "detail_ids": [i]} for i in ids]
+        return AIMessage(content=json.dumps({"results": results}))
+
+
+def test_agent_extracts_windows_in_parallel():
+    text = make_text(n_examples=6)
+    llm = WindowLLM()
+    agent = PatentSynthesisRouteAgent(
+        "fake", llm=llm, chunker=TaggedTextChunker(max_tokens=300), max_window_concurrency=4
+    )
+    record = ReactionStepDescriptionRecord(
+        id="r0", input=[{"role": "user", "content": text}], output={},
+        predict_output={}, llm_response="", model="", status="", name="", header_name="",
+    )
+    record = asyncio.run(agent.async_process(record))
+    assert record.status == "success"
+    expected = [f"p{i}.s{j}" for i in range(6) for j in range(3)]
+    assert [item["detail_ids"][0] for item in record.predict_output["results"]] == expected
+    assert 1 < llm.max_in_flight <= 4
+
+
+def test_agent_schedules_windows_as_requests():
+    text = make_text(n_examples=6)
+    llm = WindowLLM()
+    agent = PatentSynthesisRouteAgent(
+        "fake", llm=llm, chunker=TaggedTextChunker(max_tokens=300)
+    )
+    records = [
+        ReactionStepDescriptionRecord(
+            id=f"r{i}", input=[{"role": "user", "content": text}], output={},
+            predict_output={}, llm_response="", model="", status="", name="", header_name="",
+        )
+        for i in range(2)
+    ]
+    records = asyncio.run(agent.async_process_multiple(records, max_batch_size=2))
+    expected = [f"p{i}.s{j}" for i in range(6) for j in range(3)]
+    for record in records:
+        assert record.status == "success"
+        assert [item["detail_ids"][0] for item in record.predict_output["results"]] == expected
+        # 保留原始输入, 不保存各窗口渲染后的 prompt
+        assert record.input == [{"role": "user", "content": text}]
+    # 窗口占用调度器的并发窗口, 同时在途的请求数不超过 max_batch_size
+    assert llm.max_in_flight == 2
@@ -0,0 +1,91 @@
+"""
+测试紧凑输出模式下 detail 的还原
+"""
+
+import json
+import asyncio
+
+from langchain_core.messages import AIMessage
+
+from llm_playground.agents.synthesis_route_desc_agents import PatentSynthesisRouteAgent
+from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+from llm_playground.utils.chunking import split_tagged_blocks
+from llm_playground.utils.detail_rebuild import expand_compact_results, rebuild_detail
+
+INPUT_TEXT = """<text id=p1.i0>
+Example 1
+</text>
+<text id=p1.i1>
+Step 1: To a solution of A (1.0 g) in DCM
+(10 mL) was added B. The mixture was stirred for 2 h to give C.
+Step 2: To a solution of C in MeOH was added
+NaOH. The mixture was
+</text>
+<text id=p2.i0>
+stirred at rt for 1 h to give the title compound.
+</text>"""
+
+
+def test_rebuild_detail():
+    blocks = {block.block_id: block for block in split_tagged_blocks(INPUT_TEXT)}
+    assert rebuild_detail(blocks, ["p1.i0"]) == "Example 1"
+    # 定位词忽略原文中的换行
+    assert rebuild_detail(blocks, ["p1.i1"], "Step 1: To a solution", "stirred for 2 h to give C.") == (
+        "Step 1: To a solution of A (1.0 g) in DCM (10 mL) was added B. "
+        "The mixture was stirred for 2 h to give C."
+    )
+    assert rebuild_detail(blocks, ["p1.i1", "p2.i0"], "Step 2: To a solution of C", "the title compound.") == (
+        "Step 2: To a solution of C in MeOH was added NaOH. "
+        "The mixture was stirred at rt for 1 h to give the title compound."
+    )
+    # 结尾定位词取开头之后第一次出现的位置, 不会越过以相同文字结尾的下一个步骤
+    assert rebuild_detail(blocks, ["p1.i1"], "Step 1: To a solution", "To a solution of") == (
+        "Step 1: To a solution of"
+    )
+    assert rebuild_detail(blocks, ["p1.i1"], "Step 1:", "was added") == (
+        "Step 1: To a solution of A (1.0 g) in DCM (10 mL) was added"
+    )
+    # 找不到定位词时保留块的边界
+    assert rebuild_detail(blocks, ["p2.i0", "missing"], "not in text") == (
+        "stirred at rt for 1 h to give the title compound."
+    )
+
+
+def test_expand_compact_results():
+    results = [
+        {"compound_id": "", "detail_ids": ["p1.i0"], "detail_start": "Example", "detail_end": "1", "refs": None},
+        "not a dict",
+    ]
+    expanded = expand_compact_results(results, INPUT_TEXT)
+    assert list(expanded[0]) == ["compound_id", "detail_ids", "detail", "refs"]
+    assert expanded[0]["detail"] == "Example 1"
+    assert expanded[1] == "not a dict"
+
+
+class CompactLLM(object):
+    def __call__(self, messages):
+        return messages
+
+    async def ainvoke(self, messages):
+        self.system_prompt = messages[0].content
+        results = [{
+            "compound_id": "Example 1", "iupac_name": "", "structure_id": "",
+            "detail_ids": ["p1.i1", "p2.i0"],
+            "detail_start": "Step 2: To a solution", "detail_end": "title compound.", "refs": None,
+        }]
+        return AIMessage(content=json.dumps({"results": results}))
+
+
+def test_agent_compact_output():
+    llm = CompactLLM()
+    agent = PatentSynthesisRouteAgent("fake", llm=llm, compact_output=True)
+    record = ReactionStepDescriptionRecord(
+        id="r0", input=[{"role": "user", "content": INPUT_TEXT}], output={},
+        predict_output={}, llm_response="", model="", status="", name="", header_name="",
+    )
+    record = asyncio.run(agent.async_process(record))
+    assert "# Compact Output" in llm.system_prompt
+    item = record.predict_output["results"][0]
+    assert "detail_start" not in item
+    assert item["detail"].startswith("Step 2: To a solution of C")
+    assert item["detail"].endswith("to give the title compound.")
@@ -11,3 +11,82 @@ def test_write_base_model_items_to_json_array_file():
     # 这里可以添加具体的测试用例
     # 需要创建模拟的record对象
     pass
+
+
+def _make_record(record_id: str):
+    from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+
+    return ReactionStepDescriptionRecord(
+        id=record_id, input=[{"role": "user", "content": "中文"}], output={},
+        predict_output={"results": []}, llm_response="", model="", status="",
+        name="", header_name="",
+    )
+
+
+def test_jsonl_writer_and_convert(tmp_path):
+    """测试 JSONL 流式写入以及转换为 JSON 数组"""
+    import json
+    from llm_playground.utils.helpers import (
+        JsonlResultWriter,
+        convert_jsonl_to_json_array_file,
+    )
+
+    jsonl_filepath = tmp_path / "out.jsonl"
+    with JsonlResultWriter(str(jsonl_filepath), mode="w") as writer:
+        for i in range(3):
+            writer.write(_make_record(f"r{i}"))
+    # 模拟崩溃时写了一半的末行
+    with open(jsonl_filepath, "a", encoding="utf-8") as fp:
+        fp.write('{"id": "r3", "inp')
+
+    json_filepath = tmp_path / "out.json"
+    cnt = convert_jsonl_to_json_array_file(str(jsonl_filepath), str(json_filepath))
+    assert cnt == 3
+    items = json.loads(json_filepath.read_text(encoding="utf-8"))
+    assert [item["id"] for item in items] == ["r0", "r1", "r2"]
+    assert items[0]["input"][0]["content"] == "中文"
+
+
+def test_convert_jsonl_restores_input_order(tmp_path):
+    """按完成顺序写入的 JSONL 转换后恢复输入顺序, 顺序字段不写入 JSON 数组"""
+    import json
+    from llm_playground.utils.helpers import (
+        JsonlResultWriter,
+        convert_jsonl_to_json_array_file,
+    )
+
+    jsonl_filepath = tmp_path / "out.jsonl"
+    with JsonlResultWriter(str(jsonl_filepath), mode="w") as writer:
+        for i in [2, 0, 3, 1]:
+            writer.write(_make_record(f"r{i}"), i)
+        writer.write(_make_record("no_index"))
+
+    json_filepath = tmp_path / "out.json"
+    assert convert_jsonl_to_json_array_file(str(jsonl_filepath), str(json_filepath)) == 5
+    items = json.loads(json_filepath.read_text(encoding="utf-8"))
+    assert [item["id"] for item in items] == ["r0", "r1", "r2", "r3", "no_index"]
+    assert "_index" not in items[0]
+
+
+def test_get_json_text_from_truncated_response():
+    """测试截断输出的修复, 已完整输出的 results 被保留"""
+    import json
+    from llm_playground.utils.helpers import get_json_text_from_response
+
+    response = '```json\n{"results": [{"detail": "{a}"}, {"detail": "b"}, {"detail": "tru'
+    assert json.loads(get_json_text_from_response(response)) == {
+        "results": [{"detail": "{a}"}, {"detail": "b"}]
+    }
+    # 找不到合法的 JSON 时仍按首尾花括号截取
+    assert get_json_text_from_response("x {'a': 1} y") == "{'a': 1}"
+
+
+def test_extract_json_text_from_response():
+    """只从 '{' 开始查找 JSON 对象, 并返回是否经过截断修复"""
+    from llm_playground.utils.helpers import extract_json_text_from_response, get_json_text_from_response
+
+    response = 'Based on refs [1], here: {"results": [{"detail": "a"}]}'
+    assert get_json_text_from_response(response) == '{"results": [{"detail": "a"}]}'
+    assert extract_json_text_from_response(response) == ('{"results": [{"detail": "a"}]}', False)
+    assert extract_json_text_from_response('{"results": [{"i": 1}, {"i"') == ('{"results": [{"i": 1}]}', True)
+    assert extract_json_text_from_response('see [1]: [{"i": 1}]', start_chars="[") == ("[1]", False)
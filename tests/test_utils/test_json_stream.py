@@ -0,0 +1,92 @@
+"""
+测试流式输出的增量 JSON 解析
+"""
+
+import json
+import random
+
+from llm_playground.utils.json_stream import IncrementalJsonParser, find_json_value
+
+
+RESPONSE = (
+    "好的, 结果如下 {不是JSON}:\n```json\n"
+    + json.dumps(
+        {
+            "results": [
+                {"name": 'a "quoted" }', "results": [1, 2]},
+                {"name": "b", "detail": {"x": [1, {"y": 2}]}},
+                {"name": "c"},
+            ],
+            "extra": "]}",
+        },
+        ensure_ascii=False,
+    )
+    + "\n```\n以上是全部结果 {\"results\": [9]}"
+)
+
+
+def feed_chunks(parser, text, seed):
+    rng = random.Random(seed)
+    items, pos = [], 0
+    while pos < len(text):
+        size = rng.randint(1, 7)
+        items.extend(parser.feed(text[pos:pos + size]))
+        pos += size
+    return items
+
+
+def test_items_emitted_as_they_close():
+    parser = IncrementalJsonParser()
+    assert parser.feed('{"results": [{"name": "a"}, {"na') == [{"name": "a"}]
+    assert parser.feed('me": "b"}') == [{"name": "b"}]
+    assert not parser.done
+    assert parser.feed('], "n": 2} trailing') == []
+    assert parser.done
+    assert parser.get_json_text() == '{"results": [{"name": "a"}, {"name": "b"}], "n": 2}'
+    # done 之后的输出被忽略
+    assert parser.feed('{"results": [1]}') == []
+
+
+def test_random_chunking():
+    expected = json.loads(RESPONSE[RESPONSE.index("{\"results\""):RESPONSE.index("\n```\n以上")])
+    for seed in range(20):
+        parser = IncrementalJsonParser()
+        items = feed_chunks(parser, RESPONSE, seed)
+        assert items == expected["results"]
+        assert parser.done
+        assert json.loads(parser.get_json_text()) == expected
+
+
+def test_skip_reasoning():
+    parser = IncrementalJsonParser(skip_until="</think>")
+    text = '<think>先看 {"results": [{"i": 0}]}</think>{"results": [{"i": 1}, {"i": 2}]}'
+    assert feed_chunks(parser, text, 0) == [{"i": 1}, {"i": 2}]
+    assert parser.done
+
+
+def test_without_array_key():
+    parser = IncrementalJsonParser(array_key=None)
+    assert parser.feed('{"results": [1, 2], "name": "x"}') == []
+    assert parser.done
+
+
+def test_find_json_value():
+    # 字符串中的括号、前后的说明文字与非法的花括号片段都被跳过
+    text = '说明 {...} 如下: {"results": [{"detail": "a } [b"}]} 以上 {"x": 1}'
+    assert find_json_value(text) == ('{"results": [{"detail": "a } [b"}]}', False)
+    assert find_json_value('use { to start\n{"results": [1]}') == ('{"results": [1]}', False)
+    assert find_json_value('{"a": 1}', start_chars="[") == (None, False)
+    assert find_json_value("no json") == (None, False)
+    # 括号不匹配时不返回内层的值
+    assert find_json_value('{"results": [{"a": 1}, {"b": 2}}') == (None, False)
+    assert find_json_value('see {a] then {"results": []}') == ('{"results": []}', False)
+
+
+def test_find_json_value_repair_truncated():
+    # 丢弃未完成的最后一个元素, 保留完整的元素
+    text = '{"results": [{"i": 1}, {"i": 2}, {"i": 3, "detail": "trunc'
+    assert find_json_value(text) == ('{"results": [{"i": 1}, {"i": 2}]}', True)
+    assert find_json_value('{"results": [{"i": 1}, {"i": 2}') == ('{"results": [{"i": 1}, {"i": 2}]}', True)
+    assert find_json_value('{"results": [{"i": 1}], "count":') == ('{"results": [{"i": 1}]}', True)
+    assert find_json_value('{"results": [1, 2, 3') == ('{"results": [1, 2]}', True)
+    assert find_json_value('{"results": [{"i": 1}, {"i"', repair=False) == (None, False)
@@ -0,0 +1,53 @@
+"""
+测试专利片段的标签块索引
+"""
+
+from llm_playground.utils.tagged_document import (
+    get_tagged_document,
+    get_user_content,
+    parse_tagged_blocks,
+)
+
+TEXT = """<text id=p1.i0>
+Example 1
+</text>
+<mol id=p1.i1>
+page_1.mol_0
+</mol>
+loose text
+<table id=p1.i2>
+| a | b |
+</table>
+<text id=p1.i0>
+duplicated id
+</text>"""
+
+
+def test_parse_blocks_in_page_order():
+    blocks = parse_tagged_blocks(TEXT)
+    assert [(b.tag, b.block_id) for b in blocks] == [
+        ("text", "p1.i0"), ("mol", "p1.i1"), ("table", "p1.i2"), ("text", "p1.i0"),
+    ]
+    for block in blocks:
+        assert TEXT[block.start:block.end] == block.text
+    # 标签之间的游离文本并入前一个标签块
+    assert blocks[1].text.endswith("loose text\n")
+    assert blocks[0].is_section_start() and not blocks[3].is_section_start()
+
+
+def test_document_index():
+    document = get_tagged_document(TEXT)
+    assert len(document) == 4
+    assert document["p1.i1"].content.strip() == "page_1.mol_0"
+    # 重复的 id 以第一次出现的为准
+    assert document["p1.i0"].content.strip() == "Example 1"
+    assert document.position("p1.i2") == 2 and document.position("missing") is None
+    assert "p1.i2" in document and "missing" not in document and ["p1.i0"] not in document
+    assert document.get("missing") is None
+    assert document.ids("text") == ["p1.i0", "p1.i0"]
+
+
+def test_document_is_cached():
+    messages = [{"role": "system", "content": "<text id=x>\n</text>"}, {"role": "human", "content": TEXT}]
+    assert get_tagged_document(TEXT) is get_tagged_document(TEXT)
+    assert get_tagged_document(get_user_content(messages)) is get_tagged_document(TEXT)
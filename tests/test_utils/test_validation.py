@@ -0,0 +1,178 @@
+"""
+测试基于输入标签块的本地校验
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+
+from llm_playground.agents.synthesis_route_desc_agents import PatentSynthesisRouteAgent
+from llm_playground.core.baseagent import STATUS_SUCCESS, STATUS_TRUNCATED, STATUS_VALIDATION_ERROR
+from llm_playground.core.cache import ResponseCache
+from llm_playground.datamodel.synthesis_route import ReactionStepDescriptionRecord
+from llm_playground.utils.tagged_document import get_tagged_document, get_user_content
+from llm_playground.utils.validation import (
+    ISSUE_DETAIL_MISMATCH,
+    ISSUE_UNKNOWN_ID,
+    ISSUE_WRONG_BLOCK_TYPE,
+    get_detail_match_ratio,
+    validate_results,
+)
+
+INPUT_TEXT = """<text id=p1.i0>
+Example 1
+</text>
+<text id=p1.i1>
+To a solution of A (1.0 g) in DCM
+(10 mL) was added B. The mixture was stirred for 2 h to give the title compound.
+</text>
+<mol id=p1.i2>page_1.mol_0; page_1.mol_1</mol>"""
+
+
+def make_item(**kwargs):
+    item = {
+        "compound_id": "Example 1", "iupac_name": "", "structure_id": "page_1.mol_1",
+        "detail_ids": ["p1.i1"],
+        "detail": "To a solution of A (1.0 g) in DCM (10 mL) was added B.",
+        "refs": None,
+    }
+    item.update(kwargs)
+    return item
+
+
+def test_detail_match_ratio():
+    assert get_detail_match_ratio("was added\nB.", "A was added B. C") == 1.0
+    assert get_detail_match_ratio("", "anything") == 1.0
+    assert get_detail_match_ratio("abcd", "abxx") == 0.5
+
+
+def test_long_detail_match_ratio_is_fast():
+    rng = random.Random(0)
+    words = ["the", "mixture", "was", "stirred", "added", "solution", "of", "water", "(2.0 g)", "at", "rt"]
+    cited_text = " ".join(rng.choice(words) for _ in range(4000))
+    # 原文中间的一段, 改动少量词语, 并跳过一部分原文
+    detail = cited_text[3000:6000] + cited_text[7000:12000].replace("stirred", "shaken")
+    started = time.monotonic()
+    ratio = get_detail_match_ratio(detail, cited_text)
+    assert time.monotonic() - started < 1.0
+    assert 0.95 < ratio < 1.0
+    assert get_detail_match_ratio(cited_text[:100] + "x" * 9000, cited_text) < 0.5
+
+
+def test_validate_results():
+    document = get_tagged_document(INPUT_TEXT)
+    assert validate_results([make_item(), make_item(structure_id="p1.i2"), "not a dict"], document) == []
+
+    issues = validate_results([
+        make_item(detail_ids=["p1.i1", "p9.i9"]),
+        make_item(detail_ids=["p1.i2"]),
+        make_item(structure_id="page_2.mol_0"),
+        make_item(structure_id="p1.i0"),
+        make_item(detail="The mixture was heated at 100 °C overnight."),
+    ], document)
+    assert [(issue["index"], issue["field"], issue["kind"]) for issue in issues] == [
+        (0, "detail_ids", ISSUE_UNKNOWN_ID),
+        (1, "detail_ids", ISSUE_WRONG_BLOCK_TYPE),
+        (2, "structure_id", ISSUE_UNKNOWN_ID),
+        (3, "structure_id", ISSUE_WRONG_BLOCK_TYPE),
+        (4, "detail", ISSUE_DETAIL_MISMATCH),
+    ]
+    assert issues[0]["value"] == "p9.i9"
+
+
+
+def test_scheme_structures_are_valid():
+    document = get_tagged_document(INPUT_TEXT + """
+<scheme id=p1.i3>
+| id            | reactant      | condition   | product       |
+|:--------------|:--------------|:------------|:--------------|
+| page1.scheme0 | page_1.mol_5  |             | page_1.mol_6  |
+</scheme>""")
+    assert validate_results([make_item(structure_id="page_1.mol_6")], document) == []
+    issues = validate_results([make_item(structure_id="page1.scheme0")], document)
+    assert [issue["kind"] for issue in issues] == [ISSUE_UNKNOWN_ID]
+
+
+def test_ground_truth_has_no_issues():
+    """标准答案本身应该通过校验"""
+    path = os.path.join(
+        os.path.dirname(__file__), "..", "..", "data", "synthesis_route_desc", "qa_reaction_desc_inout_total41.json"
+    )
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    for item in items:
+        document = get_tagged_document(get_user_content(item["input"]))
+        assert validate_results(item["output"].get("results", []), document) == [], item["id"]
+
+
+class FixedLLM(object):
+    def __init__(self, results):
+        self.results = results
+
+    def __call__(self, messages):
+        return messages
+
+    async def ainvoke(self, messages):
+        return AIMessage(content=json.dumps({"results": self.results}))
+
+
+def run_agent(results):
+    agent = PatentSynthesisRouteAgent("fake", llm=FixedLLM(results), validate_output=True)
+    record = ReactionStepDescriptionRecord(
+        id="r0", input=[{"role": "user", "content": INPUT_TEXT}], output={},
+        predict_output={}, llm_response="", model="", status="", name="", header_name="",
+    )
+    return asyncio.run(agent.async_process(record))
+
+
+def test_agent_validate_output():
+    record = run_agent([make_item()])
+    assert record.status == STATUS_SUCCESS
+    assert record.validation_issues is None
+
+    # 校验失败时保留解析结果, 只标记状态, 以便按状态重新请求
+    record = run_agent([make_item(detail_ids=["p9.i9"])])
+    assert record.status == STATUS_VALIDATION_ERROR
+    assert record.predict_output["results"][0]["detail_ids"] == ["p9.i9"]
+    assert record.validation_issues[0]["kind"] == ISSUE_UNKNOWN_ID
+
+
+def test_agent_marks_truncated_output():
+    class TruncatedLLM(FixedLLM):
+        async def ainvoke(self, messages):
+            content = json.dumps({"results": self.results})
+            return AIMessage(content=content[:content.rindex("{") + 5])
+
+    agent = PatentSynthesisRouteAgent("fake", llm=TruncatedLLM([make_item(), make_item()]))
+    record = ReactionStepDescriptionRecord(
+        id="r0", input=[{"role": "user", "content": INPUT_TEXT}], output={},
+        predict_output={}, llm_response="", model="", status="", name="", header_name="",
+    )
+    record = asyncio.run(agent.async_process(record))
+    # 截断时保留已经完整输出的 results, 状态不是 success
+    assert record.status == STATUS_TRUNCATED
+    assert len(record.predict_output["results"]) == 1
+
+
+def test_validation_error_response_not_cached(tmp_path):
+    """校验失败的响应从缓存中删除, 按状态重新请求时得到新的响应"""
+    cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite"))
+    responses = [json.dumps({"results": results}) for results in ([make_item(detail_ids=["p9.i9"])], [make_item()])]
+    agent = PatentSynthesisRouteAgent(
+        "fake", llm=FakeListChatModel(responses=responses), cache=cache, validate_output=True
+    )
+    records = [
+        ReactionStepDescriptionRecord(
+            id="r0", input=[{"role": "user", "content": INPUT_TEXT}], output={},
+            predict_output={}, llm_response="", model="", status="", name="", header_name="",
+        )
+    ]
+    assert asyncio.run(agent.async_process_multiple(records))[0].status == STATUS_VALIDATION_ERROR
+    assert cache.stats()["entries"] == 0
+    assert asyncio.run(agent.async_process_multiple(records))[0].status == STATUS_SUCCESS
+    assert cache.stats()["entries"] == 1